@@ -1,4 +1,4 @@
-import os, sqlite3, datetime, logging
+import os, re, sqlite3, datetime, logging, threading, unicodedata
 DB_PATH = os.environ.get("DB_PATH", "/data/domovra.sqlite3")
 
 logger = logging.getLogger("domovra.db")
@@ -19,179 +19,531 @@ def _table_exists(c: sqlite3.Connection, table: str) -> bool:
     return row is not None
 
 def init_db():
-    with _conn() as c:
-        # ----- WAL mode + busy timeout (robustesse multi-accès)
-        c.execute("PRAGMA journal_mode=WAL")
-        c.execute("PRAGMA busy_timeout=10000")
-
-        # ----- Tables de base
-        c.execute("""CREATE TABLE IF NOT EXISTS locations(
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT UNIQUE NOT NULL
-        )""")
-        c.execute("""CREATE TABLE IF NOT EXISTS products(
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT UNIQUE NOT NULL,
-            unit TEXT DEFAULT 'pièce',
-            default_shelf_life_days INTEGER DEFAULT 90
-            -- colonnes ajoutées plus bas si manquantes (migrations)
-        )""")
-        c.execute("""CREATE TABLE IF NOT EXISTS stock_lots(
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            product_id INTEGER NOT NULL,
-            location_id INTEGER NOT NULL,
-            qty REAL NOT NULL,
-            frozen_on TEXT,
-            best_before TEXT,
-            -- colonne created_on ajoutée plus bas si manquante (migration)
-            FOREIGN KEY(product_id) REFERENCES products(id),
-            FOREIGN KEY(location_id) REFERENCES locations(id)
-        )""")
-        c.execute("""CREATE TABLE IF NOT EXISTS movements(
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            lot_id INTEGER NOT NULL,
-            type TEXT CHECK(type IN ('IN','OUT')) NOT NULL,
-            qty REAL NOT NULL,
-            ts TEXT NOT NULL,
-            note TEXT,
-            FOREIGN KEY(lot_id) REFERENCES stock_lots(id)
-        )""")
+    """Crée / met à jour le schéma complet (migrations versionnées, voir schema.py)."""
+    from schema import migrate
+    migrate()
+
+
+# ---------- Migrations (appelées par schema.migrate, dans une transaction)
 
-        # ----- Migration : products.barcode (+ index unique null-safe)
-        if not _column_exists(c, "products", "barcode"):
-            c.execute("ALTER TABLE products ADD COLUMN barcode TEXT")
+def _migrate_base(c: sqlite3.Connection) -> None:
+    """
+    Migration 1 : tables de base + rattrapage des bases créées avant
+    PRAGMA user_version (colonnes ajoutées au fil des versions, sondées
+    une à une). Ne s'exécute qu'une fois par base.
+    """
+    # ----- Tables de base
+    c.execute("""CREATE TABLE IF NOT EXISTS locations(
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT UNIQUE NOT NULL
+    )""")
+    c.execute("""CREATE TABLE IF NOT EXISTS products(
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT UNIQUE NOT NULL,
+        unit TEXT DEFAULT 'pièce',
+        default_shelf_life_days INTEGER DEFAULT 90
+        -- colonnes ajoutées plus bas si manquantes (migrations)
+    )""")
+    c.execute("""CREATE TABLE IF NOT EXISTS stock_lots(
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        product_id INTEGER NOT NULL,
+        location_id INTEGER NOT NULL,
+        qty REAL NOT NULL,
+        frozen_on TEXT,
+        best_before TEXT,
+        -- colonne created_on ajoutée plus bas si manquante (migration)
+        FOREIGN KEY(product_id) REFERENCES products(id),
+        FOREIGN KEY(location_id) REFERENCES locations(id)
+    )""")
+    c.execute("""CREATE TABLE IF NOT EXISTS movements(
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        lot_id INTEGER NOT NULL,
+        type TEXT CHECK(type IN ('IN','OUT')) NOT NULL,
+        qty REAL NOT NULL,
+        ts TEXT NOT NULL,
+        note TEXT,
+        FOREIGN KEY(lot_id) REFERENCES stock_lots(id)
+    )""")
+
+    # ----- Migration : products.barcode (+ index unique null-safe)
+    if not _column_exists(c, "products", "barcode"):
+        c.execute("ALTER TABLE products ADD COLUMN barcode TEXT")
+    c.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_products_barcode_unique
+        ON products(barcode) WHERE barcode IS NOT NULL
+    """)
+
+    # ----- Migration : stock_lots.created_on (+ backfill)
+    if not _column_exists(c, "stock_lots", "created_on"):
+        c.execute("ALTER TABLE stock_lots ADD COLUMN created_on TEXT")
         c.execute("""
-            CREATE UNIQUE INDEX IF NOT EXISTS idx_products_barcode_unique
-            ON products(barcode) WHERE barcode IS NOT NULL
+          UPDATE stock_lots
+          SET created_on = (
+            SELECT MIN(m.ts)
+            FROM movements m
+            WHERE m.lot_id = stock_lots.id AND m.type='IN'
+          )
+          WHERE created_on IS NULL
         """)
 
-        # ----- Migration : stock_lots.created_on (+ backfill)
-        if not _column_exists(c, "stock_lots", "created_on"):
-            c.execute("ALTER TABLE stock_lots ADD COLUMN created_on TEXT")
+    # ----- Lots : colonnes issues des achats (si absentes)
+    if not _column_exists(c, "stock_lots", "article_name"):
+        c.execute("ALTER TABLE stock_lots ADD COLUMN article_name TEXT")
+    if not _column_exists(c, "stock_lots", "brand"):
+        c.execute("ALTER TABLE stock_lots ADD COLUMN brand TEXT")
+    if not _column_exists(c, "stock_lots", "ean"):
+        c.execute("ALTER TABLE stock_lots ADD COLUMN ean TEXT")
+    if not _column_exists(c, "stock_lots", "price_total"):
+        c.execute("ALTER TABLE stock_lots ADD COLUMN price_total REAL")
+    if not _column_exists(c, "stock_lots", "store"):
+        c.execute("ALTER TABLE stock_lots ADD COLUMN store TEXT")
+    if not _column_exists(c, "stock_lots", "qty_per_unit"):
+        c.execute("ALTER TABLE stock_lots ADD COLUMN qty_per_unit REAL")
+    if not _column_exists(c, "stock_lots", "multiplier"):
+        c.execute("ALTER TABLE stock_lots ADD COLUMN multiplier INTEGER")
+    if not _column_exists(c, "stock_lots", "unit_at_purchase"):
+        c.execute("ALTER TABLE stock_lots ADD COLUMN unit_at_purchase TEXT")
+    # ✅ Nouveaux champs nécessaires à achats.py
+    if not _column_exists(c, "stock_lots", "name"):
+        c.execute("ALTER TABLE stock_lots ADD COLUMN name TEXT")
+    if not _column_exists(c, "stock_lots", "note"):
+        c.execute("ALTER TABLE stock_lots ADD COLUMN note TEXT")
+
+    # ----- Locations : champs supplémentaires
+    if not _column_exists(c, "locations", "is_freezer"):
+        c.execute("ALTER TABLE locations ADD COLUMN is_freezer INTEGER NOT NULL DEFAULT 0")
+    if not _column_exists(c, "locations", "description"):
+        c.execute("ALTER TABLE locations ADD COLUMN description TEXT")
+
+    # ----- Products : nouvelles colonnes (idempotent)
+    if not _column_exists(c, "products", "min_qty"):
+        c.execute("ALTER TABLE products ADD COLUMN min_qty REAL")
+    if not _column_exists(c, "products", "description"):
+        c.execute("ALTER TABLE products ADD COLUMN description TEXT")
+    if not _column_exists(c, "products", "default_location_id"):
+        c.execute("ALTER TABLE products ADD COLUMN default_location_id INTEGER")
+    if not _column_exists(c, "products", "low_stock_enabled"):
+        c.execute("ALTER TABLE products ADD COLUMN low_stock_enabled INTEGER NOT NULL DEFAULT 1")
+    if not _column_exists(c, "products", "expiry_kind"):
+        c.execute("ALTER TABLE products ADD COLUMN expiry_kind TEXT DEFAULT 'DLC'")
+    if not _column_exists(c, "products", "default_freeze_shelf_days"):
+        c.execute("ALTER TABLE products ADD COLUMN default_freeze_shelf_days INTEGER")
+    if not _column_exists(c, "products", "no_freeze"):
+        c.execute("ALTER TABLE products ADD COLUMN no_freeze INTEGER NOT NULL DEFAULT 0")
+    if not _column_exists(c, "products", "category"):
+        c.execute("ALTER TABLE products ADD COLUMN category TEXT")
+    if not _column_exists(c, "products", "parent_id"):
+        c.execute("ALTER TABLE products ADD COLUMN parent_id INTEGER")
+    if not _column_exists(c, "products", "no_expiry"):
+        c.execute("ALTER TABLE products ADD COLUMN no_expiry INTEGER NOT NULL DEFAULT 0")
+
+    # ----- Historique complet (soft delete + conversions + raisons)
+    if not _column_exists(c, "stock_lots", "status"):
+        c.execute("ALTER TABLE stock_lots ADD COLUMN status TEXT NOT NULL DEFAULT 'open'")
+    if not _column_exists(c, "stock_lots", "ended_on"):
+        c.execute("ALTER TABLE stock_lots ADD COLUMN ended_on TEXT")
+    if not _column_exists(c, "stock_lots", "initial_qty"):
+        c.execute("ALTER TABLE stock_lots ADD COLUMN initial_qty REAL")
+
+    if not _column_exists(c, "products", "unit_pivot"):
+        c.execute("ALTER TABLE products ADD COLUMN unit_pivot TEXT")
+
+    if not _column_exists(c, "movements", "unit_input"):
+        c.execute("ALTER TABLE movements ADD COLUMN unit_input TEXT")
+    if not _column_exists(c, "movements", "factor_to_pivot"):
+        c.execute("ALTER TABLE movements ADD COLUMN factor_to_pivot REAL DEFAULT 1")
+    if not _column_exists(c, "movements", "reason_code"):
+        c.execute("ALTER TABLE movements ADD COLUMN reason_code TEXT")
+    if not _column_exists(c, "movements", "price_allocated"):
+        c.execute("ALTER TABLE movements ADD COLUMN price_allocated REAL")
+    if not _column_exists(c, "movements", "location_from_id"):
+        c.execute("ALTER TABLE movements ADD COLUMN location_from_id INTEGER")
+    if not _column_exists(c, "movements", "location_to_id"):
+        c.execute("ALTER TABLE movements ADD COLUMN location_to_id INTEGER")
+
+    # ----- #10 : Table multi-EAN par produit
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS product_barcodes(
+            id         INTEGER PRIMARY KEY AUTOINCREMENT,
+            product_id INTEGER NOT NULL,
+            barcode    TEXT    NOT NULL,
+            label      TEXT    DEFAULT '',
+            FOREIGN KEY(product_id) REFERENCES products(id),
+            UNIQUE(barcode)
+        )
+    """)
+    c.execute("""
+        CREATE INDEX IF NOT EXISTS idx_product_barcodes_pid
+        ON product_barcodes(product_id)
+    """)
+
+    # Migration : copie les barcodes existants de products.barcode → product_barcodes
+    if _table_exists(c, "product_barcodes"):
+        try:
             c.execute("""
-              UPDATE stock_lots
-              SET created_on = (
-                SELECT MIN(m.ts)
-                FROM movements m
-                WHERE m.lot_id = stock_lots.id AND m.type='IN'
-              )
-              WHERE created_on IS NULL
+                INSERT OR IGNORE INTO product_barcodes(product_id, barcode, label)
+                SELECT id, barcode, ''
+                FROM products
+                WHERE barcode IS NOT NULL AND barcode != ''
             """)
+        except Exception:
+            pass
+
+    # (backfills initial_qty / unit_pivot : voir _migrate_insert_defaults)
+
 
-        # ----- Lots : colonnes issues des achats (si absentes)
-        if not _column_exists(c, "stock_lots", "article_name"):
-            c.execute("ALTER TABLE stock_lots ADD COLUMN article_name TEXT")
-        if not _column_exists(c, "stock_lots", "brand"):
-            c.execute("ALTER TABLE stock_lots ADD COLUMN brand TEXT")
-        if not _column_exists(c, "stock_lots", "ean"):
-            c.execute("ALTER TABLE stock_lots ADD COLUMN ean TEXT")
-        if not _column_exists(c, "stock_lots", "price_total"):
-            c.execute("ALTER TABLE stock_lots ADD COLUMN price_total REAL")
-        if not _column_exists(c, "stock_lots", "store"):
-            c.execute("ALTER TABLE stock_lots ADD COLUMN store TEXT")
-        if not _column_exists(c, "stock_lots", "qty_per_unit"):
-            c.execute("ALTER TABLE stock_lots ADD COLUMN qty_per_unit REAL")
-        if not _column_exists(c, "stock_lots", "multiplier"):
-            c.execute("ALTER TABLE stock_lots ADD COLUMN multiplier INTEGER")
-        if not _column_exists(c, "stock_lots", "unit_at_purchase"):
-            c.execute("ALTER TABLE stock_lots ADD COLUMN unit_at_purchase TEXT")
-        # ✅ Nouveaux champs nécessaires à achats.py
-        if not _column_exists(c, "stock_lots", "name"):
-            c.execute("ALTER TABLE stock_lots ADD COLUMN name TEXT")
-        if not _column_exists(c, "stock_lots", "note"):
-            c.execute("ALTER TABLE stock_lots ADD COLUMN note TEXT")
-
-        # ----- Locations : champs supplémentaires
-        if not _column_exists(c, "locations", "is_freezer"):
-            c.execute("ALTER TABLE locations ADD COLUMN is_freezer INTEGER NOT NULL DEFAULT 0")
-        if not _column_exists(c, "locations", "description"):
-            c.execute("ALTER TABLE locations ADD COLUMN description TEXT")
-
-        # ----- Products : nouvelles colonnes (idempotent)
-        if not _column_exists(c, "products", "min_qty"):
-            c.execute("ALTER TABLE products ADD COLUMN min_qty REAL")
-        if not _column_exists(c, "products", "description"):
-            c.execute("ALTER TABLE products ADD COLUMN description TEXT")
-        if not _column_exists(c, "products", "default_location_id"):
-            c.execute("ALTER TABLE products ADD COLUMN default_location_id INTEGER")
-        if not _column_exists(c, "products", "low_stock_enabled"):
-            c.execute("ALTER TABLE products ADD COLUMN low_stock_enabled INTEGER NOT NULL DEFAULT 1")
-        if not _column_exists(c, "products", "expiry_kind"):
-            c.execute("ALTER TABLE products ADD COLUMN expiry_kind TEXT DEFAULT 'DLC'")
-        if not _column_exists(c, "products", "default_freeze_shelf_days"):
-            c.execute("ALTER TABLE products ADD COLUMN default_freeze_shelf_days INTEGER")
-        if not _column_exists(c, "products", "no_freeze"):
-            c.execute("ALTER TABLE products ADD COLUMN no_freeze INTEGER NOT NULL DEFAULT 0")
-        if not _column_exists(c, "products", "category"):
-            c.execute("ALTER TABLE products ADD COLUMN category TEXT")
-        if not _column_exists(c, "products", "parent_id"):
-            c.execute("ALTER TABLE products ADD COLUMN parent_id INTEGER")
-        if not _column_exists(c, "products", "no_expiry"):
-            c.execute("ALTER TABLE products ADD COLUMN no_expiry INTEGER NOT NULL DEFAULT 0")
-
-        # ----- Historique complet (soft delete + conversions + raisons)
-        if not _column_exists(c, "stock_lots", "status"):
-            c.execute("ALTER TABLE stock_lots ADD COLUMN status TEXT NOT NULL DEFAULT 'open'")
-        if not _column_exists(c, "stock_lots", "ended_on"):
-            c.execute("ALTER TABLE stock_lots ADD COLUMN ended_on TEXT")
-        if not _column_exists(c, "stock_lots", "initial_qty"):
-            c.execute("ALTER TABLE stock_lots ADD COLUMN initial_qty REAL")
-
-        if not _column_exists(c, "products", "unit_pivot"):
-            c.execute("ALTER TABLE products ADD COLUMN unit_pivot TEXT")
-
-        if not _column_exists(c, "movements", "unit_input"):
-            c.execute("ALTER TABLE movements ADD COLUMN unit_input TEXT")
-        if not _column_exists(c, "movements", "factor_to_pivot"):
-            c.execute("ALTER TABLE movements ADD COLUMN factor_to_pivot REAL DEFAULT 1")
-        if not _column_exists(c, "movements", "reason_code"):
-            c.execute("ALTER TABLE movements ADD COLUMN reason_code TEXT")
-        if not _column_exists(c, "movements", "price_allocated"):
-            c.execute("ALTER TABLE movements ADD COLUMN price_allocated REAL")
-        if not _column_exists(c, "movements", "location_from_id"):
-            c.execute("ALTER TABLE movements ADD COLUMN location_from_id INTEGER")
-        if not _column_exists(c, "movements", "location_to_id"):
-            c.execute("ALTER TABLE movements ADD COLUMN location_to_id INTEGER")
-
-        # ----- #10 : Table multi-EAN par produit
+def _migrate_shopping(c: sqlite3.Connection) -> None:
+    """Listes de courses (anciennement créées à l'import de routes/shopping)."""
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS shopping_lists(
+          id INTEGER PRIMARY KEY,
+          name TEXT NOT NULL,
+          emoji TEXT NULL,
+          color TEXT NULL,
+          created_at TEXT NOT NULL
+        )""")
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS shopping_items(
+          id INTEGER PRIMARY KEY,
+          list_id INTEGER NOT NULL REFERENCES shopping_lists(id) ON DELETE CASCADE,
+          product_id INTEGER NOT NULL REFERENCES products(id),
+          qty REAL DEFAULT 1,
+          unit TEXT NULL,
+          note TEXT NULL,
+          is_checked INTEGER DEFAULT 0,
+          purchased_at TEXT NULL,
+          store TEXT NULL,
+          shelf_unit_price REAL NULL,
+          ticket_unit_price REAL NULL,
+          price_delta REAL NULL,
+          position INTEGER NOT NULL,
+          created_at TEXT NOT NULL
+        )""")
+    # Migrations F18
+    for col, ddl in (
+        ("qty_bought", "ALTER TABLE shopping_items ADD COLUMN qty_bought REAL NULL"),
+        ("best_before", "ALTER TABLE shopping_items ADD COLUMN best_before TEXT NULL"),
+        ("location_id", "ALTER TABLE shopping_items ADD COLUMN location_id INTEGER NULL"),
+        ("committed", "ALTER TABLE shopping_items ADD COLUMN committed INTEGER NOT NULL DEFAULT 0"),
+    ):
+        if not _column_exists(c, "shopping_items", col):
+            c.execute(ddl)
+    c.execute("CREATE INDEX IF NOT EXISTS idx_items_list ON shopping_items(list_id, position)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_items_checked ON shopping_items(list_id, is_checked)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_items_product ON shopping_items(product_id)")
+
+
+def _migrate_insert_defaults(c: sqlite3.Connection) -> None:
+    """
+    stock_lots.initial_qty et products.unit_pivot renseignés
+    à l'insertion par trigger (remplace les UPDATE de rattrapage lancés à
+    chaque démarrage).
+    """
+    c.execute("UPDATE stock_lots SET initial_qty = qty WHERE initial_qty IS NULL")
+    c.execute("UPDATE products SET unit_pivot = unit WHERE unit_pivot IS NULL")
+    c.execute("""
+        CREATE TRIGGER IF NOT EXISTS stock_lots_initial_qty_ai
+        AFTER INSERT ON stock_lots WHEN new.initial_qty IS NULL
+        BEGIN UPDATE stock_lots SET initial_qty = new.qty WHERE id = new.id; END
+    """)
+    c.execute("""
+        CREATE TRIGGER IF NOT EXISTS products_unit_pivot_ai
+        AFTER INSERT ON products WHEN new.unit_pivot IS NULL
+        BEGIN UPDATE products SET unit_pivot = new.unit WHERE id = new.id; END
+    """)
+
+
+def _track_writes(c: sqlite3.Connection, table: str) -> None:
+    """Triggers INSERT/UPDATE/DELETE incrémentant db_generation[table]."""
+    c.execute("INSERT OR IGNORE INTO db_generation(name, gen) VALUES (?, 0)", (table,))
+    for op in ("INSERT", "UPDATE", "DELETE"):
+        c.execute(
+            f"CREATE TRIGGER IF NOT EXISTS gen_{table}_{op.lower()} AFTER {op} ON {table} "
+            f"BEGIN UPDATE db_generation SET gen = gen + 1 WHERE name = '{table}'; END"
+        )
+
+
+def _migrate_write_generation(c: sqlite3.Connection) -> None:
+    """
+    Compteur d'écritures par table (db_generation), tenu par triggers :
+    toutes les écritures sont vues, y compris le SQL direct des routes.
+    Les nouvelles tables doivent appeler _track_writes dans leur migration.
+    """
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS db_generation(
+            name TEXT PRIMARY KEY,
+            gen  INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    rows = c.execute("SELECT name, sql FROM sqlite_master WHERE type='table'").fetchall()
+    virtual = [r["name"] for r in rows if (r["sql"] or "").upper().startswith("CREATE VIRTUAL")]
+    for r in rows:
+        name = r["name"]
+        if (name.startswith("sqlite_") or name == "db_generation" or name in virtual
+                or any(name.startswith(v + "_") for v in virtual)):   # tables internes FTS
+            continue
+        _track_writes(c, name)
+
+
+def _migrate_lots_indexes(c: sqlite3.Connection) -> None:
+    """Index des filtres de la page Stocks (lots ouverts triés / filtrés par DLC)."""
+    c.execute("CREATE INDEX IF NOT EXISTS idx_stock_lots_status_bb ON stock_lots(status, best_before)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_stock_lots_location ON stock_lots(location_id)")
+
+
+def _migrate_product_generation(c: sqlite3.Connection) -> None:
+    """
+    Compteur d'écritures par produit (product_generation), tenu par triggers :
+    lots, mouvements (via leur lot) et fiche produit. Sert à invalider les
+    blocs mis en cache produit par produit (historique de prix, insights).
+    Table interne : non suivie par db_generation.
+    """
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS product_generation(
+            product_id INTEGER PRIMARY KEY,
+            gen        INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    def bump(source: str) -> str:
+        return (f"INSERT INTO product_generation(product_id, gen) {source} "
+                "ON CONFLICT(product_id) DO UPDATE SET gen = gen + 1;")
+
+    def value(ref: str) -> str:
+        return bump(f"VALUES ({ref}, 1)")
+
+    def via_lot(ref: str) -> str:
+        return bump(f"SELECT product_id, 1 FROM stock_lots WHERE id = {ref}")
+
+    triggers = {
+        "stock_lots_insert": ("AFTER INSERT ON stock_lots", value("NEW.product_id")),
+        "stock_lots_update": ("AFTER UPDATE ON stock_lots",
+                              value("OLD.product_id") + " " + value("NEW.product_id")),
+        "stock_lots_delete": ("AFTER DELETE ON stock_lots", value("OLD.product_id")),
+        "movements_insert": ("AFTER INSERT ON movements", via_lot("NEW.lot_id")),
+        "movements_update": ("AFTER UPDATE ON movements", via_lot("NEW.lot_id")),
+        "movements_delete": ("AFTER DELETE ON movements", via_lot("OLD.lot_id")),
+        "products_update": ("AFTER UPDATE ON products", value("OLD.id")),
+        "products_delete": ("AFTER DELETE ON products", value("OLD.id")),
+    }
+    for name, (event, body) in triggers.items():
+        c.execute(f"CREATE TRIGGER IF NOT EXISTS pgen_{name} {event} BEGIN {body} END")
+
+
+def _migrate_products_fts_lot_delete(c: sqlite3.Connection) -> None:
+    """
+    Trigger products_fts_lot_ad (suppression d'un lot → marques du produit
+    recalculées), puis reconstruction de l'index : les marques des lots
+    déjà supprimés en disparaissent. Sans FTS5 (pas de products_fts) : rien.
+    """
+    if not _table_exists(c, "products_fts"):
+        return
+    name, body = _FTS_LOT_DELETE_TRIGGER
+    c.execute(f"CREATE TRIGGER IF NOT EXISTS {name} {body}")
+    c.execute("DELETE FROM products_fts")
+    c.execute(_FTS_INSERT_SQL)
+
+
+def _migrate_product_barcodes_backfill(c: sqlite3.Connection) -> None:
+    """
+    Rattrapage : les EAN écrits seulement dans products.barcode (import CSV
+    d'avant le correctif) rejoignent product_barcodes, comme en migration 1.
+    """
+    c.execute("""
+        INSERT OR IGNORE INTO product_barcodes(product_id, barcode, label)
+        SELECT id, barcode, ''
+        FROM products
+        WHERE barcode IS NOT NULL AND barcode != ''
+    """)
+
+
+# ---------- Génération d'écriture
+#
+# write_generation() change dès qu'une des tables demandées est modifiée
+# (par n'importe quelle connexion / processus) : clé d'invalidation des
+# caches mémoire (comptages admin, tableau de bord, fragments).
+
+def write_generations(c: sqlite3.Connection | None = None) -> dict:
+    """{table: compteur} pour les tables suivies ({} si la migration n'est pas passée)."""
+    if c is None:
+        with _conn() as c2:
+            return write_generations(c2)
+    try:
+        return {r["name"]: r["gen"] for r in c.execute("SELECT name, gen FROM db_generation")}
+    except sqlite3.OperationalError:
+        return {}
+
+
+def write_generation(*tables: str) -> int:
+    """Somme des compteurs d'écriture des tables données (toutes si aucune)."""
+    gens = write_generations()
+    if not tables:
+        return sum(gens.values())
+    return sum(gens.get(t, 0) for t in tables)
+
+
+def data_version(*tables: str) -> str | None:
+    """
+    Jeton de version des données pour les caches de rendu : change dès
+    qu'une des tables est modifiée. None si le suivi n'est pas en place.
+    """
+    gens = write_generations()
+    if any(t not in gens for t in tables):
+        return None
+    return f"{DB_PATH}:" + ".".join(str(gens[t]) for t in tables)
+
+
+def product_generations(c: sqlite3.Connection | None = None) -> dict:
+    """{product_id: compteur} des produits modifiés (absent = jamais modifié)."""
+    if c is None:
+        with _conn() as c2:
+            return product_generations(c2)
+    try:
+        return {r["product_id"]: r["gen"] for r in c.execute("SELECT product_id, gen FROM product_generation")}
+    except sqlite3.OperationalError:
+        return {}
+
+
+# ---------- Recherche produits (FTS5)
+#
+# products_fts : une ligne par produit (rowid = products.id) avec nom,
+# catégorie, description, marques (stock_lots.brand) et tous les EAN
+# (product_barcodes + products.barcode). Tokenizer unicode61 sans
+# diacritiques : « creme » trouve « Crème brûlée ». Tenue à jour par
+# triggers SQL, donc aussi pour les écritures hors db.py (shopping, achats…).
+
+_FTS_WEIGHTS = (10.0, 2.0, 1.0, 3.0, 5.0)  # name, category, description, brand, barcodes
+
+_FTS_ROW_SQL = """
+    SELECT p.id, p.name, COALESCE(p.category, ''), COALESCE(p.description, ''),
+           COALESCE((SELECT group_concat(DISTINCT l.brand) FROM stock_lots l
+                     WHERE l.product_id = p.id AND COALESCE(l.brand, '') != ''), ''),
+           TRIM(COALESCE(p.barcode, '') || ' ' ||
+                COALESCE((SELECT group_concat(b.barcode, ' ') FROM product_barcodes b
+                          WHERE b.product_id = p.id), ''))
+    FROM products p
+"""
+
+_FTS_INSERT_SQL = (
+    "INSERT INTO products_fts(rowid, name, category, description, brand, barcodes)"
+    + _FTS_ROW_SQL
+)
+
+
+def _fts_refresh_body(pid_expr: str) -> str:
+    return (
+        f"DELETE FROM products_fts WHERE rowid = {pid_expr};\n"
+        f"{_FTS_INSERT_SQL} WHERE p.id = {pid_expr};"
+    )
+
+
+_FTS_TRIGGERS = {
+    "products_fts_ai": f"AFTER INSERT ON products BEGIN {_fts_refresh_body('new.id')} END",
+    "products_fts_au": (
+        "AFTER UPDATE OF name, category, description, barcode ON products "
+        f"BEGIN DELETE FROM products_fts WHERE rowid = old.id; {_fts_refresh_body('new.id')} END"
+    ),
+    "products_fts_ad": "AFTER DELETE ON products BEGIN DELETE FROM products_fts WHERE rowid = old.id; END",
+    "products_fts_bc_ai": f"AFTER INSERT ON product_barcodes BEGIN {_fts_refresh_body('new.product_id')} END",
+    "products_fts_bc_au": (
+        "AFTER UPDATE ON product_barcodes "
+        f"BEGIN {_fts_refresh_body('old.product_id')} {_fts_refresh_body('new.product_id')} END"
+    ),
+    "products_fts_bc_ad": f"AFTER DELETE ON product_barcodes BEGIN {_fts_refresh_body('old.product_id')} END",
+    "products_fts_lot_ai": (
+        "AFTER INSERT ON stock_lots WHEN COALESCE(new.brand, '') != '' "
+        f"BEGIN {_fts_refresh_body('new.product_id')} END"
+    ),
+    "products_fts_lot_au": (
+        "AFTER UPDATE OF brand, product_id ON stock_lots "
+        f"BEGIN {_fts_refresh_body('old.product_id')} {_fts_refresh_body('new.product_id')} END"
+    ),
+}
+
+# Ajouté par la migration 10 (products_fts_lot_delete) : un lot supprimé
+# ne doit plus faire remonter sa marque.
+_FTS_LOT_DELETE_TRIGGER = (
+    "products_fts_lot_ad",
+    "AFTER DELETE ON stock_lots WHEN COALESCE(old.brand, '') != '' "
+    f"BEGIN {_fts_refresh_body('old.product_id')} END",
+)
+
+_fts_available: bool | None = None
+
+
+def _ensure_products_fts(c: sqlite3.Connection) -> bool:
+    """Crée products_fts + triggers si besoin ; reconstruit l'index à la création."""
+    global _fts_available
+    try:
+        created = not _table_exists(c, "products_fts")
         c.execute("""
-            CREATE TABLE IF NOT EXISTS product_barcodes(
-                id         INTEGER PRIMARY KEY AUTOINCREMENT,
-                product_id INTEGER NOT NULL,
-                barcode    TEXT    NOT NULL,
-                label      TEXT    DEFAULT '',
-                FOREIGN KEY(product_id) REFERENCES products(id),
-                UNIQUE(barcode)
+            CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5(
+                name, category, description, brand, barcodes,
+                tokenize = "unicode61 remove_diacritics 2"
             )
         """)
-        c.execute("""
-            CREATE INDEX IF NOT EXISTS idx_product_barcodes_pid
-            ON product_barcodes(product_id)
-        """)
+        for name, body in _FTS_TRIGGERS.items():
+            c.execute(f"CREATE TRIGGER IF NOT EXISTS {name} {body}")
+        if created:
+            c.execute("DELETE FROM products_fts")
+            c.execute(_FTS_INSERT_SQL)
+        _fts_available = True
+    except sqlite3.OperationalError as e:
+        # SQLite compilé sans FTS5 : search_products retombe sur LIKE
+        logger.warning("FTS5 indisponible, recherche produits en LIKE : %s", e)
+        _fts_available = False
+    return _fts_available
+
+
+def fts_match_expr(q: str) -> str:
+    """
+    Transforme une saisie libre en expression MATCH FTS5 : chaque mot devient
+    un préfixe ("lai"* "ent"*), tous requis. Les caractères spéciaux FTS sont
+    neutralisés. Retourne "" si aucun mot exploitable.
+    """
+    tokens = re.findall(r"\w+", (q or "").lower())
+    return " ".join(f'"{t}"*' for t in tokens[:8])
 
-        # Migration : copie les barcodes existants de products.barcode → product_barcodes
-        if _table_exists(c, "product_barcodes"):
-            try:
-                c.execute("""
-                    INSERT OR IGNORE INTO product_barcodes(product_id, barcode, label)
-                    SELECT id, barcode, ''
-                    FROM products
-                    WHERE barcode IS NOT NULL AND barcode != ''
-                """)
-            except Exception:
-                pass
-
-        # ----- Backfill utiles
-        try:
-            c.execute("UPDATE stock_lots SET initial_qty = qty WHERE initial_qty IS NULL")
-        except Exception:
-            pass
-        try:
-            c.execute("UPDATE products SET unit_pivot = unit WHERE unit_pivot IS NULL")
-        except Exception:
-            pass
 
-        c.commit()
+def search_products(q: str, limit: int = 20, c: sqlite3.Connection | None = None) -> list:
+    """
+    Recherche produits classée (bm25 : nom > EAN > marque > catégorie > description).
+    Préfixes + insensible aux accents. Retourne [{id, name, unit, category, barcode}].
+    """
+    global _fts_available
+    match = fts_match_expr(q)
+    if not match:
+        return []
+    limit = max(1, min(int(limit or 20), 200))
+    if c is None:
+        with _conn() as c2:
+            return search_products(q, limit, c2)
+    if _fts_available is False:
+        like = f"%{q.strip()}%"
+        rows = c.execute(
+            "SELECT id, name, unit, category, barcode FROM products "
+            "WHERE name LIKE ? OR barcode LIKE ? ORDER BY name LIMIT ?",
+            (like, like, limit),
+        ).fetchall()
+        return [dict(r) for r in rows]
+    weights = ", ".join(str(w) for w in _FTS_WEIGHTS)
+    try:
+        rows = c.execute(
+            f"""SELECT p.id, p.name, p.unit, p.category, p.barcode
+                FROM products_fts
+                JOIN products p ON p.id = products_fts.rowid
+                WHERE products_fts MATCH ?
+                ORDER BY bm25(products_fts, {weights}), p.name
+                LIMIT ?""",
+            (match, limit),
+        ).fetchall()
+    except sqlite3.OperationalError as e:
+        if _fts_available:
+            raise
+        # Base à jour (migration FTS déjà passée) mais SQLite sans FTS5
+        logger.warning("FTS5 indisponible, recherche produits en LIKE : %s", e)
+        _fts_available = False
+        return search_products(q, limit, c)
+    return [dict(r) for r in rows]
 
 
 # ---------- Locations
@@ -338,6 +690,7 @@ def add_product(
                     c.commit()
                 except Exception:
                     pass
+            _barcode_index_refresh(c, pid)
             return pid
         except sqlite3.IntegrityError:
             row = c.execute("SELECT id FROM products WHERE name=?", (name,)).fetchone()
@@ -516,6 +869,7 @@ def update_product(
     with _conn() as c:
         c.execute(f"UPDATE products SET {', '.join(sets)} WHERE id=?", params)
         c.commit()
+        _barcode_index_refresh(c, int(product_id))
 
 
 def delete_product(product_id: int):
@@ -529,6 +883,7 @@ def delete_product(product_id: int):
         c.execute("DELETE FROM product_barcodes WHERE product_id=?", (product_id,))
         c.execute("DELETE FROM products WHERE id=?", (product_id,))
         c.commit()
+        _barcode_index_refresh(c, int(product_id))
 
 
 # ---------- Multi-EAN (#10)
@@ -544,6 +899,18 @@ def get_product_barcodes(product_id: int) -> list:
         return [dict(r) for r in rows]
 
 
+def _backfill_product_barcode(c: sqlite3.Connection, product_id: int, barcode: str) -> None:
+    """Renseigne products.barcode (rétro-compat) si le produit n'en a pas encore."""
+    try:
+        c.execute(
+            "UPDATE products SET barcode=? WHERE id=? AND COALESCE(TRIM(barcode),'')=''",
+            (barcode, int(product_id))
+        )
+        c.commit()
+    except Exception:
+        pass
+
+
 def add_product_barcode(product_id: int, barcode: str, label: str = "") -> int | None:
     """
     Ajoute un code-barres à un produit.
@@ -562,20 +929,8 @@ def add_product_barcode(product_id: int, barcode: str, label: str = "") -> int |
             )
             c.commit()
             bc_id = cur.lastrowid
-            # Backfill products.barcode si vide
-            try:
-                row = c.execute(
-                    "SELECT COALESCE(barcode,'') AS barcode FROM products WHERE id=?",
-                    (int(product_id),)
-                ).fetchone()
-                if row and not (row["barcode"] or "").strip():
-                    c.execute(
-                        "UPDATE products SET barcode=? WHERE id=?",
-                        (barcode, int(product_id))
-                    )
-                    c.commit()
-            except Exception:
-                pass
+            _backfill_product_barcode(c, product_id, barcode)
+            _barcode_index_refresh(c, int(product_id))
             return bc_id
         except sqlite3.IntegrityError:
             return None
@@ -584,44 +939,172 @@ def add_product_barcode(product_id: int, barcode: str, label: str = "") -> int |
 def delete_product_barcode(bc_id: int) -> bool:
     """Supprime un code-barres par son id. Retourne True si supprimé."""
     with _conn() as c:
+        row = c.execute("SELECT product_id FROM product_barcodes WHERE id=?", (int(bc_id),)).fetchone()
         cur = c.execute("DELETE FROM product_barcodes WHERE id=?", (int(bc_id),))
         c.commit()
+        if row:
+            _barcode_index_refresh(c, int(row["product_id"]))
         return cur.rowcount > 0
 
 
-def find_product_by_barcode(code: str) -> dict | None:
+# ---------- Index mémoire EAN → produit
+#
+# Une rafale de scans (douchette qui vide un sac de courses) ne doit pas
+# ouvrir une connexion SQLite par code : l'index est chargé une fois
+# (products.barcode + product_barcodes), puis tenu à jour par les fonctions
+# d'écriture de ce module. Un code absent de l'index est recherché en base
+# (écritures faites hors db.py, ex. import CSV) puis mémorisé.
+# Clés normalisées (normalize_barcode) : un UPC-A scanné « 012345678905 »
+# et l'EAN-13 stocké « 0012345678905 » tombent sur la même entrée.
+
+_barcode_index: dict | None = None
+_barcode_index_db: str | None = None      # DB_PATH de l'index chargé
+_barcode_lock = threading.Lock()
+
+
+def normalize_barcode(code: str) -> str:
     """
-    Recherche un produit par code-barres.
-    Cherche d'abord dans product_barcodes (multi-EAN), puis dans products.barcode (rétro-compat).
-    Retourne {id, name, barcode} ou None.
+    Forme canonique d'un code-barres : sans espaces, UPC-A (12) → EAN-13
+    par ajout d'un 0, GTIN-14 à indicateur 0 → EAN-13. EAN-8 inchangé.
     """
-    code = "".join(ch for ch in (code or "") if not ch.isspace())
-    if not code:
-        return None
+    raw = "".join(ch for ch in (code or "") if not ch.isspace())
+    if not raw.isdigit():
+        return raw                     # code interne non numérique : tel quel
+    digits = raw
+    if len(digits) == 14 and digits.startswith("0"):
+        digits = digits[1:]
+    if len(digits) == 12:
+        digits = "0" + digits
+    return digits
+
+
+def _barcode_variants(code: str) -> list:
+    """Formes sous lesquelles un code normalisé peut être stocké en base."""
+    variants = [code]
+    if len(code) == 13 and code.startswith("0"):
+        variants.append(code[1:])      # UPC-A
+    variants.append("0" + code)        # GTIN-14
+    return variants
+
+
+def _barcode_rows(c: sqlite3.Connection, product_id: int | None = None) -> list:
+    """(code, id, name) de products.barcode puis product_barcodes (prioritaire)."""
+    where_p = "AND p.id = ?" if product_id is not None else ""
+    params = (product_id,) if product_id is not None else ()
+    rows = c.execute(
+        f"""SELECT p.barcode AS barcode, p.id AS id, p.name AS name
+            FROM products p
+            WHERE COALESCE(p.barcode, '') != '' {where_p}""",
+        params,
+    ).fetchall()
+    rows += c.execute(
+        f"""SELECT pb.barcode AS barcode, p.id AS id, p.name AS name
+            FROM product_barcodes pb
+            JOIN products p ON p.id = pb.product_id
+            WHERE 1=1 {where_p}""",
+        params,
+    ).fetchall()
+    return rows
+
+
+def _barcode_index_put(index: dict, rows) -> None:
+    for r in rows:
+        key = normalize_barcode(r["barcode"])
+        if key:
+            index[key] = {"id": int(r["id"]), "name": r["name"], "barcode": r["barcode"].replace(" ", "")}
+
+
+def _barcode_index_get() -> dict:
+    global _barcode_index, _barcode_index_db
+    index = _barcode_index
+    if index is None or _barcode_index_db != DB_PATH:
+        with _barcode_lock:
+            if _barcode_index is None or _barcode_index_db != DB_PATH:
+                fresh: dict = {}
+                with _conn() as c:
+                    _barcode_index_put(fresh, _barcode_rows(c))
+                _barcode_index, _barcode_index_db = fresh, DB_PATH
+            index = _barcode_index
+    return index
+
+
+def _barcode_index_refresh(c: sqlite3.Connection, product_id: int) -> None:
+    """Recharge les entrées d'un produit (après écriture). No-op si l'index n'est pas chargé."""
+    if _barcode_index is None or _barcode_index_db != DB_PATH:
+        return
+    try:
+        rows = _barcode_rows(c, int(product_id))
+    except Exception:
+        invalidate_barcode_index()
+        return
+    with _barcode_lock:
+        index = _barcode_index
+        if index is None:
+            return
+        for key in [k for k, v in index.items() if v["id"] == int(product_id)]:
+            del index[key]
+        _barcode_index_put(index, rows)
+
+
+def invalidate_barcode_index() -> None:
+    """Oublie l'index (rechargé au prochain scan) — après un import en masse par ex."""
+    global _barcode_index
+    with _barcode_lock:
+        _barcode_index = None
+
+
+def _find_barcode_in_db(code: str) -> dict | None:
+    variants = _barcode_variants(code)
+    ph = ",".join("?" * len(variants))
     with _conn() as c:
-        # 1) Cherche dans product_barcodes
-        row = c.execute(
-            """SELECT p.id, p.name, pb.barcode
-               FROM product_barcodes pb
-               JOIN products p ON p.id = pb.product_id
-               WHERE REPLACE(pb.barcode, ' ', '') = ?
-               LIMIT 1""",
-            (code,)
-        ).fetchone()
-        if row:
-            return dict(row)
-        # 2) Fallback : products.barcode (backward compat)
+        # 1) product_barcodes (multi-EAN), 2) products.barcode (rétro-compat)
         row = c.execute(
-            "SELECT id, name, COALESCE(barcode,'') AS barcode "
-            "FROM products WHERE REPLACE(COALESCE(barcode,''), ' ', '') = ? LIMIT 1",
-            (code,)
+            f"""SELECT p.id, p.name, pb.barcode
+                FROM product_barcodes pb
+                JOIN products p ON p.id = pb.product_id
+                WHERE REPLACE(pb.barcode, ' ', '') IN ({ph})
+                LIMIT 1""",
+            variants,
         ).fetchone()
+        if row is None:
+            row = c.execute(
+                f"SELECT id, name, REPLACE(barcode, ' ', '') AS barcode "
+                f"FROM products WHERE REPLACE(COALESCE(barcode,''), ' ', '') IN ({ph}) LIMIT 1",
+                variants,
+            ).fetchone()
         return dict(row) if row else None
 
 
+def find_product_by_barcode(code: str) -> dict | None:
+    """
+    Recherche un produit par code-barres (EAN-8 / EAN-13 / UPC-A).
+    Index mémoire d'abord, puis base (product_barcodes, products.barcode).
+    Retourne {id, name, barcode} ou None.
+    """
+    key = normalize_barcode(code)
+    if not key:
+        return None
+    index = _barcode_index_get()
+    hit = index.get(key)
+    if hit is not None:
+        return dict(hit)
+    found = _find_barcode_in_db(key)
+    if found:
+        with _barcode_lock:
+            if _barcode_index is index:
+                index[key] = dict(found)
+    return found
+
+
+def find_products_by_barcodes(codes: list) -> dict:
+    """Résolution groupée : {code saisi: {id, name, barcode} | None}."""
+    return {code: find_product_by_barcode(code) for code in codes}
+
+
 def register_barcode_for_product(product_id: int, barcode: str) -> None:
     """
-    Enregistre un EAN dans product_barcodes (INSERT OR IGNORE).
+    Enregistre un EAN dans product_barcodes (INSERT OR IGNORE) et renseigne
+    products.barcode s'il est vide — une seule connexion.
     Appelé depuis achats.py après chaque achat avec EAN.
     """
     barcode = "".join(ch for ch in (barcode or "") if ch.isdigit())
@@ -636,6 +1119,8 @@ def register_barcode_for_product(product_id: int, barcode: str) -> None:
             c.commit()
         except Exception:
             pass
+        _backfill_product_barcode(c, product_id, barcode)
+        _barcode_index_refresh(c, int(product_id))
 
 
 # ---------- Lots
@@ -659,10 +1144,7 @@ def add_lot(product_id: int, location_id: int, qty: float, frozen_on: str | None
         c.commit()
     return lot_id
 
-def list_lots():
-    with _conn() as c:
-        # 1) Essaie avec l.name (cas où tu stockes "Nutella" dans stock_lots.name)
-        q1 = """
+_LOTS_SELECT = """
         SELECT
             l.id,
             l.product_id,
@@ -692,14 +1174,25 @@ def list_lots():
             l.qty_per_unit                  AS qty_per_unit,
             l.multiplier                    AS multiplier,
             COALESCE(l.unit_at_purchase,'') AS unit_at_purchase
+"""
 
+_LOTS_FROM = """
         FROM stock_lots l
         JOIN products  p   ON p.id  = l.product_id
         JOIN locations loc ON loc.id = l.location_id
-        WHERE l.status = 'open'
+"""
+
+_LOTS_ORDER = """
         ORDER BY COALESCE(l.best_before, '9999-12-31') ASC,
-                 COALESCE(NULLIF(l.name, ''), NULLIF(l.article_name, ''), p.name)
-        """
+                 COALESCE(NULLIF(l.name, ''), NULLIF(l.article_name, ''), p.name),
+                 l.id
+"""
+
+
+def list_lots():
+    with _conn() as c:
+        # 1) Essaie avec l.name (cas où tu stockes "Nutella" dans stock_lots.name)
+        q1 = _LOTS_SELECT + _LOTS_FROM + "        WHERE l.status = 'open'" + _LOTS_ORDER
         try:
             return [dict(r) for r in c.execute(q1)]
         except Exception:
@@ -735,6 +1228,72 @@ def list_lots():
             """
             return [dict(r) for r in c.execute(q2)]
 
+def get_lots(lot_ids) -> list:
+    """Lots ouverts parmi `lot_ids` (une requête, même forme que list_lots)."""
+    ids = sorted({int(i) for i in lot_ids})
+    if not ids:
+        return []
+    ph = ",".join("?" * len(ids))
+    with _conn() as c:
+        sql = (_LOTS_SELECT + _LOTS_FROM
+               + f"        WHERE l.status = 'open' AND l.id IN ({ph})" + _LOTS_ORDER)
+        return [dict(r) for r in c.execute(sql, ids)]
+
+def _fold(s):
+    """Minuscules sans accents (« Crème » → « creme ») : recherche tolérante."""
+    if not isinstance(s, str):
+        return s
+    return "".join(ch for ch in unicodedata.normalize("NFKD", s.casefold())
+                   if not unicodedata.combining(ch))
+
+
+def _lots_where(q: str = "", product: str = "", location: str = "", status: str = "",
+                hide_zero: bool = False, warn_days: int = 30, crit_days: int = 14):
+    """Clause WHERE (+ paramètres) des filtres de la page Stocks."""
+    where = ["l.status = 'open'"]
+    params: list = []
+    if q:
+        where.append(
+            "instr(fold(COALESCE(NULLIF(l.name, ''), NULLIF(l.article_name, ''), p.name)"
+            " || ' ' || loc.name || ' ' || COALESCE(NULLIF(l.ean, ''), p.barcode, '')), ?) > 0"
+        )
+        params.append(_fold(q.strip()))
+    if product:
+        where.append("instr(fold(p.name), ?) > 0")
+        params.append(_fold(product.strip()))
+    if location:
+        where.append("fold(loc.name) = ?")
+        params.append(_fold(location.strip()))
+    if status:
+        sql, bounds = status_filter_sql(status, warn_days, crit_days)
+        where.append(sql)
+        params.extend(bounds)
+    if hide_zero:
+        where.append("l.qty > 0")
+    return " WHERE " + " AND ".join(where), params
+
+
+def query_lots(q: str = "", product: str = "", location: str = "", status: str = "",
+               hide_zero: bool = False, warn_days: int = 30, crit_days: int = 14,
+               limit: int | None = None, offset: int = 0) -> tuple[list, int]:
+    """
+    Lots ouverts filtrés en SQL (page Stocks, /api/lots) : texte libre
+    (nom, emplacement, EAN), produit, emplacement, statut DLC (converti en
+    bornes de best_before), masquage des quantités nulles.
+    Retourne (lots de la page, avec leur statut ; nombre total filtré).
+    """
+    where, params = _lots_where(q, product, location, status, hide_zero, warn_days, crit_days)
+    case_sql, case_params = status_case_sql(warn_days, crit_days)
+    with _conn() as c:
+        c.create_function("fold", 1, _fold, deterministic=True)
+        total = c.execute("SELECT COUNT(*)" + _LOTS_FROM + where, params).fetchone()[0]
+        sql = (_LOTS_SELECT + f", {case_sql} AS status" + _LOTS_FROM + where + _LOTS_ORDER
+               + " LIMIT ? OFFSET ?")
+        rows = c.execute(sql, [*case_params, *params,
+                               -1 if limit is None else int(limit), max(0, int(offset))])
+        return [dict(r) for r in rows], total
+
+
 def get_product_info(product_id: int) -> dict | None:
     """
     Retourne:
@@ -889,21 +1448,133 @@ def delete_lot(lot_id: int) -> int:
         return cur.rowcount
 
 # ---------- Helpers
-def status_for(best_before: str | None, warn_days: int, crit_days: int):
+def _parse_best_before(best_before) -> datetime.date | None:
+    """
+    Date d'un best_before exploitable, sinon None. Seule la forme canonique
+    AAAA-MM-JJ est acceptée (fromisoformat accepte aussi « 20250105 » ou
+    « 2025-01-05T00:00 » depuis Python 3.11) : même règle que _BB_VALID_SQL.
+    """
     if not best_before:
-        return "unknown"
+        return None
     try:
-        days = (datetime.date.fromisoformat(best_before) - datetime.date.today()).days
-    except ValueError:
+        d = datetime.date.fromisoformat(best_before)
+    except (TypeError, ValueError):
+        return None
+    return d if d.isoformat() == best_before else None
+
+
+def status_for(best_before: str | None, warn_days: int, crit_days: int):
+    d = _parse_best_before(best_before)
+    if d is None:
         return "unknown"
+    days = (d - datetime.date.today()).days
     if days <= crit_days:
         return "red"
     if days <= warn_days:
         return "yellow"
     return "green"
 
-def list_product_insights():
+def status_cutoffs(warn_days: int, crit_days: int, today: datetime.date | None = None) -> tuple[str, str]:
+    """
+    Bornes ISO équivalentes à status_for : red si best_before <= crit_cut,
+    yellow si <= warn_cut, green au-delà (warn_cut >= crit_cut).
+    """
+    today = today or datetime.date.today()
+    crit_cut = (today + datetime.timedelta(days=int(crit_days))).isoformat()
+    warn_cut = (today + datetime.timedelta(days=int(warn_days))).isoformat()
+    return crit_cut, max(crit_cut, warn_cut)
+
+
+def _classify(best_before, crit_cut: str, warn_cut: str) -> str:
+    if _parse_best_before(best_before) is None:
+        return "unknown"
+    if best_before <= crit_cut:
+        return "red"
+    if best_before <= warn_cut:
+        return "yellow"
+    return "green"
+
+
+def classify_statuses(best_befores, warn_days: int, crit_days: int,
+                      today: datetime.date | None = None) -> list:
+    """
+    status_for en lot : bornes calculées une fois, puis simple comparaison
+    de chaînes ISO. Chaque date distincte n'est validée qu'une fois.
+    """
+    crit_cut, warn_cut = status_cutoffs(warn_days, crit_days, today)
+    memo: dict = {}
+    out = []
+    for bb in best_befores:
+        st = memo.get(bb)
+        if st is None:
+            st = memo[bb] = _classify(bb, crit_cut, warn_cut)
+        out.append(st)
+    return out
+
+
+def classify_lots(lots: list, warn_days: int, crit_days: int) -> list:
+    """Renseigne lot["status"] pour chaque lot (en place) ; retourne la liste."""
+    statuses = classify_statuses((l.get("best_before") for l in lots), warn_days, crit_days)
+    for lot, st in zip(lots, statuses):
+        lot["status"] = st
+    return lots
+
+
+# best_before exploitable : date ISO AAAA-MM-JJ valide et canonique
+# (sinon « unknown », comme _parse_best_before côté Python)
+_BB_VALID_SQL = "(l.best_before IS NOT NULL AND date(l.best_before) IS l.best_before)"
+
+
+def status_case_sql(warn_days: int, crit_days: int) -> tuple[str, list]:
+    """Expression SQL CASE → 'red' / 'yellow' / 'green' / 'unknown' (alias de table : l)."""
+    crit_cut, warn_cut = status_cutoffs(warn_days, crit_days)
+    sql = (f"CASE WHEN NOT {_BB_VALID_SQL} THEN 'unknown' "
+           "WHEN l.best_before <= ? THEN 'red' "
+           "WHEN l.best_before <= ? THEN 'yellow' "
+           "ELSE 'green' END")
+    return sql, [crit_cut, warn_cut]
+
+
+def status_filter_sql(status: str, warn_days: int, crit_days: int) -> tuple[str, list]:
+    """Condition SQL (plage de best_before) sélectionnant les lots d'un statut."""
+    crit_cut, warn_cut = status_cutoffs(warn_days, crit_days)
+    if status == "red":
+        return f"({_BB_VALID_SQL} AND l.best_before <= ?)", [crit_cut]
+    if status == "yellow":
+        return f"({_BB_VALID_SQL} AND l.best_before > ? AND l.best_before <= ?)", [crit_cut, warn_cut]
+    if status == "green":
+        return f"({_BB_VALID_SQL} AND l.best_before > ?)", [warn_cut]
+    if status == "unknown":
+        return f"(NOT {_BB_VALID_SQL})", []
+    return "0", []
+
+
+def location_status_counts(warn_days: int, crit_days: int) -> dict[int, dict]:
+    """
+    Lots ouverts par emplacement, en une requête groupée :
+    {location_id: {"total", "soon" (yellow), "urgent" (red)}}.
+    """
+    red_sql, red_params = status_filter_sql("red", warn_days, crit_days)
+    yellow_sql, yellow_params = status_filter_sql("yellow", warn_days, crit_days)
+    with _conn() as c:
+        rows = c.execute(f"""
+            SELECT l.location_id        AS location_id,
+                   COUNT(*)             AS total,
+                   SUM({yellow_sql})    AS soon,
+                   SUM({red_sql})       AS urgent
+            {_LOTS_FROM}
+            WHERE l.status = 'open'
+            GROUP BY l.location_id
+        """, [*yellow_params, *red_params]).fetchall()
+    return {
+        int(r["location_id"]): {"total": r["total"], "soon": r["soon"] or 0, "urgent": r["urgent"] or 0}
+        for r in rows
+    }
+
+
+def list_product_insights(product_ids=None):
     """
+    Restreint aux produits `product_ids` si fourni (sinon tous).
     { product_id: {
         'last_in': 'YYYY-MM-DD'|None,
         'last_out': 'YYYY-MM-DD'|None,
@@ -935,7 +1606,11 @@ def list_product_insights():
             WHERE l.product_id = p.id)                  AS expired_rate
         FROM products p
         """
-        rows = c.execute(q).fetchall()
+        params: list = []
+        if product_ids is not None:
+            params = [int(pid) for pid in product_ids]
+            q += f" WHERE p.id IN ({', '.join('?' * len(params)) or 'NULL'})"
+        rows = c.execute(q, params).fetchall()
         out = {}
         for r in rows:
             out[int(r["product_id"])] = {
@@ -16,12 +16,14 @@ from urllib.parse import urlparse
 
 from fastapi import FastAPI, Request
 from fastapi.responses import PlainTextResponse
-from fastapi.staticfiles import StaticFiles
 
 from config import DB_PATH, get_retention_thresholds
-from services.events import _ensure_events_table
+from schema import init_schema
 from utils.assets import ensure_hashed_asset
 from utils.jinja import build_jinja_env
+from utils.lazy_router import include_lazy_router
+from utils.compression import CompressionMiddleware
+from utils.static_files import CachedStaticFiles, precompress_static
 
 # Routers "pages"
 from routes.home import router as home_router
@@ -34,16 +36,10 @@ from routes.support import router as support_router
 from routes.settings import router as settings_router
 # Routers techniques
 from routes.api import router as api_router
-from routes.debug import router as debug_router
-from routes.admin_db import router as admin_db_router
 from routes.shopping import router as shopping_router
 from routes.ha import router as ha_router
-from routes.export_import import router as export_import_router
-from routes.print_route import router as print_router
-
-
-# DB (uniquement ce dont on a besoin ici)
-from db import init_db
+# Chargés à la première requête (voir « Montage des routers ») :
+# routes.debug, routes.admin_db, routes.export_import, routes.print_route
 
 
 # ============================================================
@@ -85,6 +81,8 @@ logger = logging.getLogger("domovra")
 # ============================================================
 
 app = FastAPI()
+# Compression gzip/Brotli des réponses volumineuses (seuil + types texte)
+app.add_middleware(CompressionMiddleware)
 templates = build_jinja_env()
 
 templates.globals.setdefault("ASSET_CSS_PATH", "static/css/domovra.css")
@@ -128,14 +126,14 @@ async def csrf_check(request: Request, call_next):
 
 
 # ============================================================
-# Fichiers statiques + CSS versionné
+# Fichiers statiques + assets versionnés (cache « immutable »)
 # ============================================================
 
 HERE = os.path.dirname(__file__)
 STATIC_DIR = os.path.join(HERE, "static")
 os.makedirs(os.path.join(STATIC_DIR, "css"), exist_ok=True)
 
-app.mount("/static", StaticFiles(directory=STATIC_DIR), name="static")
+app.mount("/static", CachedStaticFiles(directory=STATIC_DIR), name="static")
 
 try:
     css_rel = ensure_hashed_asset("static/css/domovra.css")
@@ -187,11 +185,15 @@ app.include_router(shopping_router)
 
 # Technique / API
 app.include_router(api_router)
-app.include_router(debug_router)
-app.include_router(admin_db_router)
 app.include_router(ha_router)
-app.include_router(export_import_router)
-app.include_router(print_router)
+
+# Rarement utilisés : importés à la première requête sur leurs préfixes
+# (imprimante BLE, admin DB, debug, export/import). Ajoutés après les
+# routers ci-dessus : les routes eager restent prioritaires.
+include_lazy_router(app, "routes.debug", ("/_debug/vars", "/debug/"))
+include_lazy_router(app, "routes.admin_db", ("/admin/db",))
+include_lazy_router(app, "routes.export_import", ("/data/export/", "/data/import/"))
+include_lazy_router(app, "routes.print_route", ("/api/print/",))
 
 
 # ============================================================
@@ -220,8 +222,7 @@ async def _startup() -> None:
     warn, crit = get_retention_thresholds()
     logger.info("Retention thresholds: WARNING_DAYS=%s  CRITICAL_DAYS=%s", warn, crit)
 
-    init_db()
-    _ensure_events_table()
+    init_schema()
 
     try:
         from settings_store import load_settings
@@ -231,4 +232,8 @@ async def _startup() -> None:
     except Exception as e:  # pragma: no cover
         logger.exception("Erreur lecture settings au démarrage: %s", e)
 
+    # CSS/JS précompressés (.br/.gz) en tâche de fond : d'ici là, la
+    # compression à la volée prend le relais
+    asyncio.get_running_loop().run_in_executor(None, precompress_static, STATIC_DIR)
+
     asyncio.create_task(_ha_push_loop())
@@ -13,7 +13,8 @@ from config import DB_PATH
 from utils.http import ingress_base, render as render_with_env
 from services.events import log_event
 from services.ha_entities import schedule_ha_push
-from db import list_products, list_locations, register_barcode_for_product
+from services import label_cache
+from db import list_products, list_locations, register_barcode_for_product, data_version
 
 router = APIRouter()
 
@@ -106,11 +107,11 @@ def achats_page(request: Request):
     return render_with_env(
         request.app.state.templates,
         "achats.html",
+        version=data_version("products", "stock_lots", "locations"),
+        build=lambda: {"products": list_products(), "locations": list_locations()},
         BASE=base,
         page="achats",
         request=request,
-        products=list_products(),
-        locations=list_locations(),
     )
 
 
@@ -202,24 +203,12 @@ def achats_add_action(
         best_before or None, frozen_on or None,
     )
 
-    # Si EAN fourni :
-    # 1) Enregistre dans product_barcodes (#10 multi-EAN, INSERT OR IGNORE)
-    # 2) Backfill products.barcode si vide (rétro-compat)
+    # Si EAN fourni : enregistre dans product_barcodes (#10 multi-EAN,
+    # INSERT OR IGNORE) + backfill products.barcode si vide (rétro-compat),
+    # en une seule connexion — l'index mémoire EAN est mis à jour au passage.
     if ean_digits:
-        register_barcode_for_product(int(product_id), ean_digits)
         try:
-            with _conn() as c:
-                row = c.execute(
-                    "SELECT COALESCE(barcode,'') AS barcode FROM products WHERE id=?",
-                    (int(product_id),)
-                ).fetchone()
-                current_bc = (row["barcode"] or "") if row else ""
-                if not current_bc.strip():
-                    c.execute(
-                        "UPDATE products SET barcode=? WHERE id=?",
-                        (ean_digits, int(product_id))
-                    )
-                    c.commit()
+            register_barcode_for_product(int(product_id), ean_digits)
         except Exception:
             # volontairement silencieux (pas bloquant pour l'ajout)
             pass
@@ -259,6 +248,9 @@ def achats_add_action(
         # enrichissement best-effort; on n'échoue pas l'opération principale
         pass
 
+    # Étiquette pré-rendue une fois le lot enrichi (nom, marque, magasin)
+    label_cache.schedule_prerender([res.get("lot_id")])
+
     # Journalisation
     log_event("achats.add", {
         "result": res["action"], "lot_id": res["lot_id"], "new_qty": res["new_qty"],
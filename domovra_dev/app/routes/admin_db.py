@@ -5,14 +5,17 @@ from __future__ import annotations
 
 import csv
 import io
+import json
 import re
 import sqlite3
-from typing import Any, List
+from typing import Any, Dict, List
 
 from fastapi import APIRouter, Depends, Request, Query, HTTPException
 from fastapi.responses import HTMLResponse, StreamingResponse
 
 from config import DB_PATH
+from db import write_generations
+from utils.db_pool import run_db
 from utils.http import ingress_base, render as render_with_env
 
 router = APIRouter()
@@ -55,15 +58,215 @@ def _require_ingress(request: Request) -> None:
         )
 
 
-@router.get("/admin/db", response_class=HTMLResponse, dependencies=[Depends(_require_ingress)])
-async def admin_db_home(request: Request):
+# ─────────────────────────────────────────────
+# Requêtes (exécutées dans le pool DB, hors boucle asyncio)
+# ─────────────────────────────────────────────
+
+def _list_tables() -> List[str]:
     with _conn() as c:
         rows = c.execute("""
             SELECT name FROM sqlite_master
             WHERE type='table' AND name NOT LIKE 'sqlite_%'
             ORDER BY name
         """).fetchall()
-        tables = [r["name"] for r in rows]
+        return [r["name"] for r in rows]
+
+
+def _table_info(c: sqlite3.Connection, table: str) -> dict:
+    """
+    Colonnes + capacités de pagination d'une table existante (404 sinon).
+    `table` déjà validée par _validate_ident.
+    - has_rowid : False pour les tables WITHOUT ROWID
+    - keyset    : colonnes utilisables comme curseur (en tête d'un index, NOT NULL)
+    """
+    row = c.execute(
+        "SELECT sql FROM sqlite_master WHERE type='table' AND name=?", (table,),
+    ).fetchone()
+    if row is None:
+        raise HTTPException(status_code=404, detail=f"Table '{table}' introuvable")
+    info = c.execute(f"PRAGMA table_info({table})").fetchall()
+    columns = [r["name"] for r in info]
+    not_null = {r["name"] for r in info if r["notnull"] or r["pk"]}
+    has_rowid = "WITHOUT ROWID" not in (row["sql"] or "").upper()
+
+    keyset = set()
+    if has_rowid:
+        pks = [r for r in info if r["pk"]]
+        if len(pks) == 1 and (pks[0]["type"] or "").upper() == "INTEGER":
+            keyset.add(pks[0]["name"])           # alias de rowid
+        try:
+            for idx in c.execute(f"PRAGMA index_list({table})").fetchall():
+                first = c.execute(f"PRAGMA index_info({idx['name']})").fetchone()
+                if first is not None and first["name"] in not_null:
+                    keyset.add(first["name"])
+        except sqlite3.DatabaseError:             # tables virtuelles
+            pass
+    return {"columns": columns, "has_rowid": has_rowid, "keyset": keyset}
+
+
+def _projection(columns: List[str], cols: str | None) -> List[str]:
+    """Colonnes demandées (?cols=a,b) parmi les colonnes réelles ; toutes par défaut."""
+    if not cols:
+        return columns
+    wanted = [x.strip() for x in cols.split(",") if x.strip()]
+    picked = [x for x in wanted if x in columns]
+    return picked or columns
+
+
+def _order_sql(columns: List[str], order_by: str | None, desc: bool, has_rowid: bool = True):
+    """Tri (fallback sur rowid) — valide que order_by est une colonne réelle."""
+    order = order_by if (order_by and order_by in columns) else None
+    if order:
+        _validate_ident(order, "Colonne de tri")
+    if order:
+        sql = f" ORDER BY {order} {'DESC' if desc else 'ASC'}"
+    else:
+        sql = " ORDER BY rowid DESC" if has_rowid else ""
+    return order, sql
+
+
+# Comptages mis en cache : {(DB_PATH, table): (génération, n)}
+_count_cache: Dict[tuple, tuple] = {}
+
+
+def _count(c: sqlite3.Connection, table: str) -> int:
+    """COUNT(*) réutilisé tant que la table n'a pas été modifiée (db_generation)."""
+    gen = write_generations(c).get(table)
+    key = (DB_PATH, table)
+    if gen is not None:
+        cached = _count_cache.get(key)
+        if cached is not None and cached[0] == gen:
+            return cached[1]
+    n = c.execute(f"SELECT COUNT(*) AS n FROM {table}").fetchone()["n"]
+    if gen is not None:
+        _count_cache[key] = (gen, n)
+    return n
+
+
+def _encode_cursor(order: str | None, row) -> str:
+    return json.dumps([row["__order__"], row["__rowid__"]] if order else row["__rowid__"])
+
+
+def _decode_cursor(order: str | None, cursor: str):
+    try:
+        value = json.loads(cursor)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Curseur invalide")
+    if order:
+        if not (isinstance(value, list) and len(value) == 2 and isinstance(value[1], int)):
+            raise HTTPException(status_code=400, detail="Curseur invalide")
+        return value
+    if not isinstance(value, int):
+        raise HTTPException(status_code=400, detail="Curseur invalide")
+    return [value]
+
+
+def _keyset_page(c, table, select, order, desc, page_size, after, before, last) -> dict:
+    """
+    Page par curseur (rowid, ou (colonne indexée, rowid)) : coût constant
+    quelle que soit la profondeur. `after` = page suivante, `before` =
+    page précédente, `last` = dernière page.
+    """
+    key = f"({order}, rowid)" if order else "rowid"
+    cols = f"{order}, rowid" if order else "rowid"
+    forward = not (before or last)          # sens d'affichage ?
+    asc = (not desc) if forward else desc   # sens de lecture SQL
+    where, params = "", []
+    cursor = after or before
+    if cursor:
+        values = _decode_cursor(order, cursor)
+        op = "<" if desc == bool(after) else ">"
+        where = f" WHERE {key} {op} ({', '.join('?' * len(values))})"
+        params = values
+    direction = "ASC" if asc else "DESC"
+    order_sql = ", ".join(f"{col} {direction}" for col in cols.split(", "))
+    # Clé de tri toujours lue (même hors projection ?cols) pour le curseur
+    key_cols = f"{order} AS __order__, rowid AS __rowid__" if order else "rowid AS __rowid__"
+    rows = c.execute(
+        f"SELECT {select}, {key_cols} FROM {table}{where} ORDER BY {order_sql} LIMIT ?",
+        (*params, page_size + 1),
+    ).fetchall()
+    more = len(rows) > page_size
+    rows = rows[:page_size]
+    if not forward:
+        rows.reverse()
+    return {
+        "rows": rows,
+        "has_prev": more if not forward else bool(after),
+        "has_next": more if forward else not last,
+        "first_cursor": _encode_cursor(order, rows[0]) if rows else None,
+        "last_cursor": _encode_cursor(order, rows[-1]) if rows else None,
+    }
+
+
+def _table_page(table: str, page: int, page_size: int, order_by: str | None, desc: bool,
+                after: str | None = None, before: str | None = None, last: bool = False,
+                cols: str | None = None) -> dict:
+    with _conn() as c:
+        info = _table_info(c, table)
+        columns = _projection(info["columns"], cols)
+        order, order_sql = _order_sql(info["columns"], order_by, desc, info["has_rowid"])
+        select = ", ".join(columns)
+        total = _count(c, table)
+
+        keyset = info["has_rowid"] and (order is None or order in info["keyset"])
+        if keyset:
+            size = page_size
+            if last:
+                # Dernière page alignée sur le découpage des pages précédentes
+                page = max(1, (total - 1) // page_size + 1)
+                size = max(1, total - (page - 1) * page_size)
+            res = _keyset_page(c, table, select, order, desc, size, after, before, last)
+        else:
+            # Tri sur une colonne non indexée : OFFSET (coût proportionnel à la page)
+            if last:
+                page = max(1, (total - 1) // page_size + 1)
+            offset = (page - 1) * page_size
+            rows = c.execute(
+                f"SELECT {select} FROM {table}{order_sql} LIMIT ? OFFSET ?",
+                (page_size, offset),
+            ).fetchall()
+            res = {"rows": rows, "has_prev": page > 1, "has_next": offset + len(rows) < total,
+                   "first_cursor": None, "last_cursor": None}
+
+        data: List[dict[str, Any]] = [{k: r[k] for k in columns} for r in res["rows"]]
+
+    return {
+        "columns": columns,
+        "all_columns": info["columns"],
+        "rows": data,
+        "total": total,
+        "order_by": order,
+        "page": page,
+        "keyset": keyset,
+        "has_prev": res["has_prev"],
+        "has_next": res["has_next"],
+        "first_cursor": res["first_cursor"],
+        "last_cursor": res["last_cursor"],
+    }
+
+
+def _table_csv(table: str, order_by: str | None, desc: bool, cols: str | None = None) -> bytes:
+    with _conn() as c:
+        info = _table_info(c, table)
+        columns = _projection(info["columns"], cols)
+        _, order_sql = _order_sql(info["columns"], order_by, desc, info["has_rowid"])
+
+        buf = io.StringIO()
+        writer = csv.writer(buf)
+        writer.writerow(columns)
+        for r in c.execute(f"SELECT {', '.join(columns)} FROM {table}{order_sql}"):
+            writer.writerow([_sanitize_csv_cell(r[col]) for col in columns])
+    return buf.getvalue().encode("utf-8")
+
+
+# ─────────────────────────────────────────────
+# Routes
+# ─────────────────────────────────────────────
+
+@router.get("/admin/db", response_class=HTMLResponse, dependencies=[Depends(_require_ingress)])
+async def admin_db_home(request: Request):
+    tables = await run_db(_list_tables)
 
     return render_with_env(
         request.app.state.templates,
@@ -83,37 +286,13 @@ async def admin_db_table(
     page_size: int = Query(50, ge=1, le=500),
     order_by: str | None = Query(None),
     desc: bool = Query(True),
+    after: str | None = Query(None),
+    before: str | None = Query(None),
+    last: bool = Query(False),
+    cols: str | None = Query(None),
 ):
     _validate_ident(table, "Nom de table")
-
-    with _conn() as c:
-        # Vérifie l'existence dans sqlite_master (paramétrisé)
-        exists = c.execute(
-            "SELECT COUNT(*) AS n FROM sqlite_master WHERE type='table' AND name=?",
-            (table,),
-        ).fetchone()["n"]
-        if not exists:
-            raise HTTPException(status_code=404, detail=f"Table '{table}' introuvable")
-
-        # Colonnes — table déjà validée par _validate_ident
-        cols_rows = c.execute(f"PRAGMA table_info({table})").fetchall()
-        columns = [r["name"] for r in cols_rows]
-
-        # Tri (fallback sur rowid) — valide que order_by est une colonne réelle
-        order = order_by if (order_by and order_by in columns) else None
-        if order:
-            _validate_ident(order, "Colonne de tri")
-        order_sql = f" ORDER BY {order} {'DESC' if desc else 'ASC'}" if order else " ORDER BY rowid DESC"
-
-        # Pagination
-        total = c.execute(f"SELECT COUNT(*) AS n FROM {table}").fetchone()["n"]
-        offset = (page - 1) * page_size
-
-        rows = c.execute(
-            f"SELECT * FROM {table}{order_sql} LIMIT ? OFFSET ?",
-            (page_size, offset),
-        ).fetchall()
-        data: List[dict[str, Any]] = [dict(r) for r in rows]
+    res = await run_db(_table_page, table, page, page_size, order_by, desc, after, before, last, cols)
 
     return render_with_env(
         request.app.state.templates,
@@ -121,13 +300,20 @@ async def admin_db_table(
         request=request,
         BASE=ingress_base(request),
         table=table,
-        columns=columns,
-        rows=data,
-        page=page,
+        columns=res["columns"],
+        all_columns=res["all_columns"],
+        cols=",".join(res["columns"]) if cols else "",
+        rows=res["rows"],
+        page=res["page"],
         page_size=page_size,
-        total=total,
-        order_by=order,
+        total=res["total"],
+        order_by=res["order_by"],
         desc=desc,
+        keyset=res["keyset"],
+        has_prev=res["has_prev"],
+        has_next=res["has_next"],
+        first_cursor=res["first_cursor"],
+        last_cursor=res["last_cursor"],
         title=f"Admin · {table}",
     )
 
@@ -137,36 +323,13 @@ async def admin_db_export_csv(
     table: str,
     order_by: str | None = Query(None),
     desc: bool = Query(True),
+    cols: str | None = Query(None),
 ):
     _validate_ident(table, "Nom de table")
-
-    with _conn() as c:
-        exists = c.execute(
-            "SELECT COUNT(*) AS n FROM sqlite_master WHERE type='table' AND name=?",
-            (table,),
-        ).fetchone()["n"]
-        if not exists:
-            raise HTTPException(status_code=404, detail=f"Table '{table}' introuvable")
-
-        cols_rows = c.execute(f"PRAGMA table_info({table})").fetchall()
-        columns = [r["name"] for r in cols_rows]
-
-        order = order_by if (order_by and order_by in columns) else None
-        if order:
-            _validate_ident(order, "Colonne de tri")
-        order_sql = f" ORDER BY {order} {'DESC' if desc else 'ASC'}" if order else " ORDER BY rowid DESC"
-
-        rows = c.execute(f"SELECT * FROM {table}{order_sql}").fetchall()
-
-    buf = io.StringIO()
-    writer = csv.writer(buf)
-    writer.writerow(columns)
-    for r in rows:
-        writer.writerow([_sanitize_csv_cell(r[col]) for col in columns])
-    buf.seek(0)
+    content = await run_db(_table_csv, table, order_by, desc, cols)
 
     return StreamingResponse(
-        iter([buf.getvalue().encode("utf-8")]),
+        iter([content]),
         media_type="text/csv",
         headers={"Content-Disposition": f"attachment; filename={table}.csv"},
     )
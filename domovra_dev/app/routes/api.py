@@ -12,6 +12,8 @@
 #   GET  /api/stock/low                   → produits sous le seuil min
 #   GET  /api/product-info?product_id=X   → détail produit + lots FIFO
 #   GET  /api/product/by_barcode?code=X   → recherche par EAN (multi-EAN)
+#   POST /api/product/by_barcodes         → résolution groupée d'EAN (douchette)
+#   GET  /api/products/search?q=X         → recherche plein texte (FTS5)
 #
 #   Multi-EAN (#10)
 #   ---------------
@@ -27,12 +29,14 @@
 #
 #   Interne / Scanner
 #   -----------------
-#   GET  /api/off?barcode=X               → recherche Open Food Facts
+#   GET  /api/off?barcode=X               → recherche Open Food Facts (cache)
+#   POST   /api/off/enrich                → lance l'enrichissement OFF des EAN connus
+#   GET    /api/off/enrich                → progression du job
+#   DELETE /api/off/enrich                → annule le job (reprise possible)
 #   POST /api/log                         → journalisation depuis le front
 # ============================================================
 from __future__ import annotations
 
-import json
 import re
 import logging
 from typing import Any, Dict, List, Optional
@@ -51,9 +55,14 @@ from db import (
     add_product_barcode,
     delete_product_barcode,
     find_product_by_barcode,
+    find_products_by_barcodes,
+    search_products,
 )
 from services.events import log_event
+from services import off as off_service
+from services.off import lookup as off_lookup
 from services.ha_entities import schedule_ha_push
+from services import label_cache
 
 router = APIRouter()
 log = logging.getLogger("domovra.api")
@@ -486,6 +495,7 @@ def api_add_lot(
         log.error("api_add_lot: erreur product_id=%s: %s", product_id, e)
         return JSONResponse({"ok": False, "error": f"db error: {e}"}, status_code=500)
 
+    label_cache.schedule_prerender([lot_id])
     log_event("api.add_lot", {
         "lot_id": lot_id,
         "product_id": product_id,
@@ -613,6 +623,77 @@ def api_product_by_barcode(code: str) -> JSONResponse:
     })
 
 
+# ─────────────────────────────────────────────
+# POST /api/product/by_barcodes  (rafale de scans)
+# ─────────────────────────────────────────────
+
+MAX_BULK_BARCODES = 500
+
+
+@router.post("/api/product/by_barcodes")
+def api_products_by_barcodes(codes: List[str] = Body(..., embed=True)) -> JSONResponse:
+    """
+    Résout plusieurs codes-barres en un appel (douchette qui vide un sac).
+    EAN-8 / EAN-13 / UPC-A acceptés ; un UPC-A trouve l'EAN-13 équivalent.
+    Résolution via l'index mémoire EAN → produit (pas de requête SQL par code).
+
+    Corps JSON :
+        { "codes": ["3017620425035", "012345678905", "999"] }
+
+    Réponse :
+        {
+          "found": 2,
+          "missing": ["999"],
+          "results": {
+            "3017620425035": {"id": 1, "name": "Nutella", "barcode": "3017620425035"},
+            "012345678905":  {"id": 7, "name": "Soda",    "barcode": "0012345678905"},
+            "999": null
+          }
+        }
+    """
+    if len(codes) > MAX_BULK_BARCODES:
+        return JSONResponse(
+            {"error": f"too many codes (max {MAX_BULK_BARCODES})"}, status_code=413
+        )
+    wanted = [str(c).strip() for c in codes if str(c or "").strip()]
+    results = find_products_by_barcodes(wanted)
+    missing = [c for c, r in results.items() if r is None]
+    return JSONResponse({
+        "found": len(results) - len(missing),
+        "missing": missing,
+        "results": results,
+    })
+
+
+# ─────────────────────────────────────────────
+# GET /api/products/search  (FTS5)
+# ─────────────────────────────────────────────
+
+@router.get("/api/products/search")
+def api_products_search(
+    q: str = Query("", max_length=200),
+    limit: int = Query(20, ge=1, le=100),
+) -> JSONResponse:
+    """
+    Recherche plein texte dans les produits : nom, catégorie, description,
+    marques (lots) et tous les EAN. Chaque mot est un préfixe, la casse et
+    les accents sont ignorés (« creme fra » → « Crème fraîche »).
+    Résultats classés par pertinence (nom d'abord).
+
+    Réponse :
+        {
+          "q": "creme",
+          "count": 1,
+          "results": [
+            {"id": 4, "name": "Crème fraîche", "unit": "g",
+             "category": "Crèmerie", "barcode": "3155250349793"}
+          ]
+        }
+    """
+    results = search_products(q, limit) if q.strip() else []
+    return JSONResponse({"q": q, "count": len(results), "results": results})
+
+
 # ─────────────────────────────────────────────
 # GET /api/product/{product_id}/barcodes
 # ─────────────────────────────────────────────
@@ -704,11 +785,14 @@ def api_delete_barcode(bc_id: int = Path(..., ge=1)) -> JSONResponse:
 # ─────────────────────────────────────────────
 
 @router.get("/api/off")
-def api_off(barcode: str) -> JSONResponse:
-    """Recherche un produit sur Open Food Facts par code-barres."""
-    import urllib.request
-    import urllib.error
+async def api_off(barcode: str, refresh: bool = False) -> JSONResponse:
+    """
+    Recherche un produit sur Open Food Facts par code-barres.
 
+    Réponses servies depuis le cache SQLite (services/off.py) tant qu'elles
+    sont fraîches ; hors ligne, une entrée périmée est renvoyée avec
+    "stale": true. refresh=1 force l'appel réseau.
+    """
     barcode = (barcode or "").strip()
     if not barcode:
         return JSONResponse({"ok": False, "error": "missing barcode"}, status_code=400)
@@ -717,28 +801,48 @@ def api_off(barcode: str) -> JSONResponse:
         log.warning("api_off: barcode invalide: %r", barcode)
         return JSONResponse({"ok": False, "error": "invalid barcode"}, status_code=400)
 
-    url = f"https://world.openfoodfacts.org/api/v2/product/{barcode}.json"
-    try:
-        req = urllib.request.Request(url, headers={"User-Agent": "Domovra/1.0"})
-        with urllib.request.urlopen(req, timeout=6) as resp:
-            data: Dict[str, Any] = json.loads(resp.read().decode("utf-8"))
-    except urllib.error.URLError:
-        return JSONResponse({"ok": False, "error": "offline"}, status_code=502)
-    except Exception:
-        return JSONResponse({"ok": False, "error": "parse"}, status_code=500)
+    res = await off_lookup(barcode, force=refresh)
+    if res.get("ok"):
+        return JSONResponse(res)
+    status = {"notfound": 404, "offline": 502, "parse": 500}.get(res.get("error"), 500)
+    return JSONResponse(res, status_code=status)
 
-    if not isinstance(data, dict) or data.get("status") != 1:
-        return JSONResponse({"ok": False, "error": "notfound"}, status_code=404)
 
-    p: Dict[str, Any] = data.get("product", {}) or {}
-    return JSONResponse({
-        "ok": True,
-        "barcode": barcode,
-        "name": p.get("product_name") or "",
-        "brand": p.get("brands") or "",
-        "quantity": p.get("quantity") or "",
-        "image": p.get("image_front_url") or p.get("image_url") or "",
-    })
+# ─────────────────────────────────────────────
+# /api/off/enrich  (job d'enrichissement OFF)
+# ─────────────────────────────────────────────
+
+@router.post("/api/off/enrich")
+async def api_off_enrich_start() -> JSONResponse:
+    """
+    Lance en tâche de fond la récupération OFF des EAN de product_barcodes
+    absents du cache (concurrence et débit limités). Sans effet si le job
+    tourne déjà. Relancer après une annulation reprend où il s'était arrêté.
+    """
+    status = off_service.start_enrichment()
+    log_event("off.enrich.start", {})
+    return JSONResponse({"ok": True, **status}, status_code=202)
+
+
+@router.get("/api/off/enrich")
+async def api_off_enrich_status() -> JSONResponse:
+    """
+    Progression du job :
+        {"state": "running", "total": 120, "done": 45, "found": 40,
+         "notfound": 4, "errors": 1, "current": "3017620425035", "pending": 75}
+    state ∈ idle | starting | running | done | cancelling | cancelled | offline
+    """
+    import asyncio
+    status = off_service.enrichment_status()
+    status["pending"] = len(await asyncio.to_thread(off_service.pending_barcodes))
+    return JSONResponse(status)
+
+
+@router.delete("/api/off/enrich")
+async def api_off_enrich_cancel() -> JSONResponse:
+    """Annule le job en cours. Les EAN déjà traités restent en cache."""
+    cancelled = off_service.cancel_enrichment()
+    return JSONResponse({"ok": cancelled, **off_service.enrichment_status()})
 
 
 # ─────────────────────────────────────────────
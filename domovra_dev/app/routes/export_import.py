@@ -17,7 +17,9 @@ from db import (
     _conn,
     list_products, list_lots, list_locations,
     add_location,
+    invalidate_barcode_index,
 )
+from utils.db_pool import run_db
 
 logger = logging.getLogger("domovra.export_import")
 router = APIRouter(prefix="/data", tags=["export-import"])
@@ -116,33 +118,18 @@ def _bool_field(v: Any) -> int:
     return 1 if s in ("1", "true", "oui", "yes", "on") else 0
 
 
-# ─── IMPORT PRODUITS ─────────────────────────────────────────────────────────
-
-@router.post("/import/products")
-async def import_products(
-    file: UploadFile = File(...),
-    on_conflict: str = Form("skip"),
-):
-    """
-    Importe des produits depuis un CSV.
-    on_conflict=skip  → ignorer les lignes dont le nom/barcode existe déjà
-    on_conflict=update → mettre à jour les produits existants
-    """
-    raw = await file.read(MAX_UPLOAD_SIZE + 1)
-    if len(raw) > MAX_UPLOAD_SIZE:
-        return JSONResponse(
-            {"ok": False, "error": "Fichier trop volumineux (max 10 Mo)."},
-            status_code=413,
-        )
+# ─── IMPORT (écritures SQLite) ───────────────────────────────────────────────
 
-    try:
-        rows = _parse_csv(raw)
-    except Exception as e:
-        return JSONResponse({"ok": False, "error": f"Impossible de lire le CSV : {e}"}, status_code=400)
+def _add_product_barcode(c, product_id: int, barcode: str) -> None:
+    """EAN importé aussi dans product_barcodes (recherche, enrichissement OFF)."""
+    c.execute(
+        "INSERT OR IGNORE INTO product_barcodes(product_id, barcode, label) VALUES(?,?,'')",
+        (int(product_id), barcode),
+    )
 
-    if not rows:
-        return JSONResponse({"ok": False, "error": "Fichier vide ou format invalide."}, status_code=400)
 
+def _import_products_rows(rows: List[Dict[str, str]], on_conflict: str) -> Dict[str, Any]:
+    """Écrit les produits du CSV (pool DB, hors boucle asyncio)."""
     imported = 0
     updated = 0
     skipped = 0
@@ -211,6 +198,8 @@ async def import_products(
                                 f"UPDATE products SET {', '.join(sets)} WHERE id=?",
                                 params,
                             )
+                        if barcode:
+                            _add_product_barcode(c, existing_id, barcode)
                         updated += 1
                     except Exception as e:
                         errors.append(f"Ligne {i} ({name}) : erreur mise à jour — {e}")
@@ -229,7 +218,7 @@ async def import_products(
                 no_expiry = _bool_field(row.get("no_expiry", "0"))
                 no_freeze = _bool_field(row.get("no_freeze", "0"))
 
-                c.execute(
+                cur = c.execute(
                     """INSERT INTO products
                        (name, unit, default_shelf_life_days, barcode, min_qty,
                         description, category, default_freeze_shelf_days, no_expiry, no_freeze,
@@ -238,53 +227,32 @@ async def import_products(
                     (name, unit, shelf, barcode, min_qty,
                      description, category, freeze_shelf, no_expiry, no_freeze),
                 )
+                product_id = cur.lastrowid
                 imported += 1
                 # Mise à jour de l'index local pour les lignes suivantes
-                existing_by_name[name.casefold()] = c.lastrowid or 0
+                existing_by_name[name.casefold()] = product_id
                 if barcode:
-                    existing_by_barcode[barcode] = c.lastrowid or 0
+                    _add_product_barcode(c, product_id, barcode)
+                    existing_by_barcode[barcode] = product_id
             except Exception as e:
                 errors.append(f"Ligne {i} ({name}) : {e}")
 
         c.commit()
 
-    return JSONResponse({
+    # Les EAN importés ne passent pas par db.py : l'index mémoire est rechargé
+    invalidate_barcode_index()
+
+    return {
         "ok": True,
         "imported": imported,
         "updated": updated,
         "skipped": skipped,
         "errors": errors,
-    })
-
+    }
 
-# ─── IMPORT LOTS ─────────────────────────────────────────────────────────────
-
-@router.post("/import/lots")
-async def import_lots(
-    file: UploadFile = File(...),
-    on_conflict: str = Form("skip"),
-):
-    """
-    Importe des lots depuis un CSV.
-    Colonnes attendues : product_name (ou product), product_barcode (optionnel),
-                         location, qty, best_before (optionnel), frozen_on (optionnel)
-    on_conflict ignoré ici (les lots ne sont pas des singletons — on crée toujours).
-    """
-    raw = await file.read(MAX_UPLOAD_SIZE + 1)
-    if len(raw) > MAX_UPLOAD_SIZE:
-        return JSONResponse(
-            {"ok": False, "error": "Fichier trop volumineux (max 10 Mo)."},
-            status_code=413,
-        )
-
-    try:
-        rows = _parse_csv(raw)
-    except Exception as e:
-        return JSONResponse({"ok": False, "error": f"Impossible de lire le CSV : {e}"}, status_code=400)
-
-    if not rows:
-        return JSONResponse({"ok": False, "error": "Fichier vide ou format invalide."}, status_code=400)
 
+def _import_lots_rows(rows: List[Dict[str, str]]) -> Dict[str, Any]:
+    """Crée les lots du CSV (pool DB, hors boucle asyncio)."""
     imported = 0
     errors: List[str] = []
     today = date.today().isoformat()
@@ -371,9 +339,70 @@ async def import_lots(
 
         c.commit()
 
-    return JSONResponse({
+    return {
         "ok": True,
         "imported": imported,
         "skipped": 0,
         "errors": errors,
-    })
+    }
+
+
+# ─── IMPORT PRODUITS ─────────────────────────────────────────────────────────
+
+@router.post("/import/products")
+async def import_products(
+    file: UploadFile = File(...),
+    on_conflict: str = Form("skip"),
+):
+    """
+    Importe des produits depuis un CSV.
+    on_conflict=skip  → ignorer les lignes dont le nom/barcode existe déjà
+    on_conflict=update → mettre à jour les produits existants
+    """
+    raw = await file.read(MAX_UPLOAD_SIZE + 1)
+    if len(raw) > MAX_UPLOAD_SIZE:
+        return JSONResponse(
+            {"ok": False, "error": "Fichier trop volumineux (max 10 Mo)."},
+            status_code=413,
+        )
+
+    try:
+        rows = await run_db(_parse_csv, raw)
+    except Exception as e:
+        return JSONResponse({"ok": False, "error": f"Impossible de lire le CSV : {e}"}, status_code=400)
+
+    if not rows:
+        return JSONResponse({"ok": False, "error": "Fichier vide ou format invalide."}, status_code=400)
+
+    return JSONResponse(await run_db(_import_products_rows, rows, on_conflict))
+
+
+# ─── IMPORT LOTS ─────────────────────────────────────────────────────────────
+
+@router.post("/import/lots")
+async def import_lots(
+    file: UploadFile = File(...),
+    on_conflict: str = Form("skip"),
+):
+    """
+    Importe des lots depuis un CSV.
+    Colonnes attendues : product_name (ou product), product_barcode (optionnel),
+                         location, qty, best_before (optionnel), frozen_on (optionnel)
+    on_conflict ignoré ici (les lots ne sont pas des singletons — on crée toujours).
+    """
+    raw = await file.read(MAX_UPLOAD_SIZE + 1)
+    if len(raw) > MAX_UPLOAD_SIZE:
+        return JSONResponse(
+            {"ok": False, "error": "Fichier trop volumineux (max 10 Mo)."},
+            status_code=413,
+        )
+
+    try:
+        rows = await run_db(_parse_csv, raw)
+    except Exception as e:
+        return JSONResponse({"ok": False, "error": f"Impossible de lire le CSV : {e}"}, status_code=400)
+
+    if not rows:
+        return JSONResponse({"ok": False, "error": "Fichier vide ou format invalide."}, status_code=400)
+
+    return JSONResponse(await run_db(_import_lots_rows, rows))
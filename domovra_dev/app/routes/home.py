@@ -1,10 +1,13 @@
 # domovra/app/routes/home.py
+import datetime
+
 from fastapi import APIRouter, Request
 from fastapi.responses import HTMLResponse, PlainTextResponse, JSONResponse
 
 from utils.http import ingress_base, render as render_with_env
 from config import get_retention_thresholds
-from db import list_locations, list_products, list_lots, status_for, get_product_info
+import db
+from db import list_locations, list_products, list_lots, classify_lots, get_product_info, write_generations
 
 router = APIRouter()
 
@@ -33,12 +36,13 @@ def _enabled_from(raw, default_int_0_or_1: int) -> bool:
     s = str(raw).strip().lower()
     return s not in ("0", "false", "off", "no")
 
-def _compute_low_products(products, lots, default_follow: int = 1):
+def _compute_low_products(products, lots, default_follow: int = 1, debug: bool = False):
     """
     Calcule la liste des produits en faible stock :
       - min_qty > 0
       - low_stock_enabled actif (ou fallback sur default_follow)
       - qty_total < min_qty
+    Le détail par produit (3e élément) n'est construit que si debug=True.
     """
     # Somme des quantités par produit
     totals = {}
@@ -61,17 +65,17 @@ def _compute_low_products(products, lots, default_follow: int = 1):
         qty_total = _to_float(totals.get(pid, 0.0), 0.0)
         enabled = _enabled_from(p.get("low_stock_enabled"), default_follow)
 
-        lack = max(0.0, min_qty - qty_total)
-        debug_per_product.append({
-            "id": pid,
-            "name": p.get("name"),
-            "enabled": enabled,
-            "low_stock_enabled_raw": p.get("low_stock_enabled"),
-            "default_follow": default_follow,
-            "min_qty": min_qty,
-            "qty_total": qty_total,
-            "lack": lack,
-        })
+        if debug:
+            debug_per_product.append({
+                "id": pid,
+                "name": p.get("name"),
+                "enabled": enabled,
+                "low_stock_enabled_raw": p.get("low_stock_enabled"),
+                "default_follow": default_follow,
+                "min_qty": min_qty,
+                "qty_total": qty_total,
+                "lack": max(0.0, min_qty - qty_total),
+            })
 
         if not enabled:
             continue
@@ -93,29 +97,35 @@ def _compute_low_products(products, lots, default_follow: int = 1):
     return totals, low_products, debug_per_product
 
 
-# --- Page accueil ------------------------------------------------------------
+# --- Modèle du tableau de bord (cache) ---------------------------------------
+
+# Partagé entre les requêtes (tablettes murales) :
+# recalculé seulement si stock / fiches / emplacements changent
+# (db_generation), au changement de jour (statuts DLC) ou de seuils.
+_DASHBOARD_TABLES = ("locations", "products", "stock_lots")
+_dashboard_cache: dict = {}
 
-@router.get("/", response_class=HTMLResponse)
-@router.get("//", response_class=HTMLResponse)
-def index(request: Request):
-    base = ingress_base(request)
+
+def _dashboard_model(WARNING_DAYS: int, CRITICAL_DAYS: int) -> dict:
+    gens = write_generations()
+    key = (db.DB_PATH, tuple(gens.get(t) for t in _DASHBOARD_TABLES), datetime.date.today(),
+           WARNING_DAYS, CRITICAL_DAYS)
+    cached = _dashboard_cache.get("model")
+    if cached is not None and cached[0] == key:
+        return cached[1]
 
     locations = list_locations() or []
     products  = list_products()  or []
     lots      = list_lots()      or []
 
-    # seuils dynamiques depuis /data/settings.json (fallback env/valeurs sûres)
-    WARNING_DAYS, CRITICAL_DAYS = get_retention_thresholds()
-
     # produits marqués "sans DLC / non périssable" — leurs lots n'apparaissent pas dans "À consommer en priorité"
     no_expiry_pids = {p["id"] for p in products if p.get("no_expiry")}
 
     # statut pour le bloc "À consommer en priorité"
+    classify_lots(lots, WARNING_DAYS, CRITICAL_DAYS)
     for it in lots:
         if it.get("product_id") in no_expiry_pids:
             it["status"] = "none"
-        else:
-            it["status"] = status_for(it.get("best_before"), WARNING_DAYS, CRITICAL_DAYS)
 
     # Sécurité : si une fiche n’a pas de préférence, on suit le stock (1)
     DEFAULT_LOW_STOCK = 1
@@ -125,17 +135,40 @@ def index(request: Request):
         products, lots, default_follow=DEFAULT_LOW_STOCK
     )
 
+    model = {
+        "locations": locations,
+        "products": products,
+        "lots": lots,
+        "low_products": low_products,
+        "totals": totals,
+    }
+    if None not in key[1]:          # tables non suivies : pas de cache
+        _dashboard_cache["model"] = (key, model)
+    return model
+
+
+# --- Page accueil ------------------------------------------------------------
+
+@router.get("/", response_class=HTMLResponse)
+@router.get("//", response_class=HTMLResponse)
+def index(request: Request):
+    base = ingress_base(request)
+
+    # seuils dynamiques depuis /data/settings.json (fallback env/valeurs sûres)
+    WARNING_DAYS, CRITICAL_DAYS = get_retention_thresholds()
+    model = _dashboard_model(WARNING_DAYS, CRITICAL_DAYS)
+
     return render_with_env(
         request.app.state.templates,
         "index.html",
         BASE=base,
         page="home",
         request=request,
-        locations=locations,
-        products=products,
-        lots=lots,
-        low_products=low_products,
-        totals=totals,  # ← IMPORTANT : passé au template pour le stock dans la liste
+        locations=model["locations"],
+        products=model["products"],
+        lots=model["lots"],
+        low_products=model["low_products"],
+        totals=model["totals"],  # ← IMPORTANT : passé au template pour le stock dans la liste
         WARNING_DAYS=WARNING_DAYS,
         CRITICAL_DAYS=CRITICAL_DAYS,
     )
@@ -151,12 +184,13 @@ def home_debug(request: Request):
     # seuils dynamiques pour le calcul des statuts
     WARNING_DAYS, CRITICAL_DAYS = get_retention_thresholds()
 
-    for it in lots:
-        it["status"] = status_for(it.get("best_before"), WARNING_DAYS, CRITICAL_DAYS)
+    classify_lots(lots, WARNING_DAYS, CRITICAL_DAYS)
 
     # Sécurité : suivre le stock par défaut si une fiche est incomplète
     DEFAULT_LOW_STOCK = 1
-    totals, low_products, dbg = _compute_low_products(products, lots, default_follow=DEFAULT_LOW_STOCK)
+    totals, low_products, dbg = _compute_low_products(
+        products, lots, default_follow=DEFAULT_LOW_STOCK, debug=True
+    )
 
     simple_products = [
         {
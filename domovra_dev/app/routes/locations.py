@@ -7,8 +7,7 @@ from utils.http import ingress_base
 from services.events import log_event
 
 from db import (
-    list_locations, list_lots,
-    status_for,
+    list_locations, location_status_counts,
     add_location, update_location, delete_location, move_lots_from_location,
 )
 from config import get_retention_thresholds
@@ -120,31 +119,21 @@ def location_delete(request: Request, location_id: int = Form(...), move_to: str
 @router.get("/_debug/locations")
 def debug_locations():
     items = list_locations()
-    lots = list_lots()
-
-    counts_total, counts_soon, counts_urg = {}, {}, {}
 
     # ← seuils dynamiques depuis /data/settings.json (fallback env/valeurs sûres)
     WARNING_DAYS, CRITICAL_DAYS = get_retention_thresholds()
-
-    for l in lots:
-        st = status_for(l.get("best_before"), WARNING_DAYS, CRITICAL_DAYS)
-        lid = int(l["location_id"])
-        counts_total[lid] = counts_total.get(lid, 0) + 1
-        if st == "yellow":
-            counts_soon[lid] = counts_soon.get(lid, 0) + 1
-        elif st == "red":
-            counts_urg[lid] = counts_urg.get(lid, 0) + 1
+    counts = location_status_counts(WARNING_DAYS, CRITICAL_DAYS)
 
     data = []
     for it in items:
         lid = int(it["id"])
+        cnt = counts.get(lid, {})
         data.append({
             "id": lid,
             "name": it["name"],
             "is_freezer": int(it.get("is_freezer") or 0),
-            "lot_count": int(counts_total.get(lid, 0)),
-            "soon_count": int(counts_soon.get(lid, 0)),
-            "urgent_count": int(counts_urg.get(lid, 0)),
+            "lot_count": int(cnt.get("total", 0)),
+            "soon_count": int(cnt.get("soon", 0)),
+            "urgent_count": int(cnt.get("urgent", 0)),
         })
-    return JSONResponse({"items": data, "total_lots": len(lots)})
+    return JSONResponse({"items": data, "total_lots": sum(c["total"] for c in counts.values())})
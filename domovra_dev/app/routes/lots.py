@@ -5,37 +5,47 @@ from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse
 from utils.http import ingress_base, render as render_with_env
 from services.events import log_event
 from services.ha_entities import schedule_ha_push
+from services import label_cache
 from config import get_retention_thresholds
 from db import (
-    list_lots, list_locations, list_products,
+    list_locations, list_products, query_lots,
     add_lot, update_lot, delete_lot, consume_lot,
-    status_for
 )
+from settings_store import load_settings
 
 router = APIRouter()
 
+LOTS_PAGE_SIZE = 60
+
+
+def _lots_query(q: str, product: str, location: str, status: str, hide_zero: bool,
+                limit: int | None, offset: int = 0):
+    WARNING_DAYS, CRITICAL_DAYS = get_retention_thresholds()
+    items, total = query_lots(q=q, product=product, location=location, status=status,
+                              hide_zero=hide_zero, warn_days=WARNING_DAYS, crit_days=CRITICAL_DAYS,
+                              limit=limit, offset=offset)
+    end = offset + len(items)
+    return items, total, (end if limit is not None and end < total else None)
+
+
+def _card_partials(request: Request):
+    """Module Jinja de la macro partagée avec lots.html (render_lot)."""
+    return request.app.state.templates.get_template("lots/_card.html").make_module({
+        "BASE": ingress_base(request),
+        "SETTINGS": load_settings(),
+    })
+
+
 @router.get("/lots", response_class=HTMLResponse)
 def lots_page(
     request: Request,
+    q: str = Query(""),
     product: str = Query("", alias="product"),
     location: str = Query("", alias="location"),
     status: str = Query("", alias="status"),
 ):
     base = ingress_base(request)
-
-    WARNING_DAYS, CRITICAL_DAYS = get_retention_thresholds()
-
-    items = list_lots()
-    for it in items:
-        it["status"] = status_for(it.get("best_before"), WARNING_DAYS, CRITICAL_DAYS)
-
-    if product:
-        needle = product.casefold()
-        items = [i for i in items if needle in (i.get("product", "").casefold())]
-    if location:
-        items = [i for i in items if i.get("location") == location]
-    if status:
-        items = [i for i in items if i.get("status") == status]
+    items, total, next_offset = _lots_query(q, product, location, status, False, LOTS_PAGE_SIZE)
 
     return render_with_env(
         request.app.state.templates,
@@ -44,11 +54,35 @@ def lots_page(
         page="lots",
         request=request,
         items=items,
+        total=total,
+        next_offset=next_offset,
+        filters={"q": q, "product": product, "location": location, "status": status},
         locations=list_locations(),
         products=list_products(),
     )
 
 
+@router.get("/api/lots")
+def lots_api(
+    request: Request,
+    q: str = Query(""),
+    product: str = Query(""),
+    location: str = Query(""),
+    status: str = Query(""),
+    hide_zero: bool = Query(False),
+    offset: int = Query(0, ge=0),
+    limit: int = Query(LOTS_PAGE_SIZE, ge=1, le=500),
+    html: bool = Query(True),
+):
+    """Page de lots filtrés (défilement de la page Stocks) : données + cartes HTML."""
+    items, total, next_offset = _lots_query(q, product, location, status, hide_zero, limit, offset)
+    payload = {"items": items, "total": total, "offset": offset, "next_offset": next_offset}
+    if html:
+        partials = _card_partials(request)
+        payload["html"] = "".join(str(partials.render_lot(it)) for it in items)
+    return JSONResponse(payload, headers={"Cache-Control": "no-store"})
+
+
 @router.post("/lot/add")
 def lot_add_action(request: Request,
                    product_id: int = Form(...),
@@ -61,7 +95,8 @@ def lot_add_action(request: Request,
     if q <= 0:
         return RedirectResponse(base + "lots?error=qty_invalid",
                                 status_code=303, headers={"Cache-Control": "no-store"})
-    add_lot(product_id, location_id, q, frozen_on or None, best_before or None)
+    lot_id = add_lot(product_id, location_id, q, frozen_on or None, best_before or None)
+    label_cache.schedule_prerender([lot_id])
     log_event("lot.add", {
         "product_id": product_id, "location_id": location_id, "qty": q,
         "frozen_on": frozen_on or None, "best_before": best_before or None
@@ -87,6 +122,9 @@ def lot_update_action(request: Request,
         return RedirectResponse(base + "lots?error=qty_invalid",
                                 status_code=303, headers={"Cache-Control": "no-store"})
     update_lot(lot_id, q, int(location_id), frozen_on or None, best_before or None)
+    # Qté / lieu / DLC figurent sur l'étiquette : payload en cache périmé
+    label_cache.invalidate(lot_id)
+    label_cache.schedule_prerender([lot_id])
     log_event("lot.update", {
         "lot_id": lot_id, "qty": q, "location_id": int(location_id),
         "frozen_on": frozen_on or None, "best_before": best_before or None
@@ -122,6 +160,7 @@ def lot_delete_action(request: Request, lot_id: int = Form(...)):
     if not affected:
         return RedirectResponse(base + "lots?deleted=1", status_code=303, headers={"Cache-Control": "no-store"})
 
+    label_cache.invalidate(lot_id)
     try:
         log_event("lot.delete", {"lot_id": lot_id})
     except Exception:
@@ -139,20 +178,7 @@ def debug_lots(
     location: str = Query("", alias="location"),
     status: str = Query("", alias="status"),
 ):
-    WARNING_DAYS, CRITICAL_DAYS = get_retention_thresholds()
-
-    items = list_lots()
-
-    for it in items:
-        it["status"] = status_for(it.get("best_before"), WARNING_DAYS, CRITICAL_DAYS)
-
-    if product:
-        needle = product.casefold()
-        items = [i for i in items if needle in (i.get("product", "").casefold())]
-    if location:
-        items = [i for i in items if i.get("location") == location]
-    if status:
-        items = [i for i in items if i.get("status") == status]
+    items, _, _ = _lots_query("", product, location, status, False, None)
 
     counts = {"total": len(items), "by_status": {"green": 0, "yellow": 0, "red": 0}}
     for it in items:
@@ -5,8 +5,8 @@ Transport : BLE GATT via raw L2CAP ATT (sans D-Bus/bluetoothd).
 """
 from __future__ import annotations
 
+import asyncio
 import logging
-import threading
 
 from fastapi import APIRouter, Request
 from fastapi.responses import JSONResponse, Response
@@ -15,6 +15,7 @@ from settings_store import load_settings
 from db import list_lots
 from config import get_retention_thresholds
 from db import status_for
+from utils.db_pool import run_db
 
 logger = logging.getLogger("domovra.print_route")
 
@@ -22,6 +23,16 @@ router = APIRouter()
 _BLE_TIMEOUT = 35.0
 
 
+async def _print_payload(mac: str, payload: bytes, rescan: bool = False) -> JSONResponse:
+    """Envoi direct sur la session BLE (pilote asyncio, délai global _BLE_TIMEOUT)."""
+    from services.printer import print_ble_async
+    result = await print_ble_async(mac, payload, timeout=_BLE_TIMEOUT, rescan=rescan)
+    if result.get("timeout"):
+        return JSONResponse({"ok": False, "error": "timeout",
+                             "message": f"Timeout ({_BLE_TIMEOUT:.0f}s) — imprimante allumee ?"}, status_code=504)
+    return JSONResponse(result)
+
+
 def _get_printer_mac() -> str | None:
     s = load_settings()
     if not s.get("printer_enabled"):
@@ -47,38 +58,87 @@ async def print_lot_label(request: Request, lot_id: int):
                              "message": f"Lot {lot_id} introuvable."}, status_code=404)
     lot["status"] = status_for(lot.get("best_before"), WARNING_DAYS, CRITICAL_DAYS)
     try:
-        from services.printer import _build_payload, print_ble
-        payload = _build_payload(lot, ble=True)
-
-        result: dict = {}
-        exc: list[Exception] = []
-        done = threading.Event()
-
-        def _run():
-            try:
-                result.update(print_ble(mac, payload, timeout=_BLE_TIMEOUT))
-            except Exception as e:
-                exc.append(e)
-            finally:
-                done.set()
-
-        t = threading.Thread(target=_run, daemon=True)
-        t.start()
-        import asyncio
-        loop = asyncio.get_event_loop()
-        await loop.run_in_executor(None, done.wait, _BLE_TIMEOUT + 5)
-
-        if exc:
-            raise exc[0]
-        if not result:
-            return JSONResponse({"ok": False, "error": "timeout",
-                                 "message": f"Timeout ({_BLE_TIMEOUT:.0f}s) — imprimante allumee ?"}, status_code=504)
-        return JSONResponse(result)
+        from services.label_cache import payload_for
+        return await _print_payload(mac, await asyncio.to_thread(payload_for, lot))
     except Exception as e:
         logger.exception("Impression lot %s: %s", lot_id, e)
         return JSONResponse({"ok": False, "error": "unexpected", "message": str(e)}, status_code=500)
 
 
+@router.post("/api/print/lots")
+async def print_lots_batch(request: Request):
+    """
+    Impression groupée : {"lot_ids": [..]} ou {"shopping_commit": id}.
+    Le job est mis en file (un worker par imprimante) ; suivi via
+    GET /api/print/jobs/{job_id}.
+    """
+    mac = _get_printer_mac()
+    if not mac:
+        return JSONResponse(
+            {"ok": False, "error": "printer_disabled",
+             "message": "Imprimante non configuree ou desactivee dans les Parametres."},
+            status_code=400,
+        )
+    try:
+        body = await request.json()
+    except Exception:
+        body = None
+    if not isinstance(body, dict):
+        return JSONResponse({"ok": False, "error": "bad_request"}, status_code=400)
+
+    from services import print_queue
+
+    if body.get("shopping_commit") is not None:
+        try:
+            commit_id = int(body["shopping_commit"])
+        except (TypeError, ValueError):
+            return JSONResponse({"ok": False, "error": "bad_request"}, status_code=400)
+        lot_ids = await run_db(print_queue.lots_from_shopping_commit, commit_id)
+        if lot_ids is None:
+            return JSONResponse({"ok": False, "error": "not_found",
+                                 "message": f"Commit {commit_id} introuvable."}, status_code=404)
+        source = f"shopping_commit:{commit_id}"
+    else:
+        try:
+            lot_ids = [int(i) for i in body.get("lot_ids") or []]
+        except (TypeError, ValueError):
+            return JSONResponse({"ok": False, "error": "bad_request"}, status_code=400)
+        source = "lots"
+    if not lot_ids:
+        return JSONResponse({"ok": False, "error": "empty", "message": "Aucun lot a imprimer."},
+                            status_code=400)
+    if len(lot_ids) > print_queue.MAX_JOB_LOTS:
+        return JSONResponse({"ok": False, "error": "too_many",
+                             "message": f"{print_queue.MAX_JOB_LOTS} lots maximum par job."},
+                            status_code=400)
+
+    job = print_queue.submit(mac, lot_ids, source=source)
+    return JSONResponse({"ok": True, "job": job}, status_code=202)
+
+
+@router.get("/api/print/jobs")
+async def print_jobs_list(request: Request):
+    from services import print_queue
+    return JSONResponse({"ok": True, "jobs": print_queue.list_jobs()})
+
+
+@router.get("/api/print/jobs/{job_id}")
+async def print_job_status(request: Request, job_id: int):
+    from services import print_queue
+    job = print_queue.get_job(job_id)
+    if job is None:
+        return JSONResponse({"ok": False, "error": "not_found"}, status_code=404)
+    return JSONResponse({"ok": True, "job": job})
+
+
+@router.delete("/api/print/jobs/{job_id}")
+async def print_job_cancel(request: Request, job_id: int):
+    from services import print_queue
+    if not print_queue.cancel(job_id):
+        return JSONResponse({"ok": False, "error": "not_cancellable"}, status_code=409)
+    return JSONResponse({"ok": True, "job": print_queue.get_job(job_id)})
+
+
 @router.post("/api/print/test")
 async def print_test_label(request: Request):
     mac = _get_printer_mac()
@@ -89,40 +149,10 @@ async def print_test_label(request: Request):
             status_code=400,
         )
     try:
-        from services.printer import _build_payload, print_ble
-        payload = _build_payload({
-            "name": "Etiquette de test",
-            "qty": "1", "unit": "pc",
-            "best_before": "2099-12-31",
-            "status": "green",
-            "location": "Domovra M110",
-            "brand": "Test", "store": "",
-        }, ble=True)
-
-        result: dict = {}
-        exc: list[Exception] = []
-        done = threading.Event()
-
-        def _run():
-            try:
-                result.update(print_ble(mac, payload, timeout=_BLE_TIMEOUT))
-            except Exception as e:
-                exc.append(e)
-            finally:
-                done.set()
-
-        t = threading.Thread(target=_run, daemon=True)
-        t.start()
-        import asyncio
-        loop = asyncio.get_event_loop()
-        await loop.run_in_executor(None, done.wait, _BLE_TIMEOUT + 5)
-
-        if exc:
-            raise exc[0]
-        if not result:
-            return JSONResponse({"ok": False, "error": "timeout",
-                                 "message": f"Timeout ({_BLE_TIMEOUT:.0f}s) — imprimante allumee ?"}, status_code=504)
-        return JSONResponse(result)
+        from services.printer import _TEST_DATA, _build_payload
+        # ?rescan=1 : ignore le handle en cache (imprimante changée / firmware)
+        rescan = request.query_params.get("rescan") in ("1", "true")
+        return await _print_payload(mac, _build_payload(_TEST_DATA, ble=True), rescan=rescan)
     except Exception as e:
         logger.exception("Impression test: %s", e)
         return JSONResponse({"ok": False, "error": "unexpected", "message": str(e)}, status_code=500)
@@ -134,38 +164,15 @@ async def ble_diagnostic(request: Request):
     mac = _get_printer_mac()
     if not mac:
         return JSONResponse({"ok": False, "message": "Imprimante non configuree."}, status_code=400)
+    from services.printer import _ble_connect_async
     try:
-        from services.printer import _ble_connect
-        import asyncio
-        loop = asyncio.get_event_loop()
-
-        result: dict = {}
-        exc: list[Exception] = []
-        done = threading.Event()
-
-        def _run():
-            try:
-                sock = _ble_connect(mac, timeout=15.0)
-                sock.close()
-                result["ok"] = True
-                result["message"] = f"Connexion BLE ATT reussie vers {mac}"
-            except TimeoutError as e:
-                result["ok"] = False
-                result["error"] = str(e)
-            except OSError as e:
-                result["ok"] = False
-                result["error"] = f"Erreur BLE : {e}"
-            except Exception as e:
-                result["ok"] = False
-                result["error"] = str(e)
-            finally:
-                done.set()
-
-        threading.Thread(target=_run, daemon=True).start()
-        await loop.run_in_executor(None, done.wait, 20)
-        if not result:
-            result = {"ok": False, "error": "Timeout diagnostic 20s"}
-        return JSONResponse(result)
+        sock = await _ble_connect_async(mac, timeout=15.0)
+        sock.close()
+        return JSONResponse({"ok": True, "message": f"Connexion BLE ATT reussie vers {mac}"})
+    except TimeoutError as e:
+        return JSONResponse({"ok": False, "error": str(e)})
+    except OSError as e:
+        return JSONResponse({"ok": False, "error": f"Erreur BLE : {e}"})
     except Exception as e:
         logger.exception("Diagnostic BLE : %s", e)
         return JSONResponse({"ok": False, "error": str(e)}, status_code=500)
@@ -174,39 +181,26 @@ async def ble_diagnostic(request: Request):
 @router.get("/api/print/discover")
 async def discover_ble(request: Request):
     """
-    Decouverte GATT complete via raw L2CAP ATT.
+    Decouverte GATT complete via raw L2CAP ATT (resultat en cache par MAC,
+    ?force=1 pour refaire le parcours).
     L'imprimante doit etre allumee et en mode attente.
     """
     mac = _get_printer_mac()
     if not mac:
         return JSONResponse({"ok": False, "message": "Imprimante non configuree."}, status_code=400)
 
+    from services.printer import discover_ble_async
     try:
-        from services.printer import discover_ble as _discover
-        import asyncio
-        loop = asyncio.get_event_loop()
-
-        result: dict = {}
-        exc: list[Exception] = []
-        done = threading.Event()
-
-        def _run():
-            try:
-                result.update(_discover(mac, timeout=_BLE_TIMEOUT))
-            except Exception as e:
-                exc.append(e)
-                result["ok"] = False
-                result["error"] = str(e)
-            finally:
-                done.set()
-
-        threading.Thread(target=_run, daemon=True).start()
-        await loop.run_in_executor(None, done.wait, _BLE_TIMEOUT + 5)
-
-        if not result:
-            return JSONResponse({"ok": False, "error": f"Timeout {_BLE_TIMEOUT:.0f}s — imprimante allumee ?"},
-                                status_code=504)
+        # Découverte GATT complète (outil de diagnostic ponctuel) : bloquante,
+        # dans un thread, après fermeture de la session d'impression sous son
+        # verrou ; bornée par le même délai que l'impression.
+        force = request.query_params.get("force") in ("1", "true")
+        result = await asyncio.wait_for(discover_ble_async(mac, _BLE_TIMEOUT, force),
+                                        _BLE_TIMEOUT + 5)
         return JSONResponse(result)
+    except asyncio.TimeoutError:
+        return JSONResponse({"ok": False, "error": f"Timeout {_BLE_TIMEOUT:.0f}s — imprimante allumee ?"},
+                            status_code=504)
     except Exception as e:
         logger.exception("Decouverte BLE : %s", e)
         return JSONResponse({"ok": False, "error": str(e)}, status_code=500)
@@ -1,7 +1,9 @@
 from fastapi import APIRouter, Request, Form
 from fastapi.responses import HTMLResponse, RedirectResponse
 from urllib.parse import urlencode
+import datetime
 import json
+import threading
 
 from utils.http import ingress_base, render as render_with_env
 from services.events import log_event
@@ -12,7 +14,9 @@ from db import (
     add_lot, list_lots, consume_lot,
     list_price_history_for_product,
     current_stock_value_by_product,
+    data_version, product_generations,
 )
+import db
 
 router = APIRouter()
 
@@ -75,17 +79,62 @@ def _to_base_qty(q: float, unit: str) -> tuple[float, str]:
     return q, "pc"
 
 # -------------------------------------------------------------------
-# Routes Produits
+# Blocs par produit (historique de prix, insights) mis en cache
 # -------------------------------------------------------------------
-
-@router.get("/products", response_class=HTMLResponse)
-def products_page(request: Request):
-    base = ingress_base(request)
-
+# Invalidés produit par produit via product_generation (triggers SQL sur
+# lots, mouvements et fiche) ; la date entre dans la clé car les insights
+# (taux de périmés) dépendent du jour.
+
+_product_blocks: dict = {}   # {(DB_PATH, pid): ((gen, jour), bloc)}
+_product_blocks_lock = threading.Lock()   # routes sync : threadpool
+
+
+def _product_blocks_for(pids: list[int]) -> dict[int, dict]:
+    gens = product_generations()
+    today = datetime.date.today().isoformat()
+    out: dict[int, dict] = {}
+    stale = []
+    with _product_blocks_lock:
+        for pid in pids:
+            hit = _product_blocks.get((db.DB_PATH, pid))
+            if hit is not None and hit[0] == (gens.get(pid, 0), today):
+                out[pid] = hit[1]
+            else:
+                stale.append(pid)
+
+    # Requêtes hors verrou ; seules les lectures / écritures du cache sont protégées
+    fresh: dict[int, dict] = {}
+    if stale:
+        insights = list_product_insights(None if len(stale) == len(pids) else stale)
+        for pid in stale:
+            hist = list_price_history_for_product(pid, limit=10) or []
+            fresh[pid] = {
+                "price_history": hist,
+                "price_history_json": json.dumps(hist, ensure_ascii=False),
+                "insights": insights.get(pid),
+            }
+        out.update(fresh)
+
+    live = set(pids)
+    with _product_blocks_lock:
+        for pid, block in fresh.items():
+            _product_blocks[(db.DB_PATH, pid)] = ((gens.get(pid, 0), today), block)
+        # Produits supprimés
+        for key in [k for k in _product_blocks if k[0] == db.DB_PATH and k[1] not in live]:
+            del _product_blocks[key]
+    return out
+
+
+# Tables lues par la page Produits (jeton de version du cache de rendu)
+_PRODUCTS_PAGE_TABLES = ("products", "stock_lots", "locations", "movements", "product_barcodes")
+
+
+def _products_context() -> dict:
     items = list_products_with_stats()
     locations = list_locations()
     parents = list_products()
-    insights = list_product_insights()
+    blocks = _product_blocks_for([int(it["id"]) for it in items])
+    insights = {pid: b["insights"] for pid, b in blocks.items() if b["insights"] is not None}
     stock_values = current_stock_value_by_product()
 
     # 1) On indexe le DERNIER lot saisi par produit (même logique d'ordre que /lots)
@@ -106,8 +155,8 @@ def products_page(request: Request):
         pid = int(it["id"])
 
         # (A) Historique pour le graphe (pas utilisé pour le calcul)
-        hist = list_price_history_for_product(pid, limit=10) or []
-        it["price_history_json"] = json.dumps(hist, ensure_ascii=False)
+        hist = blocks[pid]["price_history"]
+        it["price_history_json"] = blocks[pid]["price_history_json"]
 
         # (B) Calcule le dernier prix unitaire à partir du *dernier lot* (exact /lots)
         last_unit = None
@@ -157,17 +206,32 @@ def products_page(request: Request):
 
     loc_map = {str(loc["id"]): loc["name"] for loc in (locations or [])}
 
+    return {
+        "items": items,
+        "locations": locations,
+        "parents": parents,
+        "insights": insights,
+        "loc_map": loc_map,
+    }
+
+
+# -------------------------------------------------------------------
+# Routes Produits
+# -------------------------------------------------------------------
+
+@router.get("/products", response_class=HTMLResponse)
+def products_page(request: Request):
+    base = ingress_base(request)
+    version = data_version(*_PRODUCTS_PAGE_TABLES)
+
     return render_with_env(
         request.app.state.templates,
         "products.html",
+        version=(version, datetime.date.today().isoformat()) if version else None,
+        build=_products_context,
         BASE=base,
         page="products",
         request=request,
-        items=items,
-        locations=locations,
-        parents=parents,
-        insights=insights,
-        loc_map=loc_map,
     )
 
 # -------------------------------------------------------------------
@@ -45,6 +45,8 @@ except Exception:  # pragma: no cover
         # Imprimante
         "printer_enabled": False,
         "printer_mac": "",
+        "printer_prerender": False,
+        "printer_ble_cache": {},
     }
 
     def _env_int(name: str, default: int) -> int:
@@ -83,7 +85,7 @@ except Exception:  # pragma: no cover
         return data
 
 # --- Données pour Emplacements & Admin DB ---
-from db import list_locations, list_lots, status_for
+from db import list_locations, location_status_counts
 from config import DB_PATH, get_retention_thresholds
 
 router = APIRouter()
@@ -222,24 +224,12 @@ def settings_page(
         WARN_DAYS, CRIT_DAYS = get_retention_thresholds()
 
         items = list_locations()
-        counts_total: dict[int, int] = {}
-        counts_soon:  dict[int, int] = {}
-        counts_urg:   dict[int, int] = {}
-
-        for l in list_lots():
-            st = status_for(l.get("best_before"), WARN_DAYS, CRIT_DAYS)
-            lid = int(l["location_id"])
-            counts_total[lid] = counts_total.get(lid, 0) + 1
-            if st == "yellow":
-                counts_soon[lid] = counts_soon.get(lid, 0) + 1
-            elif st == "red":
-                counts_urg[lid] = counts_urg.get(lid, 0) + 1
-
+        counts = location_status_counts(WARN_DAYS, CRIT_DAYS)
         for it in items:
-            lid = int(it["id"])
-            it["lot_count"]    = int(counts_total.get(lid, 0))
-            it["soon_count"]   = int(counts_soon.get(lid, 0))
-            it["urgent_count"] = int(counts_urg.get(lid, 0))
+            cnt = counts.get(int(it["id"]), {})
+            it["lot_count"]    = int(cnt.get("total", 0))
+            it["soon_count"]   = int(cnt.get("soon", 0))
+            it["urgent_count"] = int(cnt.get("urgent", 0))
 
         events = list_events(jlimit)
 
@@ -300,6 +290,7 @@ def settings_save(
     # Imprimante BLE
     printer_enabled: str = Form(None),
     printer_mac: str = Form(""),
+    printer_prerender: str = Form(None),
 ):
     base = ingress_base(request)
 
@@ -341,6 +332,9 @@ def settings_save(
         # Imprimante BLE
         "printer_enabled": as_bool(printer_enabled),
         "printer_mac": (printer_mac or "").strip().upper(),
+        "printer_prerender": as_bool(printer_prerender),
+        # Non éditable dans le formulaire : conservé tel quel
+        "printer_ble_cache": load_settings().get("printer_ble_cache", {}),
     }
     try:
         saved = save_settings(normalized)
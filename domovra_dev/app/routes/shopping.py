@@ -7,11 +7,12 @@ from datetime import datetime, date
 from typing import Optional, List, Dict, Any
 
 from fastapi import APIRouter, Request, Form, Query
-from fastapi.responses import RedirectResponse, HTMLResponse
+from fastapi.responses import RedirectResponse, HTMLResponse, JSONResponse
 
-from utils.http import ingress_base, render as render_with_env
+from utils.http import ingress_base, render as render_with_env, wants_json
 from services.events import log_event
-from db import list_locations as db_list_locations
+from services import label_cache
+from db import list_locations as db_list_locations, search_products
 from services.ha_entities import schedule_ha_push
 
 router = APIRouter(tags=["Shopping"])
@@ -37,65 +38,6 @@ def table_has_column(conn: sqlite3.Connection, table: str, column: str) -> bool:
     return column in cols
 
 
-def init_db():
-    conn = get_db()
-    cur = conn.cursor()
-    cur.execute(
-        """
-        CREATE TABLE IF NOT EXISTS shopping_lists(
-          id INTEGER PRIMARY KEY,
-          name TEXT NOT NULL,
-          emoji TEXT NULL,
-          color TEXT NULL,
-          created_at TEXT NOT NULL
-        );
-        """
-    )
-    cur.execute(
-        """
-        CREATE TABLE IF NOT EXISTS shopping_items(
-          id INTEGER PRIMARY KEY,
-          list_id INTEGER NOT NULL REFERENCES shopping_lists(id) ON DELETE CASCADE,
-          product_id INTEGER NOT NULL REFERENCES products(id),
-          qty REAL DEFAULT 1,
-          unit TEXT NULL,
-          note TEXT NULL,
-          is_checked INTEGER DEFAULT 0,
-          purchased_at TEXT NULL,
-          store TEXT NULL,
-          shelf_unit_price REAL NULL,
-          ticket_unit_price REAL NULL,
-          price_delta REAL NULL,
-          position INTEGER NOT NULL,
-          created_at TEXT NOT NULL
-        );
-        """
-    )
-    # Migrations F18
-    migrations = [
-        ("shopping_items", "qty_bought",
-         "ALTER TABLE shopping_items ADD COLUMN qty_bought REAL NULL"),
-        ("shopping_items", "best_before",
-         "ALTER TABLE shopping_items ADD COLUMN best_before TEXT NULL"),
-        ("shopping_items", "location_id",
-         "ALTER TABLE shopping_items ADD COLUMN location_id INTEGER NULL"),
-        ("shopping_items", "committed",
-         "ALTER TABLE shopping_items ADD COLUMN committed INTEGER NOT NULL DEFAULT 0"),
-    ]
-    for tbl, col, sql in migrations:
-        if not table_has_column(conn, tbl, col):
-            cur.execute(sql)
-
-    cur.execute("CREATE INDEX IF NOT EXISTS idx_items_list ON shopping_items(list_id, position);")
-    cur.execute("CREATE INDEX IF NOT EXISTS idx_items_checked ON shopping_items(list_id, is_checked);")
-    cur.execute("CREATE INDEX IF NOT EXISTS idx_items_product ON shopping_items(product_id);")
-    conn.commit()
-    conn.close()
-
-
-init_db()
-
-
 # ---------- Queries ----------
 def ensure_default_list(conn) -> int:
     cur = conn.cursor()
@@ -138,17 +80,16 @@ def fetch_products(conn, q: Optional[str] = None, limit: int = 200) -> List[Dict
     if has_barcode:
         select_cols.append("barcode")
 
-    where_parts = ["name LIKE ?"]
+    if q and q.strip():
+        # Recherche classée via l'index FTS5 (préfixes, accents, tous les EAN)
+        rows = search_products(q, limit, conn)
+        for r in rows:
+            r.setdefault("unit", None)
+            r.setdefault("barcode", None)
+        return rows
+
+    where_sql = ""
     params: List[Any] = []
-    if q:
-        qlike = f"%{q.strip()}%"
-        params.append(qlike)
-        if has_barcode:
-            where_parts.append("barcode LIKE ?")
-            params.append(qlike)
-        where_sql = " WHERE " + " OR ".join(where_parts)
-    else:
-        where_sql = ""
 
     sql = f"""
         SELECT {", ".join(select_cols)}
@@ -168,6 +109,28 @@ def fetch_products(conn, q: Optional[str] = None, limit: int = 200) -> List[Dict
     return rows
 
 
+_ITEM_SELECT = """
+    SELECT I.*,
+           P.name AS product_name,
+           P.unit AS product_unit,
+           COALESCE(P.category, 'Divers') AS category,
+           COALESCE(P.default_location_id, 0) AS product_default_location_id,
+           COALESCE(P.default_shelf_life_days, 90) AS product_shelf_days,
+           COALESCE(P.no_expiry, 0) AS product_no_expiry
+    FROM shopping_items I
+    JOIN products P ON P.id = I.product_id
+"""
+
+
+def _item_defaults(r: Dict[str, Any]) -> Dict[str, Any]:
+    r.setdefault("product_unit", None)
+    r.setdefault("category", "Divers")
+    r.setdefault("product_default_location_id", 0)
+    r.setdefault("product_shelf_days", 90)
+    r.setdefault("product_no_expiry", 0)
+    return r
+
+
 def fetch_items(conn, list_id: int, status: Optional[str] = None) -> List[Dict[str, Any]]:
     where_status = ""
     params: List[Any] = [list_id]
@@ -177,29 +140,22 @@ def fetch_items(conn, list_id: int, status: Optional[str] = None) -> List[Dict[s
         where_status = "AND I.is_checked=1"
 
     sql = f"""
-        SELECT I.*,
-               P.name AS product_name,
-               P.unit AS product_unit,
-               COALESCE(P.category, 'Divers') AS category,
-               COALESCE(P.default_location_id, 0) AS product_default_location_id,
-               COALESCE(P.default_shelf_life_days, 90) AS product_shelf_days,
-               COALESCE(P.no_expiry, 0) AS product_no_expiry
-        FROM shopping_items I
-        JOIN products P ON P.id = I.product_id
+        {_ITEM_SELECT}
         WHERE I.list_id = ?
         {where_status}
         ORDER BY I.is_checked ASC, I.position ASC, I.id ASC;
     """
     cur = conn.cursor()
     cur.execute(sql, params)
-    rows = [dict(r) for r in cur.fetchall()]
-    for r in rows:
-        r.setdefault("product_unit", None)
-        r.setdefault("category", "Divers")
-        r.setdefault("product_default_location_id", 0)
-        r.setdefault("product_shelf_days", 90)
-        r.setdefault("product_no_expiry", 0)
-    return rows
+    return [_item_defaults(dict(r)) for r in cur.fetchall()]
+
+
+def fetch_item(conn, item_id: int) -> Optional[Dict[str, Any]]:
+    """Un seul article (mêmes colonnes que fetch_items) — utilisé par les réponses partielles."""
+    cur = conn.cursor()
+    cur.execute(f"{_ITEM_SELECT} WHERE I.id = ?;", (item_id,))
+    row = cur.fetchone()
+    return _item_defaults(dict(row)) if row else None
 
 
 def fetch_purchased_today(conn, list_id: int) -> List[Dict[str, Any]]:
@@ -258,6 +214,92 @@ def count_to_commit(conn, list_id: int) -> int:
     return int(row["n"]) if row else 0
 
 
+def fetch_counters(conn, list_id: int) -> Dict[str, Any]:
+    """
+    Compteurs affichés dans l'en-tête / la barre de la page (une seule requête) :
+    total, done, to_buy, to_commit + anomalies / total_delta du ticket du jour.
+    Même logique que page_shopping, sans recharger les articles.
+    """
+    today = date.today().isoformat()
+    cur = conn.cursor()
+    cur.execute(
+        """
+        SELECT COUNT(*) AS total,
+               COALESCE(SUM(CASE WHEN is_checked=1 THEN 1 ELSE 0 END), 0) AS done,
+               COALESCE(SUM(CASE WHEN is_checked=1 AND committed=0 THEN 1 ELSE 0 END), 0) AS to_commit,
+               COALESCE(SUM(CASE WHEN d IS NOT NULL AND ABS(d) > 0.009 THEN 1 ELSE 0 END), 0) AS anomalies,
+               COALESCE(SUM(d), 0) AS total_delta
+        FROM (
+          SELECT is_checked, committed,
+                 CASE WHEN is_checked=1 AND purchased_at IS NOT NULL
+                           AND substr(purchased_at, 1, 10) = ?
+                      THEN COALESCE(price_delta, ticket_unit_price - shelf_unit_price)
+                 END AS d
+          FROM shopping_items
+          WHERE list_id = ?
+        );
+        """,
+        (today, list_id),
+    )
+    row = cur.fetchone()
+    total = int(row["total"] or 0)
+    done = int(row["done"] or 0)
+    return {
+        "total": total,
+        "done": done,
+        "to_buy": total - done,
+        "to_commit": int(row["to_commit"] or 0),
+        "anomalies": int(row["anomalies"] or 0),
+        "total_delta": round(float(row["total_delta"] or 0), 2),
+    }
+
+
+def _item_partials(request: Request, list_id: int):
+    """Module Jinja des macros partagées avec shopping.html (render_item, render_ticket_row)."""
+    templates_env = request.app.state.templates
+    return templates_env.get_template("shopping/_item.html").make_module({
+        "BASE": ingress_base(request),
+        "ACTIVE_LIST_ID": list_id,
+        "LOCATIONS": db_list_locations(),
+    })
+
+
+def partial_response(
+    request: Request,
+    conn,
+    list_id: int,
+    toast: str,
+    item_id: Optional[int] = None,
+    deleted: bool = False,
+) -> JSONResponse:
+    """
+    Réponse partielle pour les actions article (fetch avec Accept: application/json) :
+    uniquement l'article modifié (données + HTML) et les compteurs de la liste,
+    au lieu d'un redirect 303 qui recharge toute la page /shopping.
+    Si l'article fait partie des achats du jour, la ligne du contrôle ticket
+    est renvoyée aussi (ticket_html).
+    """
+    payload: Dict[str, Any] = {"ok": True, "toast": toast, "list_id": list_id}
+    if item_id is not None:
+        payload["item_id"] = item_id
+        if deleted:
+            payload["deleted"] = True
+        else:
+            item = fetch_item(conn, item_id)
+            if item is None:
+                return JSONResponse({"ok": False, "toast": "error", "item_id": item_id}, status_code=404)
+            partials = _item_partials(request, list_id)
+            payload["item"] = item
+            payload["html"] = str(partials.render_item(item))
+            purchased = item.get("purchased_at") or ""
+            if item.get("is_checked") and purchased[:10] == date.today().isoformat():
+                s, t = item.get("shelf_unit_price"), item.get("ticket_unit_price")
+                item["computed_delta"] = (float(t) - float(s)) if s is not None and t is not None else None
+                payload["ticket_html"] = str(partials.render_ticket_row(item))
+    payload["counters"] = fetch_counters(conn, list_id)
+    return JSONResponse(payload, headers={"Cache-Control": "no-store"})
+
+
 # ---------- Routes ----------
 @router.get("/shopping", response_class=HTMLResponse)
 def page_shopping(
@@ -406,6 +448,8 @@ def toggle_item(request: Request, item_id: int = Form(...), list_id: int = Form(
         cur.execute("SELECT is_checked FROM shopping_items WHERE id=?", (item_id,))
         row = cur.fetchone()
         if not row:
+            if wants_json(request):
+                return JSONResponse({"ok": False, "toast": "error", "item_id": item_id}, status_code=404)
             url = f"{ingress_base(request)}shopping?list={list_id}&toast=error"
             return RedirectResponse(url, status_code=303)
         was_checked = int(row["is_checked"] or 0) == 1
@@ -434,6 +478,8 @@ def toggle_item(request: Request, item_id: int = Form(...), list_id: int = Form(
             )
         conn.commit()
         log_event("shopping", f"Toggle item id={item_id} -> {0 if was_checked else 1}")
+        if wants_json(request):
+            return partial_response(request, conn, list_id, "toggled", item_id=item_id)
         url = f"{ingress_base(request)}shopping?list={list_id}&toast=toggled"
         return RedirectResponse(url, status_code=303)
     finally:
@@ -448,6 +494,8 @@ def delete_item(request: Request, item_id: int = Form(...), list_id: int = Form(
         cur.execute("DELETE FROM shopping_items WHERE id=?", (item_id,))
         conn.commit()
         log_event("shopping", f"Suppression item id={item_id}")
+        if wants_json(request):
+            return partial_response(request, conn, list_id, "deleted_item", item_id=item_id, deleted=True)
         url = f"{ingress_base(request)}shopping?list={list_id}&toast=deleted_item"
         return RedirectResponse(url, status_code=303)
     finally:
@@ -509,6 +557,8 @@ def mark_bought(
             f"Achat item id={item_id} store='{store}' qty_bought={qty_bought} "
             f"ticket={ticket_unit_price} bb={best_before} loc={location_id}",
         )
+        if wants_json(request):
+            return partial_response(request, conn, list_id, "marked_bought", item_id=item_id)
         url = f"{ingress_base(request)}shopping?list={list_id}&toast=marked_bought"
         return RedirectResponse(url, status_code=303)
     finally:
@@ -602,6 +652,8 @@ def ticket_price(
         )
         conn.commit()
         log_event("shopping", f"Ticket item id={item_id} ticket={ticket_unit_price} delta={delta:+.2f}")
+        if wants_json(request):
+            return partial_response(request, conn, list_id, "ticket_ok", item_id=item_id)
         url = f"{ingress_base(request)}shopping?list={list_id}&toast=ticket_ok"
         return RedirectResponse(url, status_code=303)
     finally:
@@ -614,6 +666,8 @@ def commit_to_stock(request: Request, list_id: int = Form(...)):
     conn = get_db()
     committed_count = 0
     skipped_count = 0
+    lot_ids: list[int] = []
+    commit_id = None
     try:
         cur = conn.cursor()
         cur.execute(
@@ -677,6 +731,7 @@ def commit_to_stock(request: Request, list_id: int = Form(...)):
                 (lot_id, "IN", qty, today, "Import liste de courses"),
             )
             cur.execute("UPDATE shopping_items SET committed=1 WHERE id=?", (item["id"],))
+            lot_ids.append(lot_id)
             committed_count += 1
 
         conn.commit()
@@ -685,9 +740,13 @@ def commit_to_stock(request: Request, list_id: int = Form(...)):
                 schedule_ha_push()
             except Exception:
                 pass
-        log_event(
+            label_cache.schedule_prerender(lot_ids)
+        # L'id de l'événement sert de référence du commit (impression groupée
+        # des étiquettes : POST /api/print/lots {"shopping_commit": id})
+        commit_id = log_event(
             "shopping_committed",
-            {"list_id": list_id, "committed": committed_count, "skipped": skipped_count},
+            {"list_id": list_id, "committed": committed_count, "skipped": skipped_count,
+             "lot_ids": lot_ids},
         )
     finally:
         conn.close()
@@ -700,6 +759,7 @@ def commit_to_stock(request: Request, list_id: int = Form(...)):
     else:
         toast = "committed"
     return RedirectResponse(
-        f"{base}shopping?list={list_id}&toast={toast}&committed={committed_count}&skipped={skipped_count}",
+        f"{base}shopping?list={list_id}&toast={toast}&committed={committed_count}&skipped={skipped_count}"
+        + (f"&commit={commit_id}" if commit_id and committed_count else ""),
         status_code=303,
     )
@@ -0,0 +1,110 @@
+# domovra/app/schema.py
+# ============================================================
+# Schéma SQLite — migrations versionnées (PRAGMA user_version)
+#
+# - MIGRATIONS : liste ordonnée (version, nom, fonction(c)). Chaque
+#   migration s'exécute une seule fois, dans sa propre transaction
+#   (BEGIN IMMEDIATE … COMMIT), qui inclut la mise à jour de
+#   user_version : une migration qui échoue ne laisse aucune trace.
+# - Base à jour : le démarrage se résume à une lecture de
+#   PRAGMA user_version.
+# - Les bases créées avant ce mécanisme (user_version = 0) passent par
+#   la migration 1, qui sonde les colonnes une à une (rattrapage) ;
+#   les migrations suivantes n'ont plus besoin de sondes.
+# - Nouvelle évolution du schéma = nouvelle entrée en fin de liste,
+#   jamais de modification d'une migration déjà publiée.
+#
+# Appelé par le hook de démarrage (main._startup) via init_schema().
+# ============================================================
+from __future__ import annotations
+
+import logging
+import sqlite3
+import time
+from typing import Callable, List, Tuple
+
+import db
+
+logger = logging.getLogger("domovra.schema")
+
+
+def _events(c: sqlite3.Connection) -> None:
+    from services.events import EVENTS_DDL
+    c.execute(EVENTS_DDL)
+
+
+def _off_cache(c: sqlite3.Connection) -> None:
+    from services.off import OFF_CACHE_DDL
+    c.execute(OFF_CACHE_DDL)
+
+
+def _products_fts(c: sqlite3.Connection) -> None:
+    db._ensure_products_fts(c)
+
+
+MIGRATIONS: List[Tuple[int, str, Callable[[sqlite3.Connection], None]]] = [
+    (1, "base", db._migrate_base),              # locations, products, stock_lots, movements, EAN…
+    (2, "shopping", db._migrate_shopping),      # shopping_lists / shopping_items (→ products)
+    (3, "events", _events),
+    (4, "off_cache", _off_cache),
+    (5, "products_fts", _products_fts),
+    (6, "insert_defaults", db._migrate_insert_defaults),
+    (7, "write_generation", db._migrate_write_generation),
+    (8, "lots_indexes", db._migrate_lots_indexes),
+    (9, "product_generation", db._migrate_product_generation),
+    (10, "products_fts_lot_delete", db._migrate_products_fts_lot_delete),
+    (11, "product_barcodes_backfill", db._migrate_product_barcodes_backfill),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def _user_version(c: sqlite3.Connection) -> int:
+    return c.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate() -> int:
+    """Applique les migrations manquantes. Retourne le nombre de migrations exécutées."""
+    c = db._conn()
+    c.isolation_level = None          # transactions explicites
+    try:
+        version = _user_version(c)
+        if version >= SCHEMA_VERSION:
+            if version > SCHEMA_VERSION:
+                logger.warning("Base en version %s, plus récente que l'application (%s)",
+                               version, SCHEMA_VERSION)
+            return 0
+
+        # Persistant dans le fichier ; impossible à l'intérieur d'une transaction
+        c.execute("PRAGMA journal_mode=WAL")
+        applied = 0
+        for num, name, step in MIGRATIONS:
+            if num <= version:
+                continue
+            t = time.perf_counter()
+            c.execute("BEGIN IMMEDIATE")
+            try:
+                # Un autre processus a pu migrer entre-temps
+                if _user_version(c) >= num:
+                    c.execute("ROLLBACK")
+                    continue
+                step(c)
+                c.execute(f"PRAGMA user_version = {int(num)}")
+                c.execute("COMMIT")
+            except Exception:
+                c.execute("ROLLBACK")
+                logger.exception("Migration %s (%s) en échec", num, name)
+                raise
+            applied += 1
+            logger.info("Migration %s (%s) : %.1f ms", num, name, (time.perf_counter() - t) * 1000)
+        return applied
+    finally:
+        c.close()
+
+
+def init_schema() -> None:
+    """Crée / met à jour toutes les tables (hook de démarrage)."""
+    t0 = time.perf_counter()
+    applied = migrate()
+    logger.info("Schéma v%s (%d migration(s)) en %.1f ms",
+                SCHEMA_VERSION, applied, (time.perf_counter() - t0) * 1000)
@@ -2,25 +2,36 @@ import json
 from datetime import datetime, timezone
 from db import _conn
 
-def _ensure_events_table():
-    with _conn() as c:
-        c.execute("""
-          CREATE TABLE IF NOT EXISTS events (
-            id         INTEGER PRIMARY KEY AUTOINCREMENT,
-            created_at TEXT NOT NULL,
-            kind       TEXT NOT NULL,
-            details    TEXT
-          )
-        """)
-        c.commit()
+EVENTS_DDL = """
+  CREATE TABLE IF NOT EXISTS events (
+    id         INTEGER PRIMARY KEY AUTOINCREMENT,
+    created_at TEXT NOT NULL,
+    kind       TEXT NOT NULL,
+    details    TEXT
+  )
+"""
 
-def log_event(kind: str, details: dict):
+def log_event(kind: str, details: dict) -> int:
     created_at = datetime.now(timezone.utc).isoformat()
     payload = json.dumps(details or {}, ensure_ascii=False)
     with _conn() as c:
-        c.execute("INSERT INTO events(created_at,kind,details) VALUES (?,?,?)",
-                  (created_at, kind, payload))
+        cur = c.execute("INSERT INTO events(created_at,kind,details) VALUES (?,?,?)",
+                        (created_at, kind, payload))
         c.commit()
+        return cur.lastrowid
+
+def get_event(event_id: int):
+    with _conn() as c:
+        r = c.execute(
+            "SELECT id, created_at, kind, details FROM events WHERE id=?", (event_id,)
+        ).fetchone()
+    if r is None:
+        return None
+    try:
+        det = json.loads(r["details"] or "{}")
+    except Exception:
+        det = {}
+    return {"id": r["id"], "created_at": r["created_at"], "kind": r["kind"], "details": det}
 
 def list_events(limit: int = 200):
     with _conn() as c:
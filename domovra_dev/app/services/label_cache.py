@@ -0,0 +1,199 @@
+# domovra/app/services/label_cache.py
+# ============================================================
+# Cache disque des payloads d'étiquettes (pré-rendu à la création)
+#
+# - Option printer_prerender (Paramètres) : à la création d'un lot
+#   (ajout manuel, achats, commit de liste de courses), le payload BLE
+#   de son étiquette est calculé en tâche de fond et écrit sur disque.
+#   Imprimer se résume alors à la transmission.
+# - Fichier <lot_id>-<hash>.bin : le hash porte sur les champs imprimés
+#   (nom, quantité, DLC, statut, lieu…) et le format raster ; un lot
+#   modifié (ou dont le statut DLC change) ne retrouve donc jamais un
+#   payload périmé. update_lot / suppression purgent les fichiers du lot.
+# - Taille bornée (MAX_BYTES) : éviction des fichiers les moins
+#   récemment utilisés (mtime, rafraîchi à chaque lecture).
+# ============================================================
+from __future__ import annotations
+
+import glob
+import hashlib
+import logging
+import os
+import queue
+import threading
+from typing import Iterable, Optional
+
+logger = logging.getLogger("domovra.label_cache")
+
+CACHE_DIR = os.environ.get("LABEL_CACHE_DIR", "/data/label_cache")
+MAX_BYTES = 4 * 1024 * 1024
+
+_queue: "queue.Queue[int]" = queue.Queue()
+_worker: Optional[threading.Thread] = None
+_worker_lock = threading.Lock()
+_evict_lock = threading.Lock()
+
+
+# ─────────────────────────────────────────────
+# Fichiers
+# ─────────────────────────────────────────────
+
+def content_hash(lot: dict) -> str:
+    """Empreinte des champs imprimés + format du raster."""
+    from services import printer
+
+    key = (printer._label_key(lot), printer.RASTER_TRIM, printer.RASTER_FEED_BANDS)
+    return hashlib.sha1(repr(key).encode("utf-8")).hexdigest()[:16]
+
+
+def _path(lot_id: int, digest: str) -> str:
+    return os.path.join(CACHE_DIR, f"{int(lot_id)}-{digest}.bin")
+
+
+def get(lot: dict) -> Optional[bytes]:
+    path = _path(lot["id"], content_hash(lot))
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+        os.utime(path)   # LRU
+        return data
+    except OSError:
+        return None
+
+
+def put(lot: dict, payload: bytes) -> None:
+    """Écrit le payload du lot (remplace les versions précédentes) puis borne la taille du cache."""
+    digest = content_hash(lot)
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        invalidate(lot["id"], keep=digest)
+        path = _path(lot["id"], digest)
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(payload)
+        os.replace(tmp, path)
+    except OSError as e:
+        logger.warning("Cache étiquettes : écriture lot %s impossible (%s)", lot.get("id"), e)
+        return
+    _evict()
+
+
+def invalidate(lot_id: int, keep: Optional[str] = None) -> int:
+    """Supprime les payloads en cache d'un lot (sauf `keep`). Retourne le nombre de fichiers supprimés."""
+    removed = 0
+    for path in glob.glob(os.path.join(CACHE_DIR, f"{int(lot_id)}-*.bin")):
+        if keep and path == _path(lot_id, keep):
+            continue
+        try:
+            os.remove(path)
+            removed += 1
+        except OSError:
+            pass
+    return removed
+
+
+def _evict() -> None:
+    with _evict_lock:
+        entries = []
+        for path in glob.glob(os.path.join(CACHE_DIR, "*.bin")):
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= MAX_BYTES:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+
+
+# ─────────────────────────────────────────────
+# Payload d'impression
+# ─────────────────────────────────────────────
+
+def payload_for(lot: dict) -> bytes:
+    """Payload BLE du lot : depuis le cache disque, sinon rendu (et mis en cache)."""
+    from services.printer import _build_payload
+
+    data = get(lot)
+    if data is None:
+        data = _build_payload(lot, ble=True)
+        put(lot, data)
+    return data
+
+
+def prerender_many(lot_ids: Iterable[int]) -> int:
+    """
+    Rend et met en cache les étiquettes des lots (chargés en une requête).
+    Retourne le nombre de lots trouvés ; les ids inconnus sont ignorés.
+    """
+    from services.print_queue import load_lots
+    from services.printer import _build_payload
+
+    lots = load_lots([int(i) for i in lot_ids])
+    for lot in lots.values():
+        if get(lot) is None:
+            put(lot, _build_payload(lot, ble=True))
+    return len(lots)
+
+
+def prerender(lot_id: int) -> bool:
+    """Rend et met en cache l'étiquette d'un lot. False si le lot n'existe pas (ou plus)."""
+    return prerender_many([lot_id]) == 1
+
+
+# ─────────────────────────────────────────────
+# Pré-rendu en tâche de fond
+# ─────────────────────────────────────────────
+
+def enabled() -> bool:
+    try:
+        from settings_store import load_settings
+        s = load_settings()
+        return bool(s.get("printer_enabled") and s.get("printer_prerender"))
+    except Exception:
+        return False
+
+
+def _worker_loop() -> None:
+    while True:
+        batch = [_queue.get()]
+        while True:                      # tout ce qui est déjà en file : un seul chargement
+            try:
+                batch.append(_queue.get_nowait())
+            except queue.Empty:
+                break
+        try:
+            prerender_many(batch)
+        except Exception as e:
+            logger.warning("Pré-rendu étiquettes lots %s : %s", batch, e)
+        finally:
+            for _ in batch:
+                _queue.task_done()
+
+
+def schedule_prerender(lot_ids: Iterable[int]) -> None:
+    """Fire-and-forget : met les lots en file de pré-rendu si l'option est active."""
+    global _worker
+    ids = [int(i) for i in lot_ids if i]
+    if not ids or not enabled():
+        return
+    with _worker_lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=_worker_loop, name="label-prerender", daemon=True)
+            _worker.start()
+    for lot_id in ids:
+        _queue.put(lot_id)
+
+
+def drain(timeout: float = 5.0) -> None:
+    """Attend la fin des pré-rendus en file (tests, scripts)."""
+    import time
+    deadline = time.monotonic() + timeout
+    while _queue.unfinished_tasks and time.monotonic() < deadline:
+        time.sleep(0.01)
@@ -0,0 +1,332 @@
+# domovra/app/services/off.py
+# ============================================================
+# Open Food Facts — recherche par code-barres avec cache SQLite
+#
+# - Table off_cache : une ligne par EAN (réponse normalisée ou "notfound")
+# - TTL : 30 j pour un produit trouvé, 1 j pour un "notfound" (cache négatif)
+# - Hors ligne : une entrée expirée est servie telle quelle (stale=True)
+# - Appels réseau dans un thread (asyncio.to_thread) : la boucle n'est
+#   jamais bloquée ; deux scans simultanés du même EAN partagent la même
+#   requête (coalescing).
+#
+# OFF_BASE_URL (env) permet de pointer vers un serveur local (tests).
+# ============================================================
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import time
+import urllib.error
+import urllib.request
+from typing import Any, Dict, Optional
+
+from db import _conn
+
+log = logging.getLogger("domovra.off")
+
+OFF_BASE_URL = os.environ.get("OFF_BASE_URL", "https://world.openfoodfacts.org")
+OFF_TIMEOUT = 6
+OFF_USER_AGENT = "Domovra/1.0"
+
+TTL_FOUND = 30 * 86400
+TTL_NOTFOUND = 86400
+
+_inflight: Dict[str, asyncio.Future] = {}
+
+
+class OffUnavailable(Exception):
+    """Réseau / OFF injoignable (timeout, DNS, 5xx)."""
+
+
+class OffParseError(Exception):
+    """Réponse OFF illisible."""
+
+
+# ─────────────────────────────────────────────
+# Cache SQLite
+# ─────────────────────────────────────────────
+
+OFF_CACHE_DDL = """
+  CREATE TABLE IF NOT EXISTS off_cache (
+    barcode    TEXT PRIMARY KEY,
+    status     TEXT NOT NULL,          -- 'found' | 'notfound'
+    payload    TEXT,                   -- JSON normalisé (found)
+    fetched_at REAL NOT NULL           -- epoch secondes
+  )
+"""
+
+
+def cache_get(barcode: str) -> Optional[Dict[str, Any]]:
+    """Entrée brute du cache : {status, data, fetched_at} ou None."""
+    with _conn() as c:
+        row = c.execute(
+            "SELECT status, payload, fetched_at FROM off_cache WHERE barcode=?",
+            (barcode,),
+        ).fetchone()
+    if row is None:
+        return None
+    try:
+        data = json.loads(row["payload"]) if row["payload"] else None
+    except Exception:
+        data = None
+    return {"status": row["status"], "data": data, "fetched_at": float(row["fetched_at"])}
+
+
+def cache_put(barcode: str, status: str, data: Optional[Dict[str, Any]]) -> None:
+    payload = json.dumps(data, ensure_ascii=False) if data is not None else None
+    with _conn() as c:
+        c.execute(
+            "INSERT OR REPLACE INTO off_cache(barcode, status, payload, fetched_at) VALUES (?,?,?,?)",
+            (barcode, status, payload, time.time()),
+        )
+        c.commit()
+
+
+def _is_fresh(entry: Dict[str, Any], now: Optional[float] = None) -> bool:
+    ttl = TTL_FOUND if entry["status"] == "found" else TTL_NOTFOUND
+    return ((now or time.time()) - entry["fetched_at"]) < ttl
+
+
+# ─────────────────────────────────────────────
+# Réseau
+# ─────────────────────────────────────────────
+
+def _normalize(barcode: str, product: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "barcode": barcode,
+        "name": product.get("product_name") or "",
+        "brand": product.get("brands") or "",
+        "quantity": product.get("quantity") or "",
+        "image": product.get("image_front_url") or product.get("image_url") or "",
+    }
+
+
+def fetch_remote(barcode: str) -> Optional[Dict[str, Any]]:
+    """
+    Appel bloquant à l'API OFF v2. Retourne la fiche normalisée, None si
+    produit inconnu ; lève OffUnavailable / OffParseError sinon.
+    """
+    url = f"{OFF_BASE_URL.rstrip('/')}/api/v2/product/{barcode}.json"
+    req = urllib.request.Request(url, headers={"User-Agent": OFF_USER_AGENT})
+    try:
+        with urllib.request.urlopen(req, timeout=OFF_TIMEOUT) as resp:
+            raw = resp.read()
+    except urllib.error.HTTPError as e:
+        if e.code == 404:
+            # OFF répond 404 + {"status": 0} pour un EAN inconnu
+            return None
+        raise OffUnavailable(f"HTTP {e.code}") from e
+    except (urllib.error.URLError, TimeoutError, OSError) as e:
+        raise OffUnavailable(str(e)) from e
+    try:
+        data = json.loads(raw.decode("utf-8"))
+    except Exception as e:
+        raise OffParseError(str(e)) from e
+    if not isinstance(data, dict) or data.get("status") != 1:
+        return None
+    return _normalize(barcode, data.get("product") or {})
+
+
+# ─────────────────────────────────────────────
+# Lookup asynchrone (cache + coalescing)
+# ─────────────────────────────────────────────
+
+def _result(entry: Dict[str, Any], cached: bool, stale: bool = False) -> Dict[str, Any]:
+    if entry["status"] == "found":
+        return {"ok": True, **(entry["data"] or {}), "cached": cached, "stale": stale}
+    return {"ok": False, "error": "notfound", "cached": cached, "stale": stale}
+
+
+async def _refresh(barcode: str, cached: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    try:
+        data = await asyncio.to_thread(fetch_remote, barcode)
+    except OffUnavailable as e:
+        if cached is not None:
+            log.info("OFF injoignable (%s) : entrée périmée servie pour %s", e, barcode)
+            return _result(cached, cached=True, stale=True)
+        return {"ok": False, "error": "offline"}
+    except OffParseError:
+        return {"ok": False, "error": "parse"}
+
+    entry = {
+        "status": "found" if data is not None else "notfound",
+        "data": data,
+        "fetched_at": time.time(),
+    }
+    await asyncio.to_thread(cache_put, barcode, entry["status"], data)
+    return _result(entry, cached=False)
+
+
+async def lookup(barcode: str, force: bool = False) -> Dict[str, Any]:
+    """
+    Fiche OFF d'un EAN. Résultat :
+        {"ok": True, barcode, name, brand, quantity, image, cached, stale}
+        {"ok": False, "error": "notfound" | "offline" | "parse", ...}
+    Les appels concurrents pour un même EAN partagent le même aller-retour réseau.
+    """
+    cached = await asyncio.to_thread(cache_get, barcode)
+    if cached is not None and not force and _is_fresh(cached):
+        return _result(cached, cached=True)
+
+    fut = _inflight.get(barcode)
+    if fut is not None:
+        try:
+            return await asyncio.shield(fut)
+        except asyncio.CancelledError:
+            # Le porteur de la requête a été annulé (job d'enrichissement
+            # stoppé…) mais pas nous : on relance notre propre lookup.
+            if fut.cancelled() and not asyncio.current_task().cancelling():
+                return await lookup(barcode, force)
+            raise
+
+    fut = asyncio.get_running_loop().create_future()
+    _inflight[barcode] = fut
+    try:
+        res = await _refresh(barcode, cached)
+        fut.set_result(res)
+        return res
+    except asyncio.CancelledError:
+        fut.cancel()
+        raise
+    except Exception as e:
+        fut.set_exception(e)
+        fut.exception()  # marque l'exception comme consommée si aucun autre appelant
+        raise
+    finally:
+        _inflight.pop(barcode, None)
+
+
+# ─────────────────────────────────────────────
+# Enrichissement en masse (EAN déjà en base)
+# ─────────────────────────────────────────────
+#
+# Parcourt les EAN connus (product_barcodes, products.barcode) et
+# interroge OFF pour chaque EAN absent du cache. Concurrence bornée (sémaphore) + débit limité (intervalle
+# minimal entre deux départs de requête). Les résultats vont dans
+# off_cache : relancer le job reprend là où il s'était arrêté, et un
+# scan ultérieur est servi sans réseau. Annulable à tout moment.
+
+ENRICH_CONCURRENCY = 3
+ENRICH_RATE_PER_SEC = 2.0       # OFF demande de rester raisonnable
+ENRICH_MAX_OFFLINE_STREAK = 5   # abandon si OFF injoignable N fois de suite
+
+_enrich_task: Optional[asyncio.Task] = None
+_enrich_state: Dict[str, Any] = {"state": "idle"}
+
+
+def pending_barcodes() -> list:
+    """
+    EAN (8 à 14 chiffres) sans entrée off_cache : product_barcodes (ordre
+    d'ajout) puis products.barcode (EAN écrits hors db.py, import CSV…).
+    """
+    with _conn() as c:
+        rows = c.execute("""
+            SELECT b.barcode
+            FROM (
+                SELECT barcode, 0 AS src, id FROM product_barcodes
+                UNION ALL
+                SELECT barcode, 1 AS src, id FROM products
+            ) b
+            LEFT JOIN off_cache oc ON oc.barcode = b.barcode
+            WHERE oc.barcode IS NULL
+              AND length(b.barcode) BETWEEN 8 AND 14
+              AND b.barcode NOT GLOB '*[^0-9]*'
+            GROUP BY b.barcode
+            ORDER BY MIN(b.src), MIN(b.id)
+        """).fetchall()
+    return [r["barcode"] for r in rows]
+
+
+async def run_enrichment(
+    concurrency: int = ENRICH_CONCURRENCY,
+    rate_per_sec: float = ENRICH_RATE_PER_SEC,
+    state: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    """
+    Enrichit tous les EAN en attente. `state` (dict) est mis à jour au fil
+    de l'eau : total, done, found, notfound, errors, current, state.
+    """
+    state = state if state is not None else {}
+    codes = await asyncio.to_thread(pending_barcodes)
+    state.update({
+        "state": "running", "total": len(codes), "done": 0, "found": 0,
+        "notfound": 0, "errors": 0, "current": None,
+        "started_at": time.time(), "finished_at": None,
+    })
+    if not codes:
+        state.update({"state": "done", "finished_at": time.time()})
+        return state
+
+    sem = asyncio.Semaphore(max(1, int(concurrency)))
+    interval = 1.0 / rate_per_sec if rate_per_sec > 0 else 0.0
+    slot_lock = asyncio.Lock()
+    next_slot = [time.monotonic()]
+    offline_streak = [0]
+    stop = asyncio.Event()
+
+    async def _wait_slot() -> None:
+        async with slot_lock:
+            delay = next_slot[0] - time.monotonic()
+            next_slot[0] = max(next_slot[0], time.monotonic()) + interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def _one(code: str) -> None:
+        async with sem:
+            if stop.is_set():
+                return
+            await _wait_slot()
+            state["current"] = code
+            res = await lookup(code)
+            if res.get("ok"):
+                state["found"] += 1
+                offline_streak[0] = 0
+            elif res.get("error") == "notfound":
+                state["notfound"] += 1
+                offline_streak[0] = 0
+            else:
+                state["errors"] += 1
+                if res.get("error") == "offline":
+                    offline_streak[0] += 1
+                    if offline_streak[0] >= ENRICH_MAX_OFFLINE_STREAK:
+                        stop.set()
+            state["done"] += 1
+
+    try:
+        await asyncio.gather(*(_one(code) for code in codes))
+        state["state"] = "offline" if stop.is_set() else "done"
+    except asyncio.CancelledError:
+        state["state"] = "cancelled"
+        raise
+    finally:
+        state["current"] = None
+        state["finished_at"] = time.time()
+        log.info("Enrichissement OFF %s : %s", state["state"],
+                 {k: state.get(k) for k in ("total", "done", "found", "notfound", "errors")})
+    return state
+
+
+def enrichment_status() -> Dict[str, Any]:
+    return dict(_enrich_state)
+
+
+def start_enrichment(**kwargs: Any) -> Dict[str, Any]:
+    """Lance le job en tâche de fond (no-op s'il tourne déjà). À appeler depuis la boucle."""
+    global _enrich_task, _enrich_state
+    if _enrich_task is not None and not _enrich_task.done():
+        return enrichment_status()
+    _enrich_state = {"state": "starting"}
+    _enrich_task = asyncio.get_running_loop().create_task(run_enrichment(state=_enrich_state, **kwargs))
+    _enrich_task.add_done_callback(lambda t: t.cancelled() or t.exception())
+    return enrichment_status()
+
+
+def cancel_enrichment() -> bool:
+    """Annule le job en cours. Les EAN déjà traités restent en cache (reprise possible)."""
+    if _enrich_task is None or _enrich_task.done():
+        return False
+    _enrich_task.cancel()
+    _enrich_state["state"] = "cancelling"
+    return True
@@ -0,0 +1,231 @@
+# domovra/app/services/print_queue.py
+# ============================================================
+# File d'impression d'étiquettes par lots (Phomemo M110)
+#
+# - Un job = une liste de lots à imprimer (ids explicites, ou tous les
+#   lots créés par un commit de liste de courses).
+# - Un seul worker (tâche asyncio) par imprimante : les jobs d'une même
+#   MAC sont traités dans l'ordre d'arrivée, les étiquettes d'un job sont
+#   envoyées à la suite sur la même session BLE (services.printer).
+#   Le chargement des lots (SQLite) passe par asyncio.to_thread.
+# - L'état des jobs (progression, erreurs) est lu par polling
+#   (GET /api/print/jobs/{id}) ; seuls les JOB_HISTORY derniers jobs
+#   sont conservés en mémoire.
+# ============================================================
+from __future__ import annotations
+
+import asyncio
+import itertools
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger("domovra.print_queue")
+
+JOB_HISTORY = 50
+MAX_JOB_LOTS = 200
+_BLE_TIMEOUT = 35.0
+
+_jobs: Dict[int, Dict[str, Any]] = {}
+_queues: Dict[str, "asyncio.Queue[int]"] = {}
+_workers: Dict[str, asyncio.Task] = {}
+_lock = threading.Lock()
+_ids = itertools.count(1)
+
+
+# ─────────────────────────────────────────────
+# Données des étiquettes
+# ─────────────────────────────────────────────
+
+def load_lots(lot_ids: List[int]) -> Dict[int, dict]:
+    """Lots ouverts demandés, enrichis du statut DLC (couleur de l'étiquette)."""
+    from config import get_retention_thresholds
+    from db import classify_lots, get_lots
+
+    warning, critical = get_retention_thresholds()
+    lots = classify_lots(get_lots(lot_ids), warning, critical)
+    return {lot["id"]: lot for lot in lots}
+
+
+def lots_from_shopping_commit(commit_id: int) -> Optional[List[int]]:
+    """Ids des lots créés par un commit de liste de courses (None si commit inconnu)."""
+    from services.events import get_event
+
+    ev = get_event(commit_id)
+    if ev is None or ev["kind"] != "shopping_committed":
+        return None
+    return [int(i) for i in ev["details"].get("lot_ids") or []]
+
+
+# ─────────────────────────────────────────────
+# Jobs
+# ─────────────────────────────────────────────
+
+def _public(job: Dict[str, Any]) -> Dict[str, Any]:
+    out = {k: v for k, v in job.items() if not k.startswith("_")}
+    out["results"] = [dict(r) for r in job["results"]]
+    return out
+
+
+def get_job(job_id: int) -> Optional[Dict[str, Any]]:
+    with _lock:
+        job = _jobs.get(job_id)
+        return _public(job) if job is not None else None
+
+
+def list_jobs() -> List[Dict[str, Any]]:
+    with _lock:
+        return [_public(j) for j in sorted(_jobs.values(), key=lambda j: -j["id"])]
+
+
+def _prune() -> None:
+    finished = [j["id"] for j in sorted(_jobs.values(), key=lambda j: j["id"])
+                if j["state"] in ("done", "failed", "cancelled")]
+    for job_id in finished[:max(0, len(_jobs) - JOB_HISTORY)]:
+        del _jobs[job_id]
+
+
+def submit(mac: str, lot_ids: List[int], source: str = "lots",
+           loader: Callable[[List[int]], Dict[int, dict]] = load_lots) -> Dict[str, Any]:
+    """
+    Crée un job et le place dans la file de l'imprimante (à appeler depuis
+    la boucle asyncio). Retourne son état initial.
+    """
+    mac = mac.upper()
+    ids = list(dict.fromkeys(int(i) for i in lot_ids))   # dédoublonné, ordre conservé
+    loop = asyncio.get_running_loop()
+    with _lock:
+        job_id = next(_ids)
+        _jobs[job_id] = {
+            "id": job_id,
+            "mac": mac,
+            "source": source,
+            "state": "queued",
+            "total": len(ids),
+            "done": 0,
+            "printed": 0,
+            "failed": 0,
+            "skipped": 0,
+            "current": None,
+            "error": None,
+            "created_at": time.time(),
+            "started_at": None,
+            "finished_at": None,
+            "results": [{"lot_id": i, "state": "pending"} for i in ids],
+            "_loader": loader,
+            "_cancel": False,
+        }
+        _prune()
+        worker = _workers.get(mac)
+        if worker is None or worker.done() or worker.get_loop() is not loop:
+            _queues[mac] = asyncio.Queue()
+            _workers[mac] = loop.create_task(_worker_loop(mac, _queues[mac]), name=f"print-{mac}")
+        _queues[mac].put_nowait(job_id)
+        return _public(_jobs[job_id])
+
+
+def cancel(job_id: int) -> bool:
+    """Annule un job en attente ou en cours (l'étiquette en cours d'envoi se termine)."""
+    with _lock:
+        job = _jobs.get(job_id)
+        if job is None or job["state"] not in ("queued", "running"):
+            return False
+        job["_cancel"] = True
+        if job["state"] == "queued":
+            job["state"] = "cancelled"
+            job["finished_at"] = time.time()
+        return True
+
+
+async def wait(job_id: int, timeout: float = 10.0) -> Optional[Dict[str, Any]]:
+    """Attend la fin d'un job (tests, scripts). Retourne son état final ou courant."""
+    deadline = time.monotonic() + timeout
+    while True:
+        job = get_job(job_id)
+        if job is None or job["state"] in ("done", "failed", "cancelled") or time.monotonic() > deadline:
+            return job
+        await asyncio.sleep(0.01)
+
+
+# ─────────────────────────────────────────────
+# Worker (un par imprimante)
+# ─────────────────────────────────────────────
+
+async def _worker_loop(mac: str, q: "asyncio.Queue[int]") -> None:
+    while True:
+        job_id = await q.get()
+        try:
+            await _run_job(mac, job_id)
+        except asyncio.CancelledError:
+            with _lock:
+                job = _jobs.get(job_id)
+                if job is not None and job["state"] == "running":
+                    job.update({"state": "cancelled", "current": None, "finished_at": time.time()})
+            raise
+        except Exception as e:
+            logger.exception("Job d'impression %s : %s", job_id, e)
+            with _lock:
+                job = _jobs.get(job_id)
+                if job is not None:
+                    job.update({"state": "failed", "error": str(e), "current": None,
+                                "finished_at": time.time()})
+
+
+def _set_result(job: Dict[str, Any], idx: int, **fields: Any) -> None:
+    with _lock:
+        job["results"][idx].update(fields)
+        job["done"] += 1
+        if fields.get("state") == "printed":
+            job["printed"] += 1
+        else:
+            job["failed"] += 1
+
+
+async def _run_job(mac: str, job_id: int) -> None:
+    from services.label_cache import payload_for
+    from services.printer import get_session
+
+    with _lock:
+        job = _jobs.get(job_id)
+        if job is None or job["_cancel"]:
+            return
+        job.update({"state": "running", "started_at": time.time()})
+
+    lots = await asyncio.to_thread(job["_loader"], [r["lot_id"] for r in job["results"]])
+    session = get_session(mac)
+    for idx, res in enumerate(job["results"]):
+        if job["_cancel"]:
+            with _lock:
+                job.update({"state": "cancelled", "current": None, "finished_at": time.time()})
+            return
+        lot = lots.get(res["lot_id"])
+        if lot is None:
+            _set_result(job, idx, state="not_found")
+            continue
+        job["current"] = res["lot_id"]
+        try:
+            payload = await asyncio.to_thread(payload_for, lot)
+            out = await session.print_payload(payload, _BLE_TIMEOUT)
+            _set_result(job, idx, state="printed", reused=out.get("reused"),
+                        bytes_per_sec=out.get("bytes_per_sec"))
+        except (OSError, TimeoutError, asyncio.TimeoutError) as e:
+            # Imprimante injoignable : inutile d'insister sur les étiquettes suivantes
+            logger.warning("Job %s : impression interrompue (%s)", job_id, e)
+            _set_result(job, idx, state="error", error=str(e))
+            with _lock:
+                rest = job["results"][idx + 1:]
+                for r in rest:
+                    r["state"] = "skipped"
+                job["skipped"] += len(rest)
+                job["done"] += len(rest)          # done == total : plus rien à traiter
+                job.update({"state": "failed", "error": f"Connexion BLE impossible : {e}",
+                            "current": None, "finished_at": time.time()})
+            return
+        except Exception as e:
+            logger.exception("Job %s, lot %s : %s", job_id, res["lot_id"], e)
+            _set_result(job, idx, state="error", error=str(e))
+
+    with _lock:
+        job.update({"state": "done", "current": None, "finished_at": time.time()})
+    logger.info("Job d'impression %s terminé : %d/%d étiquettes", job_id, job["printed"], job["total"])
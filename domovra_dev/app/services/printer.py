@@ -26,7 +26,9 @@ import logging
 import os
 import select as _select
 import struct
+import threading
 import time
+from functools import lru_cache
 from io import BytesIO
 import socket
 
@@ -61,6 +63,12 @@ _TEST_DATA: dict = {
 
 _WHITE_ROW = bytes(BYTES_PER_ROW)
 
+# Tables bytes.translate pour le raster :
+#   Pillow "1" → 1 = blanc ; M110 → 1 = noir : inversion de chaque octet.
+#   RFCOMM : 0x0A (LF) interprété par le firmware → remplacé par 0x14.
+_INVERT_TABLE = bytes(0xFF - b for b in range(256))
+_RFCOMM_TABLE = bytes(0x14 if b == 0x0A else b for b in range(256))
+
 # UUIDs write-without-response connus pour Phomemo M110 / M02
 _KNOWN_WRITE_UUIDS = {
     "0000ff02-0000-1000-8000-00805f9b34fb",
@@ -71,48 +79,83 @@ _KNOWN_WRITE_UUIDS = {
 
 # ── Image ────────────────────────────────────────────────────
 
-def build_label_image(data: dict) -> bytes:
+_FONT_DIR = "/usr/share/fonts/truetype/dejavu"
+LABEL_CACHE_SIZE = 64
+
+
+@lru_cache(maxsize=1)
+def _fonts() -> tuple:
+    """Polices (titre, corps, petit) chargées une seule fois par process."""
+    from PIL import ImageFont
     try:
-        from PIL import Image, ImageDraw, ImageFont
+        return (
+            ImageFont.truetype(f"{_FONT_DIR}/DejaVuSans-Bold.ttf", 22),
+            ImageFont.truetype(f"{_FONT_DIR}/DejaVuSans.ttf", 17),
+            ImageFont.truetype(f"{_FONT_DIR}/DejaVuSans.ttf", 14),
+        )
+    except Exception:
+        default = ImageFont.load_default()
+        return default, default, default
+
+
+def _label_key(data: dict) -> tuple:
+    """Champs réellement imprimés — clé du cache de rendu."""
+    return (
+        str(data.get("name") or data.get("article_name") or data.get("product") or "Produit"),
+        str(data.get("qty", "")), str(data.get("unit", "")),
+        str(data.get("best_before") or ""), str(data.get("status", "green")),
+        str(data.get("location") or ""),
+        str(data.get("brand") or ""), str(data.get("store") or ""),
+    )
+
+
+def render_label(data: dict):
+    """
+    Rend l'étiquette en image Pillow mode "1" (largeur PRINT_WIDTH, hauteur utile).
+    Les rendus sont mis en cache (LRU) : réimprimer le même lot ou une série
+    d'étiquettes identiques ne redessine rien. Image partagée : ne pas la modifier.
+    """
+    try:
+        import PIL  # noqa: F401
     except ImportError:
         raise RuntimeError("Pillow non installé")
+    return _render_label_cached(_label_key(data))
+
 
+@lru_cache(maxsize=LABEL_CACHE_SIZE)
+def _render_label_cached(key: tuple):
+    from PIL import Image, ImageDraw
+
+    name, qty, unit, bb, st, loc, brand, store = key
     img = Image.new("1", (PRINT_WIDTH, 220), color=1)
     draw = ImageDraw.Draw(img)
-
-    try:
-        ft = ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf", 22)
-        fb = ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf", 17)
-        fs = ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf", 14)
-    except Exception:
-        ft = fb = fs = ImageFont.load_default()
+    ft, fb, fs = _fonts()
 
     y = 6
-    name = str(data.get("name") or data.get("article_name") or data.get("product") or "Produit")
     if len(name) > 26:
         name = name[:23] + "..."
     draw.text((6, y), name, font=ft, fill=0); y += 28
     draw.line([(6, y), (PRINT_WIDTH - 6, y)], fill=0, width=1); y += 6
 
-    qty = data.get("qty", ""); unit = data.get("unit", "")
     draw.text((6, y), f"Qte : {qty} {unit}".strip(), font=fb, fill=0); y += 22
 
-    bb = data.get("best_before") or ""
     if bb:
-        st = data.get("status", "green")
         pfx = {"green": "DLC", "yellow": "DLC !", "red": "DLC !!!"}.get(st, "DLC")
         draw.text((6, y), f"{pfx} : {bb}", font=fb, fill=0); y += 22
 
-    loc = data.get("location") or ""
     if loc:
         draw.text((6, y), f"Lieu : {loc}", font=fs, fill=0); y += 18
 
-    info = " | ".join(filter(None, [data.get("brand") or "", data.get("store") or ""]))
+    info = " | ".join(filter(None, [brand, store]))
     if info:
         draw.text((6, y), info, font=fs, fill=0); y += 16
 
-    img = img.crop((0, 0, PRINT_WIDTH, y + 8))
-    buf = BytesIO(); img.save(buf, format="PNG")
+    return img.crop((0, 0, PRINT_WIDTH, y + 8))
+
+
+def build_label_image(data: dict) -> bytes:
+    """PNG de l'étiquette (aperçu navigateur). L'impression n'utilise pas le PNG."""
+    buf = BytesIO(); render_label(data).save(buf, format="PNG")
     return buf.getvalue()
 
 
@@ -122,44 +165,111 @@ def build_test_label_image() -> bytes:
 
 # ── Protocole raster M110 ────────────────────────────────────
 
-def _build_payload(data: dict, ble: bool = True) -> bytes:
+def _raster_rows(img) -> bytes:
     """
-    ble=True  : pas de substitution 0x0A (BLE envoie du binaire brut).
-    ble=False : substitution 0x0A→0x14 requise pour RFCOMM.
+    Image → lignes raster M110 concaténées (BYTES_PER_ROW octets par ligne,
+    bit de poids fort = pixel de gauche, 1 = noir). Pillow empaquette déjà
+    le mode "1" dans ce format : tobytes() + inversion, sans boucle pixel.
     """
     from PIL import Image
 
-    png_bytes = build_label_image(data)
-    img = Image.open(BytesIO(png_bytes)).convert("1")
+    if img.mode != "1":
+        img = img.convert("1")
     w, h = img.size
-
     if w != PRINT_WIDTH:
         img = img.resize((PRINT_WIDTH, int(h * PRINT_WIDTH / w)), Image.LANCZOS).convert("1")
-        w, h = img.size
-
-    raw_rows: list[bytes] = []
-    for y in range(h):
-        row = bytearray(BYTES_PER_ROW)
-        for x in range(PRINT_WIDTH):
-            if img.getpixel((x, y)) == 0:
-                row[x // 8] |= (0x80 >> (x % 8))
-        if ble:
-            raw_rows.append(bytes(row))
-        else:
-            raw_rows.append(bytes(0x14 if b == 0x0A else b for b in row))
+    return img.tobytes().translate(_INVERT_TABLE)
+
+
+# Raster compact : les lignes blanches en fin d'étiquette ne sont pas
+# envoyées et le dernier bloc GS v 0 annonce sa hauteur réelle (le champ
+# yL/yH le permet) au lieu d'être complété à BLOCK_LINES lignes blanches.
+# Optionnel : une bande blanche intérieure d'au moins FEED_MIN_ROWS lignes
+# est remplacée par ESC J n (avance papier de n points). Le firmware M110
+# n'accepte pas de raster compressé (pas de RLE en GS v 0) : on supprime
+# donc les octets blancs plutôt que de les encoder.
+RASTER_TRIM = True
+RASTER_FEED_BANDS = False
+FEED_MIN_ROWS = 16
+
+
+def _block_marker(lines: int) -> bytes:
+    return _BLOCK_MARKER[:6] + struct.pack("<H", lines)
+
+
+def _feed(rows: int) -> bytes:
+    """ESC J n : avance de n points (n ≤ 255 par commande)."""
+    out = bytearray()
+    while rows > 0:
+        n = min(rows, 255)
+        out += bytes([0x1B, 0x4A, n])
+        rows -= n
+    return bytes(out)
+
+
+def _blank_bands(raster: bytes, height: int, min_rows: int) -> list[tuple[int, int]]:
+    """Bandes blanches [début, fin) d'au moins min_rows lignes."""
+    bands, start = [], None
+    for y in range(height):
+        blank = raster[y * BYTES_PER_ROW:(y + 1) * BYTES_PER_ROW] == _WHITE_ROW
+        if blank and start is None:
+            start = y
+        elif not blank and start is not None:
+            if y - start >= min_rows:
+                bands.append((start, y))
+            start = None
+    return bands
+
+
+def _frame_raster(raster: bytes, trim: bool | None = None, feed_bands: bool | None = None) -> bytes:
+    """
+    Encadre le raster : header, blocs de BLOCK_LINES lignes, footer.
+    trim=False reproduit l'ancien format (dernier bloc complété en blanc).
+    """
+    trim = RASTER_TRIM if trim is None else trim
+    feed_bands = RASTER_FEED_BANDS if feed_bands is None else feed_bands
+
+    if not trim:
+        block_size = BYTES_PER_ROW * BLOCK_LINES
+        buf = bytearray(_HEADER)
+        for start in range(0, max(len(raster), 1), block_size):
+            block = raster[start:start + block_size]
+            buf += _BLOCK_MARKER
+            buf += block
+            buf += bytes(block_size - len(block))
+        buf += _FOOTER
+        return bytes(buf)
+
+    # Hauteur utile : dernière ligne contenant un pixel noir (au moins 1 ligne)
+    used = len(raster.rstrip(b"\x00"))
+    height = max(1, -(-used // BYTES_PER_ROW))
+    bands = _blank_bands(raster, height, FEED_MIN_ROWS) if feed_bands else []
 
     buf = bytearray(_HEADER)
-    for block_start in range(0, max(h, 1), BLOCK_LINES):
-        block_rows = raw_rows[block_start:block_start + BLOCK_LINES]
-        while len(block_rows) < BLOCK_LINES:
-            block_rows.append(_WHITE_ROW)
-        buf += _BLOCK_MARKER
-        for row in block_rows:
-            buf += row
+    y = 0
+    for stop, resume in bands + [(height, height)]:
+        for start in range(y, stop, BLOCK_LINES):
+            lines = min(BLOCK_LINES, stop - start)
+            buf += _block_marker(lines)
+            buf += raster[start * BYTES_PER_ROW:(start + lines) * BYTES_PER_ROW]
+        buf += _feed(resume - stop)
+        y = resume
     buf += _FOOTER
     return bytes(buf)
 
 
+def _build_payload(data: dict, ble: bool = True, trim: bool | None = None,
+                   feed_bands: bool | None = None) -> bytes:
+    """
+    ble=True  : pas de substitution 0x0A (BLE envoie du binaire brut).
+    ble=False : substitution 0x0A→0x14 requise pour RFCOMM.
+    """
+    raster = _raster_rows(render_label(data))
+    if not ble:
+        raster = raster.translate(_RFCOMM_TABLE)
+    return _frame_raster(raster, trim=trim, feed_bands=feed_bands)
+
+
 # ── BLE GATT via raw L2CAP ATT ───────────────────────────────
 #
 # struct sockaddr_l2 :
@@ -230,13 +340,11 @@ def _make_l2_addr(mac: str, cid: int, addr_type: int) -> _SockaddrL2:
     return addr
 
 
-def _ble_connect(mac: str, timeout: float = 35.0) -> socket.socket:
+def _ble_socket(mac: str) -> tuple[socket.socket, bool]:
     """
-    Connexion BLE L2CAP ATT via raw socket kernel.
-    Combinaison : LE_RANDOM + bind + BT_SECURITY_LOW + select() pour timeout.
-
-    L'imprimante DOIT être allumée et en mode attente (LED active).
-    Lève TimeoutError si pas de réponse dans le délai.
+    Crée le socket L2CAP ATT non bloquant et lance connect().
+    Retourne (socket, en_cours) : en_cours=True si la connexion n'est pas
+    encore établie (attendre que le socket devienne inscriptible).
     """
     libc = _get_libc()
     libc.connect.restype = ctypes.c_int
@@ -258,7 +366,7 @@ def _ble_connect(mac: str, timeout: float = 35.0) -> socket.socket:
         except OSError as e:
             logger.debug("bind local: %s", e)
 
-        # Non-bloquant pour pouvoir utiliser select() avec timeout
+        # Non-bloquant : attente par select() ou par la boucle asyncio
         s.setblocking(False)
 
         remote = _make_l2_addr(mac, _ATT_CID, _LE_RANDOM)
@@ -267,32 +375,92 @@ def _ble_connect(mac: str, timeout: float = 35.0) -> socket.socket:
 
         if ret == 0:
             logger.info("BLE ATT connexion immédiate à %s", mac)
-        elif err in (115, 36):  # EINPROGRESS / EAGAIN — connexion en cours
-            logger.info("BLE ATT connexion en cours vers %s (attente jusqu'à %.0fs)…", mac, timeout)
+            return s, False
+        if err in (115, 36):  # EINPROGRESS / EAGAIN — connexion en cours
+            logger.info("BLE ATT connexion en cours vers %s…", mac)
+            return s, True
+        raise OSError(err, os.strerror(err))
+    except Exception:
+        try: s.close()
+        except Exception: pass
+        raise
+
+
+def _connect_timeout_error(timeout: float) -> TimeoutError:
+    return TimeoutError(
+        f"L'imprimante ne répond pas après {timeout:.0f}s. "
+        f"Vérifier qu'elle est allumée et en mode attente (LED active)."
+    )
+
+
+def _check_connected(s: socket.socket, mac: str) -> None:
+    sock_err = s.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+    if sock_err != 0:
+        raise OSError(sock_err, os.strerror(sock_err))
+    logger.info("BLE ATT connecté à %s", mac)
+
+
+def _ble_connect(mac: str, timeout: float = 35.0) -> socket.socket:
+    """
+    Connexion BLE L2CAP ATT via raw socket kernel (bloquante).
+    Combinaison : LE_RANDOM + bind + BT_SECURITY_LOW + select() pour timeout.
+
+    L'imprimante DOIT être allumée et en mode attente (LED active).
+    Lève TimeoutError si pas de réponse dans le délai.
+    """
+    s, pending = _ble_socket(mac)
+    try:
+        if pending:
             _, writable, _ = _select.select([], [s], [], timeout)
             if not writable:
-                raise TimeoutError(
-                    f"L'imprimante ne répond pas après {timeout:.0f}s. "
-                    f"Vérifier qu'elle est allumée et en mode attente (LED active)."
-                )
-            sock_err = s.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
-            if sock_err != 0:
-                raise OSError(sock_err, os.strerror(sock_err))
-            logger.info("BLE ATT connecté à %s", mac)
-        else:
-            raise OSError(err, os.strerror(err))
-
+                raise _connect_timeout_error(timeout)
+            _check_connected(s, mac)
         s.setblocking(True)
         s.settimeout(15.0)
         return s
-
     except Exception:
         try: s.close()
         except Exception: pass
         raise
 
 
-def _att_exchange_mtu(sock: socket.socket, wanted: int = 512) -> int:
+async def _wait_writable(sock: socket.socket, timeout: float | None) -> bool:
+    """Attend (sans bloquer la boucle) que le socket soit inscriptible. False si timeout."""
+    loop = asyncio.get_running_loop()
+    fut = loop.create_future()
+    fd = sock.fileno()
+    loop.add_writer(fd, lambda: fut.done() or fut.set_result(None))
+    try:
+        await asyncio.wait_for(fut, timeout)
+        return True
+    except asyncio.TimeoutError:
+        return False
+    finally:
+        loop.remove_writer(fd)
+
+
+async def _ble_connect_async(mac: str, timeout: float = 35.0) -> socket.socket:
+    """
+    Variante asyncio de _ble_connect : l'attente de la connexion est portée
+    par la boucle (aucun thread). Le socket reste non bloquant.
+    """
+    s, pending = _ble_socket(mac)
+    try:
+        if pending:
+            if not await _wait_writable(s, timeout):
+                raise _connect_timeout_error(timeout)
+            _check_connected(s, mac)
+        return s
+    except BaseException:
+        try: s.close()
+        except Exception: pass
+        raise
+
+
+ATT_MTU_MAX = 517   # valeur max. ATT (BT 4.2+) : l'imprimante répond avec la sienne
+
+
+def _att_exchange_mtu(sock: socket.socket, wanted: int = ATT_MTU_MAX) -> int:
     try:
         sock.send(struct.pack("<BH", _ATT_EXCHANGE_MTU_REQ, wanted))
         rsp = sock.recv(64)
@@ -305,6 +473,26 @@ def _att_exchange_mtu(sock: socket.socket, wanted: int = 512) -> int:
     return 23
 
 
+async def _att_request(sock: socket.socket, pkt: bytes, timeout: float) -> bytes:
+    """Requête ATT → réponse, via la boucle asyncio (socket non bloquant)."""
+    loop = asyncio.get_running_loop()
+    await loop.sock_sendall(sock, pkt)
+    return await asyncio.wait_for(loop.sock_recv(sock, 512), timeout)
+
+
+async def _att_exchange_mtu_async(sock: socket.socket, wanted: int = ATT_MTU_MAX,
+                                  timeout: float = 15.0) -> int:
+    try:
+        rsp = await _att_request(sock, struct.pack("<BH", _ATT_EXCHANGE_MTU_REQ, wanted), timeout)
+        if len(rsp) >= 3 and rsp[0] == _ATT_EXCHANGE_MTU_RSP:
+            mtu = struct.unpack_from("<H", rsp, 1)[0]
+            logger.info("MTU négocié : %d", mtu)
+            return mtu
+    except (OSError, asyncio.TimeoutError) as e:
+        logger.debug("MTU exchange : %s", e)
+    return 23
+
+
 def _uuid_str(raw: bytes) -> str:
     if len(raw) == 2:
         return f"0x{struct.unpack_from('<H', raw)[0]:04x}"
@@ -314,7 +502,7 @@ def _uuid_str(raw: bytes) -> str:
     return raw.hex()
 
 
-def _find_write_handle(sock: socket.socket) -> tuple[int | None, str | None]:
+async def _find_write_handle(sock: socket.socket, timeout: float = 15.0) -> tuple[int | None, str | None]:
     """
     Découverte ATT rapide : retourne (handle, uuid) de la première caractéristique
     write-without-response. UUID connus Phomemo en priorité.
@@ -326,9 +514,8 @@ def _find_write_handle(sock: socket.socket) -> tuple[int | None, str | None]:
     while h <= 0xFFFF:
         try:
             pkt = struct.pack("<BHHH", _ATT_READ_BY_TYPE_REQ, h, 0xFFFF, 0x2803)
-            sock.send(pkt)
-            rsp = sock.recv(512)
-        except Exception:
+            rsp = await _att_request(sock, pkt, timeout)
+        except (OSError, asyncio.TimeoutError):
             break
 
         if not rsp or rsp[0] == _ATT_ERROR_RSP:
@@ -366,11 +553,65 @@ def _find_write_handle(sock: socket.socket) -> tuple[int | None, str | None]:
     return best_handle, best_uuid
 
 
-def discover_ble(mac: str, timeout: float = 35.0) -> dict:
+# Le résultat complet de la découverte est mémorisé par MAC (settings,
+# printer_ble_cache : services + discovered_at) : un nouvel appel le
+# relit sans parcours GATT (plusieurs secondes d'allers-retours ATT), et
+# la session d'impression y choisit son handle d'écriture. force=True
+# (bouton « re-scanner ») refait le parcours. Au-delà de
+# GATT_CACHE_MAX_AGE, le cache est ignoré (firmware mis à jour…).
+GATT_CACHE_MAX_AGE = 30 * 86400
+
+
+def _gatt_cache_fresh(entry: dict | None, now: float | None = None) -> bool:
+    if not entry:
+        return False
+    ts = entry.get("discovered_at")
+    if ts is None:           # entrée antérieure à l'horodatage : handle seul, conservé
+        return True
+    return ((now or time.time()) - float(ts)) < GATT_CACHE_MAX_AGE
+
+
+def _pick_write_handle(services: list) -> tuple[int | None, str | None]:
+    """Handle d'écriture tiré d'une découverte : UUID Phomemo d'abord, sinon 1er write-without-response."""
+    best: tuple[int | None, str | None] = (None, None)
+    for svc in services or []:
+        for ch in svc.get("characteristics") or []:
+            try:
+                props = int(ch.get("props", "0"), 16)
+                handle = int(ch.get("value_handle", "0"), 16)
+            except (TypeError, ValueError):
+                continue
+            if not props & 0x04:
+                continue
+            if ch.get("uuid") in _KNOWN_WRITE_UUIDS:
+                return handle, ch["uuid"]
+            if best[0] is None:
+                best = (handle, ch.get("uuid"))
+    return best
+
+
+def _cached_discovery(mac: str) -> dict | None:
+    cached = _load_ble_cache(mac)
+    if cached and cached.get("services") is not None and _gatt_cache_fresh(cached):
+        return {"ok": True, "mtu": cached.get("mtu", 23), "services": cached["services"],
+                "cached": True, "discovered_at": cached.get("discovered_at")}
+    return None
+
+
+def discover_ble(mac: str, timeout: float = 35.0, force: bool = False,
+                 release_session: bool = True) -> dict:
     """
-    Connexion BLE ATT + découverte GATT complète.
-    L'imprimante doit être allumée et en mode attente.
+    Connexion BLE ATT + découverte GATT complète (ou résultat en cache,
+    sauf force=True). L'imprimante doit être allumée et en mode attente.
+    Variante bloquante (scripts) ; depuis la boucle asyncio, passer par
+    discover_ble_async, qui libère la session sous son verrou.
     """
+    cached = None if force else _cached_discovery(mac)
+    if cached is not None:
+        return cached
+
+    if release_session:
+        close_session(mac)   # une seule connexion ATT à la fois vers l'imprimante
     try:
         sock = _ble_connect(mac, timeout)
     except TimeoutError as e:
@@ -432,7 +673,13 @@ def discover_ble(mac: str, timeout: float = 35.0) -> dict:
                     cdata = cdata[clen:]; ch = val_h + 1
                 else: break
 
-        return {"ok": True, "mtu": mtu, "services": services}
+        now = time.time()
+        handle, uuid = _pick_write_handle(services)
+        entry = {"mtu": mtu, "services": services, "discovered_at": now}
+        if handle is not None:
+            entry.update({"handle": handle, "uuid": uuid})
+        _store_ble_cache(mac, entry)
+        return {"ok": True, "mtu": mtu, "services": services, "cached": False, "discovered_at": now}
 
     except Exception as e:
         return {"ok": False, "error": str(e)}
@@ -441,52 +688,332 @@ def discover_ble(mac: str, timeout: float = 35.0) -> dict:
         except Exception: pass
 
 
-def print_ble(mac: str, payload: bytes, timeout: float = 35.0) -> dict:
-    """
-    Impression via BLE GATT raw L2CAP ATT.
-    Connexion → MTU → découverte handle → envoi payload en chunks.
-    L'imprimante doit être allumée et en mode attente (LED active).
-    """
-    try:
-        sock = _ble_connect(mac, timeout)
-    except TimeoutError as e:
-        return {"ok": False, "error": str(e)}
-    except OSError as e:
-        return {"ok": False, "error": f"Connexion BLE impossible : {e}"}
+# ── Session BLE persistante ──────────────────────────────────
+#
+# Une connexion L2CAP ATT coûte jusqu'à 35 s (attente de l'annonce BLE) +
+# une découverte GATT complète. La session garde le socket ouvert entre
+# deux impressions (fermé après BLE_IDLE_TIMEOUT sans activité) et le
+# handle d'écriture / MTU découverts sont mémorisés par MAC dans les
+# settings (printer_ble_cache) : dix étiquettes d'affilée = une connexion,
+# et une reconnexion ne refait pas la découverte. En cas d'erreur d'envoi
+# (lien coupé, imprimante éteinte puis rallumée), une reconnexion est
+# tentée une fois, de façon transparente.
+#
+# Pilote asyncio : connexion, requêtes ATT et envoi passent par la boucle
+# (socket non bloquant + add_writer / sock_recv), sans thread ni executor.
+# Chaque impression a un délai global (timeout) ; une annulation pendant
+# l'envoi ferme la connexion (l'imprimante a reçu une étiquette partielle,
+# la suivante repart sur un lien propre).
+#
+# Rythme d'envoi adaptatif : les Write Command partent en non bloquant.
+# Quand le tampon d'émission du socket est plein (EAGAIN — le contrôleur
+# n'arrive plus à suivre), on attend qu'il redevienne inscriptible et le
+# délai inter-paquets double ; après _PACING_DECAY_AFTER paquets acceptés
+# d'affilée il est divisé par deux (jusqu'à 0). Le délai appris est
+# conservé par session pour l'étiquette suivante.
+
+BLE_IDLE_TIMEOUT = 30.0
+_WRITE_PACING = 0.005          # délai initial d'une nouvelle session
+_WRITE_PACING_MIN_STEP = 0.001 # premier palier après un EAGAIN
+_WRITE_PACING_MAX = 0.05
+_PACING_DECAY_AFTER = 16
+
 
+def _load_ble_cache(mac: str) -> dict | None:
     try:
-        mtu = _att_exchange_mtu(sock)
-        chunk = max(1, mtu - 3)
+        from settings_store import load_settings
+        return load_settings().get("printer_ble_cache", {}).get(mac.upper())
+    except Exception as e:
+        logger.debug("Lecture cache BLE : %s", e)
+        return None
 
-        write_handle, write_uuid = _find_write_handle(sock)
 
-        if write_handle is None:
-            # Fallback : handle 0x0002 (très commun sur imprimantes thermiques BLE simples)
-            write_handle = 0x0002
-            write_uuid = "inconnu (fallback 0x0002)"
-            logger.warning("Aucun handle trouvé par ATT — fallback handle 0x0002")
+def _store_ble_cache(mac: str, entry: dict | None) -> None:
+    """Enregistre (ou efface si entry=None) le cache GATT d'une MAC dans les settings."""
+    try:
+        from settings_store import load_settings, save_settings
+        current = load_settings()
+        cache = dict(current.get("printer_ble_cache") or {})
+        if entry is None:
+            if cache.pop(mac.upper(), None) is None:
+                return
+        else:
+            if cache.get(mac.upper()) == entry:
+                return
+            cache[mac.upper()] = entry
+        save_settings({**current, "printer_ble_cache": cache})
+    except Exception as e:
+        logger.warning("Écriture cache BLE : %s", e)
 
-        logger.info("Impression BLE : %d octets → handle 0x%04x (%s), chunks de %d",
-                    len(payload), write_handle, write_uuid, chunk)
 
-        sent = 0
+def _sock_alive(sock: socket.socket) -> bool:
+    """Socket encore connecté ? (lit et jette d'éventuelles notifications en attente)."""
+    try:
+        while True:
+            readable, _, errored = _select.select([sock], [], [sock], 0)
+            if errored:
+                return False
+            if not readable:
+                return True
+            if not sock.recv(512, socket.MSG_DONTWAIT):
+                return False
+    except (BlockingIOError, InterruptedError):
+        return True
+    except OSError:
+        return False
+
+
+class _BleSession:
+    """Connexion ATT réutilisable vers une imprimante (une par MAC)."""
+
+    def __init__(self, mac: str):
+        self.mac = mac.upper()
+        self.sock: socket.socket | None = None
+        self.mtu = 23
+        self.handle: int | None = None
+        self.uuid: str | None = None
+        self.last_used = 0.0
+        self.connects = 0
+        self.pacing = _WRITE_PACING
+        self.rescan = False          # ignore le cache GATT à la prochaine connexion
+        self.busy = False
+        self._lock: asyncio.Lock | None = None
+        self._lock_loop: asyncio.AbstractEventLoop | None = None
+
+    def _get_lock(self) -> asyncio.Lock:
+        # Un verrou par boucle (scripts / tests : une boucle par asyncio.run)
+        loop = asyncio.get_running_loop()
+        if self._lock is None or self._lock_loop is not loop:
+            self._lock, self._lock_loop = asyncio.Lock(), loop
+        return self._lock
+
+    # -- cycle de vie ------------------------------------------------------
+    async def _open(self, timeout: float) -> None:
+        sock = await _ble_connect_async(self.mac, timeout)
+        try:
+            sock.setblocking(False)
+            cached = _load_ble_cache(self.mac)
+            if self.rescan or not _gatt_cache_fresh(cached):
+                cached = {}
+            # Toujours demander le maximum : le MTU effectif est le min des deux côtés
+            self.mtu = await _att_exchange_mtu_async(sock, ATT_MTU_MAX, timeout)
+            if cached.get("handle"):
+                self.handle, self.uuid = int(cached["handle"]), cached.get("uuid") or ""
+                logger.info("Handle BLE en cache pour %s : 0x%04x (%s)", self.mac, self.handle, self.uuid)
+            else:
+                self.handle, self.uuid = await _find_write_handle(sock, timeout)
+                if self.handle is None:
+                    # Fallback : handle 0x0002 (très commun sur imprimantes thermiques BLE simples)
+                    self.handle, self.uuid = 0x0002, "inconnu (fallback 0x0002)"
+                    logger.warning("Aucun handle trouvé par ATT — fallback handle 0x0002")
+                else:
+                    _store_ble_cache(self.mac, {"handle": self.handle, "uuid": self.uuid,
+                                                "mtu": self.mtu, "discovered_at": time.time()})
+            self.rescan = False
+        except BaseException:
+            try: sock.close()
+            except Exception: pass
+            raise
+        self.sock = sock
+        self.connects += 1
+
+    def close(self) -> None:
+        if self.sock is not None:
+            try: self.sock.close()
+            except Exception: pass
+            self.sock = None
+            logger.info("Session BLE %s fermée", self.mac)
+
+    async def _ensure_open(self, timeout: float) -> bool:
+        """Ouvre la connexion si besoin. Retourne True si une session existante est réutilisée."""
+        if self.sock is not None and _sock_alive(self.sock):
+            return True
+        self.close()
+        await self._open(timeout)
+        return False
+
+    # -- envoi -------------------------------------------------------------
+    async def _write(self, payload: bytes, timeout: float) -> dict:
+        """
+        Envoie le payload en Write Command de (MTU-3) octets, au rythme dicté
+        par la contre-pression du socket. Retourne les stats d'envoi.
+        """
+        chunk = max(1, self.mtu - 3)
+        head = struct.pack("<BH", _ATT_WRITE_CMD, self.handle)
+        sent = packets = eagain = streak = 0
+        t0 = time.monotonic()
         for i in range(0, len(payload), chunk):
-            pkt = struct.pack("<BH", _ATT_WRITE_CMD, write_handle) + payload[i:i + chunk]
-            sock.send(pkt)
-            sent += len(payload[i:i + chunk])
-            time.sleep(0.005)
-
+            pkt = head + payload[i:i + chunk]
+            while True:
+                try:
+                    self.sock.send(pkt, socket.MSG_DONTWAIT)
+                    break
+                except (BlockingIOError, InterruptedError):
+                    eagain += 1
+                    streak = 0
+                    self.pacing = min(max(self.pacing * 2, _WRITE_PACING_MIN_STEP), _WRITE_PACING_MAX)
+                    if not await _wait_writable(self.sock, timeout):
+                        raise TimeoutError(f"Envoi BLE bloqué depuis {timeout:.0f}s")
+            sent += len(pkt) - 3
+            packets += 1
+            streak += 1
+            if streak >= _PACING_DECAY_AFTER and self.pacing:
+                self.pacing = self.pacing / 2 if self.pacing > _WRITE_PACING_MIN_STEP / 4 else 0.0
+                streak = 0
+            if self.pacing:
+                await asyncio.sleep(self.pacing)
+        elapsed = max(time.monotonic() - t0, 1e-6)
         return {
-            "ok": True,
-            "message": f"Impression envoyée : {sent} octets via handle 0x{write_handle:04x} ({write_uuid})",
+            "bytes": sent,
+            "packets": packets,
+            "eagain": eagain,
+            "seconds": round(elapsed, 3),
+            "bytes_per_sec": int(sent / elapsed),
+            "pacing_ms": round(self.pacing * 1000, 2),
         }
 
+    async def _print_once(self, payload: bytes, timeout: float) -> dict:
+        for attempt in (1, 2):
+            reused = await self._ensure_open(timeout)
+            try:
+                logger.info("Impression BLE : %d octets → handle 0x%04x (%s), chunks de %d%s",
+                            len(payload), self.handle, self.uuid, self.mtu - 3,
+                            " [session réutilisée]" if reused else "")
+                stats = await self._write(payload, timeout)
+                self.last_used = time.monotonic()
+                logger.info("Impression BLE : %d octets en %.2fs (%d o/s, %d EAGAIN, délai %.2f ms)",
+                            stats["bytes"], stats["seconds"], stats["bytes_per_sec"],
+                            stats["eagain"], stats["pacing_ms"])
+                return {
+                    "ok": True,
+                    "reused": reused,
+                    "bytes_per_sec": stats["bytes_per_sec"],
+                    "stats": stats,
+                    "message": f"Impression envoyée : {stats['bytes']} octets via handle "
+                               f"0x{self.handle:04x} ({self.uuid}), "
+                               f"{stats['bytes_per_sec']} o/s",
+                }
+            except OSError as e:
+                self.close()
+                if attempt == 2:
+                    raise
+                logger.warning("Envoi BLE interrompu (%s) — reconnexion", e)
+
+    async def print_payload(self, payload: bytes, timeout: float, rescan: bool = False) -> dict:
+        """
+        Imprime un payload (connexion / reconnexion comprises) en au plus
+        `timeout` secondes. Lève TimeoutError, OSError ou CancelledError.
+        """
+        async with self._get_lock():
+            if rescan:
+                self.rescan = True
+                self.close()
+            self.busy = True
+            try:
+                return await asyncio.wait_for(self._print_once(payload, timeout), timeout)
+            except (asyncio.TimeoutError, asyncio.CancelledError):
+                # Étiquette partielle possible : on repart d'une connexion propre
+                self.close()
+                raise
+            finally:
+                self.busy = False
+
+
+_sessions: dict[str, _BleSession] = {}
+_sessions_lock = threading.Lock()
+_reaper_loops: "set[asyncio.AbstractEventLoop]" = set()
+
+
+def reap_idle_sessions(now: float | None = None) -> int:
+    """Ferme les sessions inactives depuis plus de BLE_IDLE_TIMEOUT. Retourne le nombre fermé."""
+    now = time.monotonic() if now is None else now
+    with _sessions_lock:
+        sessions = list(_sessions.values())
+    closed = 0
+    for sess in sessions:
+        # Impression en cours : on repassera
+        if sess.busy or sess.sock is None or now - sess.last_used <= BLE_IDLE_TIMEOUT:
+            continue
+        sess.close()
+        closed += 1
+    return closed
+
+
+async def _reaper() -> None:
+    try:
+        while True:
+            await asyncio.sleep(min(5.0, BLE_IDLE_TIMEOUT))
+            try:
+                reap_idle_sessions()
+            except Exception as e:
+                logger.debug("reaper BLE : %s", e)
+    finally:
+        _reaper_loops.discard(asyncio.get_running_loop())
+
+
+def get_session(mac: str) -> _BleSession:
+    """Session de la MAC. Appelée depuis la boucle : y démarre le reaper si besoin."""
+    with _sessions_lock:
+        sess = _sessions.get(mac.upper())
+        if sess is None:
+            sess = _sessions[mac.upper()] = _BleSession(mac)
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return sess
+    if loop not in _reaper_loops:
+        _reaper_loops.add(loop)
+        loop.create_task(_reaper(), name="ble-reaper")
+    return sess
+
+
+def close_session(mac: str) -> None:
+    with _sessions_lock:
+        sess = _sessions.get(mac.upper())
+    if sess is not None:
+        sess.close()
+
+
+async def discover_ble_async(mac: str, timeout: float = 35.0, force: bool = False) -> dict:
+    """
+    discover_ble depuis la boucle. La session d'impression est fermée sur la
+    boucle, sous son verrou : une impression en cours se termine d'abord, et
+    aucune ne démarre pendant la découverte (exécutée dans un thread).
+    """
+    cached = None if force else _cached_discovery(mac)
+    if cached is not None:
+        return cached
+    sess = get_session(mac)
+    async with sess._get_lock():
+        sess.close()
+        return await asyncio.to_thread(discover_ble, mac, timeout, force, False)
+
+
+async def print_ble_async(mac: str, payload: bytes, timeout: float = 35.0,
+                          rescan: bool = False) -> dict:
+    """
+    Impression via BLE GATT raw L2CAP ATT, sur la session persistante de la MAC.
+    Connexion (si besoin) → MTU → handle (cache) → envoi payload en chunks.
+    L'imprimante doit être allumée et en mode attente (LED active).
+    Les erreurs sont rendues sous forme {"ok": False, "error": ...} ;
+    l'annulation (CancelledError) est propagée.
+    rescan=True : reconnexion avec recherche du handle, sans le cache GATT.
+    """
+    try:
+        return await get_session(mac).print_payload(payload, timeout, rescan=rescan)
+    except (TimeoutError, asyncio.TimeoutError) as e:
+        return {"ok": False, "error": str(e) or f"Timeout ({timeout:.0f}s) — imprimante allumée ?",
+                "timeout": True}
+    except OSError as e:
+        return {"ok": False, "error": f"Connexion BLE impossible : {e}"}
     except Exception as e:
         logger.exception("print_ble : %s", e)
         return {"ok": False, "error": str(e)}
-    finally:
-        try: sock.close()
-        except Exception: pass
+
+
+def print_ble(mac: str, payload: bytes, timeout: float = 35.0) -> dict:
+    """Variante bloquante de print_ble_async (scripts, hors boucle asyncio)."""
+    return asyncio.run(print_ble_async(mac, payload, timeout))
 
 
 # ── Transport RFCOMM (secours — ne fonctionne pas pour l'impression M110) ──
@@ -501,24 +1028,3 @@ def _send_rfcomm(mac: str, payload: bytes, timeout: int = 15) -> None:
     finally:
         try: sock.close()
         except Exception: pass
-
-
-async def send_to_printer(mac: str, image_data: dict) -> None:
-    """Wrapper async pour compatibilité (utilise RFCOMM — ne print pas sur M110)."""
-    payload = _build_payload(image_data, ble=False)
-    loop = asyncio.get_event_loop()
-    await loop.run_in_executor(None, _send_rfcomm, mac, payload)
-
-
-def print_lot(mac: str, lot_data: dict) -> None:
-    """Lance l'impression d'un lot en BLE (fire-and-forget)."""
-    import threading
-    def _run():
-        try:
-            payload = _build_payload(lot_data, ble=True)
-            result = print_ble(mac, payload)
-            if not result.get("ok"):
-                logger.error("Impression lot BLE : %s", result.get("error"))
-        except Exception as e:
-            logger.error("Impression lot : %s", e)
-    threading.Thread(target=_run, daemon=True).start()
@@ -46,6 +46,8 @@ DEFAULTS: Dict[str, Any] = {
     # Imprimante étiquettes BLE
     "printer_enabled": False,        # bool — active la fonctionnalité impression
     "printer_mac": "",               # str  — adresse MAC BLE (ex: 7C:91:7B:E4:6B:49)
+    "printer_prerender": False,      # bool — pré-rend l'étiquette à la création du lot (cache disque)
+    "printer_ble_cache": {},         # dict — par MAC : {handle, uuid, mtu, services, discovered_at} (évite la découverte GATT)
 
     # Journal
     "log_retention_days": 30,        # int >= 0
@@ -83,7 +85,7 @@ def _coerce_types(raw: Dict[str, Any]) -> Dict[str, Any]:
 
     for k in ("sidebar_compact", "enable_scanner", "enable_off_block",
               "ha_notifications", "log_consumption", "log_add_remove",
-              "ask_move_on_delete", "printer_enabled"):
+              "ask_move_on_delete", "printer_enabled", "printer_prerender"):
         out[k] = bool(out.get(k, DEFAULTS[k]))
 
     def _int_ge0(v, dflt):
@@ -118,9 +120,48 @@ def _coerce_types(raw: Dict[str, Any]) -> Dict[str, Any]:
     mac = str(out.get("printer_mac", "")).strip().upper()
     out["printer_mac"] = mac if _is_valid_mac(mac) else ""
 
+    out["printer_ble_cache"] = _clean_ble_cache(out.get("printer_ble_cache"))
+
     return out
 
 
+def _clean_ble_cache(raw: Any) -> Dict[str, Any]:
+    """
+    Cache GATT imprimante : {MAC: {handle:int, uuid:str, mtu:int, services:list,
+    discovered_at:float}} — services / discovered_at / handle optionnels
+    (découverte sans caractéristique inscriptible). Entrées invalides ignorées.
+    """
+    clean: Dict[str, Any] = {}
+    if not isinstance(raw, dict):
+        return clean
+    for mac, entry in raw.items():
+        mac = str(mac).strip().upper()
+        if not _is_valid_mac(mac) or not isinstance(entry, dict):
+            continue
+        services = entry.get("services")
+        if not isinstance(services, list) or not all(isinstance(s, dict) for s in services):
+            services = None
+        try:
+            handle = int(entry["handle"]) if entry.get("handle") is not None else None
+            mtu = int(entry.get("mtu") or 23)
+            discovered_at = float(entry["discovered_at"]) if entry.get("discovered_at") is not None else None
+        except Exception:
+            continue
+        if handle is not None and not (0x0001 <= handle <= 0xFFFF):
+            handle = None
+        if handle is None and services is None:
+            continue
+        item: Dict[str, Any] = {"mtu": min(max(mtu, 23), 517)}
+        if handle is not None:
+            item.update({"handle": handle, "uuid": str(entry.get("uuid") or "")})
+        if services is not None:
+            item["services"] = services
+        if discovered_at is not None:
+            item["discovered_at"] = discovered_at
+        clean[mac] = item
+    return clean
+
+
 def _invalidate_cache() -> None:
     global _cache_data, _cache_ts
     with _cache_lock:
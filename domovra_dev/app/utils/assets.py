@@ -1,4 +1,4 @@
-import os, hashlib, shutil
+import os, re, hashlib, shutil
 from functools import lru_cache
 
 # BASE_DIR = racine du dossier app/ (où se trouvent templates/static)
@@ -57,3 +57,27 @@ def ensure_hashed_asset(src_rel: str) -> str:
         pass
 
     return dst_rel
+
+
+# Assets servis sous un nom haché (nom-<hash>.ext) : le contenu d'une URL
+# ne change jamais, les navigateurs peuvent la garder indéfiniment.
+HASHED_ASSETS = (
+    "static/css/domovra.css",
+    "static/js/autocomplete.js",
+    "static/js/locations.js",
+)
+
+_HASHED_NAME = re.compile(r"-[0-9a-f]{10}\.[A-Za-z0-9]+$")
+
+def is_hashed_asset(path: str) -> bool:
+    return bool(_HASHED_NAME.search(path))
+
+def hashed_assets() -> dict:
+    """{chemin source: chemin haché} ; chemin source si la copie est impossible."""
+    out = {}
+    for src in HASHED_ASSETS:
+        try:
+            out[src] = ensure_hashed_asset(src)
+        except OSError:
+            out[src] = src
+    return out
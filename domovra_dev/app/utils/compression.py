@@ -0,0 +1,160 @@
+# domovra/app/utils/compression.py
+# ============================================================
+# Compression des réponses (Brotli si disponible, sinon gzip)
+#
+# Les pages (historique de prix JSON embarqué), /api/stock/products et
+# les exports CSV pèsent des centaines de Ko et passent par HA Ingress
+# jusqu'aux téléphones : on les compresse à la volée.
+# - Seuil COMPRESS_MIN_SIZE : en dessous, le gain ne vaut pas le CPU.
+# - Liste blanche de types (texte, JSON, JS, SVG…) : jamais les images
+#   ni les flux déjà compressés.
+# - Réponse déjà encodée (assets précompressés, voir utils.static_files)
+#   → laissée telle quelle.
+# - Brotli (module `brotli`) est optionnel : gzip sinon.
+# ============================================================
+from __future__ import annotations
+
+import os
+import zlib
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - dépend de l'image
+    brotli = None
+
+COMPRESS_MIN_SIZE = max(0, int(os.environ.get("COMPRESS_MIN_SIZE", "1024")))
+
+COMPRESSIBLE_TYPES = frozenset({
+    "text/html", "text/plain", "text/css", "text/csv", "text/javascript", "text/xml",
+    "application/json", "application/javascript", "application/xml",
+    "application/manifest+json", "image/svg+xml",
+})
+
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5        # à la volée ; les assets statiques sont précompressés au maximum
+
+
+def pick_encoding(accept_encoding: str) -> str | None:
+    """'br' ou 'gzip' selon Accept-Encoding (q=0 = refusé), None sinon."""
+    accepted = set()
+    for part in (accept_encoding or "").lower().split(","):
+        name, _, params = part.strip().partition(";")
+        if params.replace(" ", "") in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            continue
+        accepted.add(name.strip())
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+
+def compress(data: bytes, encoding: str, level: int | None = None) -> bytes:
+    """Compression en un bloc (réponses complètes, fichiers statiques)."""
+    if encoding == "br":
+        return brotli.compress(data, quality=BROTLI_QUALITY if level is None else level)
+    c = zlib.compressobj(GZIP_LEVEL if level is None else level, zlib.DEFLATED, 31)
+    return c.compress(data) + c.flush()
+
+
+class _StreamCompressor:
+    """Compression incrémentale (StreamingResponse en plusieurs morceaux)."""
+
+    def __init__(self, encoding: str):
+        if encoding == "br":
+            self._c = brotli.Compressor(quality=BROTLI_QUALITY)
+            self._process, self._finish = self._c.process, self._c.finish
+        else:
+            self._c = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+            self._process, self._finish = self._c.compress, self._c.flush
+
+    def feed(self, data: bytes, last: bool) -> bytes:
+        out = self._process(data) if data else b""
+        return out + self._finish() if last else out
+
+
+class CompressionMiddleware:
+    """Middleware ASGI : compresse les réponses éligibles selon Accept-Encoding."""
+
+    def __init__(self, app: ASGIApp, minimum_size: int = COMPRESS_MIN_SIZE,
+                 content_types=COMPRESSIBLE_TYPES) -> None:
+        self.app = app
+        self.minimum_size = minimum_size
+        self.content_types = frozenset(content_types)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope.get("method") == "HEAD":
+            await self.app(scope, receive, send)
+            return
+        encoding = pick_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        await self.app(scope, receive, _Responder(self, encoding, send).send)
+
+
+class _Responder:
+
+    def __init__(self, mw: CompressionMiddleware, encoding: str, send: Send):
+        self.mw = mw
+        self.encoding = encoding
+        self._send = send
+        self.start: Message | None = None
+        self.stream: _StreamCompressor | None = None
+
+    def _eligible(self, headers: MutableHeaders, status: int) -> bool:
+        if status < 200 or status in (204, 206, 304) or "content-encoding" in headers:
+            return False
+        ctype = headers.get("content-type", "").split(";", 1)[0].strip().lower()
+        return ctype in self.mw.content_types
+
+    async def send(self, message: Message) -> None:
+        mtype = message["type"]
+        if mtype == "http.response.start":
+            self.start = message            # en attente du premier morceau
+            return
+        if self.start is None:
+            if self.stream is not None and mtype == "http.response.body":
+                more = message.get("more_body", False)
+                data = self.stream.feed(message.get("body", b""), last=not more)
+                if data or not more:
+                    await self._send({"type": mtype, "body": data, "more_body": more})
+                return
+            await self._send(message)
+            return
+
+        start, self.start = self.start, None
+        headers = MutableHeaders(raw=start["headers"])
+        if mtype != "http.response.body" or not self._eligible(headers, start["status"]):
+            await self._send(start)
+            await self._send(message)
+            return
+
+        body = message.get("body", b"")
+        more = message.get("more_body", False)
+        headers.add_vary_header("Accept-Encoding")
+        declared = headers.get("content-length")
+        size = int(declared) if declared and declared.isdigit() else len(body)
+        if (not more or declared) and size < self.mw.minimum_size:
+            await self._send(start)
+            await self._send(message)
+            return
+
+        headers["Content-Encoding"] = self.encoding
+        if not more:
+            data = compress(body, self.encoding)
+            headers["Content-Length"] = str(len(data))
+            await self._send(start)
+            await self._send({"type": mtype, "body": data, "more_body": False})
+            return
+
+        if "content-length" in headers:
+            del headers["content-length"]
+        self.stream = _StreamCompressor(self.encoding)
+        await self._send(start)
+        data = self.stream.feed(body, last=False)
+        if data:
+            await self._send({"type": mtype, "body": data, "more_body": True})
@@ -0,0 +1,37 @@
+# domovra/app/utils/db_pool.py
+# ============================================================
+# Pool de threads borné pour le travail SQLite lourd
+#
+# Les routes `async def` ne doivent jamais exécuter de requêtes sqlite3
+# directement : un export ou un import volumineux gèlerait la boucle
+# asyncio, donc toutes les autres requêtes (polling HA compris).
+# run_db() exécute la fonction dans un pool dédié de DB_WORKERS threads :
+# au-delà, les tâches attendent leur tour sans consommer le pool par
+# défaut de Starlette (utilisé par les routes `def`).
+# ============================================================
+from __future__ import annotations
+
+import asyncio
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional, TypeVar
+
+T = TypeVar("T")
+
+DB_WORKERS = max(1, int(os.environ.get("DB_WORKERS", "4")))
+
+_executor: Optional[ThreadPoolExecutor] = None
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=DB_WORKERS, thread_name_prefix="domovra-db")
+    return _executor
+
+
+async def run_db(func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """Exécute `func(*args, **kwargs)` dans le pool DB et attend son résultat."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_executor(), functools.partial(func, *args, **kwargs))
@@ -1,5 +1,10 @@
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
 from fastapi import Request
-from fastapi.responses import HTMLResponse, RedirectResponse
+from fastapi.responses import HTMLResponse, RedirectResponse, Response
 from settings_store import load_settings
 
 def nocache_html(html: str) -> HTMLResponse:
@@ -15,11 +20,75 @@ def ingress_base(request: Request) -> str:
         base += "/"
     return base
 
-def render(templates_env, name: str, **ctx) -> HTMLResponse:
+def wants_json(request: Request) -> bool:
+    """True si le client (fetch JS) demande une réponse partielle JSON plutôt qu'un redirect."""
+    return "application/json" in (request.headers.get("accept") or "").lower()
+
+
+# ── Cache de rendu ─────────────────────────────────────────────
+# Pages rendues, clé : (jeton de build, template, jeton de données, hash
+# des settings, BASE, URL). Le jeton de build (BUILD_TOKEN, utils.jinja)
+# change avec la version de l'app et ses assets : l'ETag aussi. Le jeton
+# de données vient de db.data_version() (+ date si la page dépend du
+# jour) : toute écriture dans les tables concernées change la clé,
+# l'ancienne entrée sort par LRU.
+
+RENDER_CACHE_SIZE = 32
+
+_render_cache: "OrderedDict[tuple, tuple[str, str]]" = OrderedDict()
+_render_lock = threading.Lock()
+
+
+def settings_hash(settings: dict) -> str:
+    raw = json.dumps(settings, sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:16]
+
+
+def _render_key(templates_env, name: str, version, ctx: dict) -> tuple:
+    request = ctx.get("request")
+    url = f"{request.url.path}?{request.url.query}" if request is not None else ""
+    build = templates_env.globals.get("BUILD_TOKEN")
+    return (build, name, version, settings_hash(ctx["SETTINGS"]), ctx.get("BASE"), url)
+
+
+def _cached_response(html: str, etag: str, request) -> Response:
+    headers = {"Cache-Control": "no-cache", "ETag": etag}
+    if request is not None and request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return HTMLResponse(html, headers=headers)
+
+
+def render(templates_env, name: str, *, version=None, build=None, **ctx) -> HTMLResponse:
+    """
+    Rendu d'un template (réponse no-store).
+    Avec `version` (jeton de données), le HTML est mis en cache et servi avec
+    un ETag (revalidation → 304) ; `build()` fournit le contexte coûteux et
+    n'est appelé qu'en cas d'absence dans le cache.
+    """
     if "SETTINGS" not in ctx:
         ctx["SETTINGS"] = load_settings()
-    tpl = templates_env.get_template(name)
-    return nocache_html(tpl.render(**ctx))
+    if version is None:
+        if build is not None:
+            ctx.update(build())
+        tpl = templates_env.get_template(name)
+        return nocache_html(tpl.render(**ctx))
+
+    key = _render_key(templates_env, name, version, ctx)
+    with _render_lock:
+        hit = _render_cache.get(key)
+        if hit is not None:
+            _render_cache.move_to_end(key)
+    if hit is None:
+        if build is not None:
+            ctx.update(build())
+        html = templates_env.get_template(name).render(**ctx)
+        etag = '"' + hashlib.sha1(repr(key).encode("utf-8")).hexdigest()[:20] + '"'
+        hit = (html, etag)
+        with _render_lock:
+            _render_cache[key] = hit
+            while len(_render_cache) > RENDER_CACHE_SIZE:
+                _render_cache.popitem(last=False)
+    return _cached_response(hit[0], hit[1], ctx.get("request"))
 
 def redirect(base: str, path: str, params: str | None = None) -> RedirectResponse:
     url = base + path
@@ -1,6 +1,9 @@
+import hashlib
 import json
-from jinja2 import Environment, FileSystemLoader, select_autoescape
-from .assets import asset_ver, ensure_hashed_asset
+import logging
+import os
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader, select_autoescape
+from .assets import asset_ver, ensure_hashed_asset, hashed_assets
 from config import START_TS
 
 def _pretty_num(x) -> str:
@@ -84,16 +87,43 @@ def _get_locations_json() -> str:
         return "[]"
 
 
-def build_jinja_env():
+# Templates compilés persistés entre redémarrages (invalidés par Jinja
+# lui-même si la source change)
+JINJA_CACHE_DIR = os.environ.get("JINJA_CACHE_DIR", "/data/jinja_cache")
+
+
+def _bytecode_cache(directory: str | None):
+    if not directory:
+        return None
+    try:
+        os.makedirs(directory, exist_ok=True)
+        return FileSystemBytecodeCache(directory)
+    except OSError as e:
+        logging.getLogger("domovra").warning("Cache bytecode Jinja désactivé (%s): %s", directory, e)
+        return None
+
+
+def build_jinja_env(bytecode_dir: str | None = JINJA_CACHE_DIR):
     env = Environment(
         loader=FileSystemLoader("templates"),
-        autoescape=select_autoescape()
+        autoescape=select_autoescape(),
+        bytecode_cache=_bytecode_cache(bytecode_dir),
     )
+    assets = hashed_assets()
+
+    def asset_path(src: str) -> str:
+        return assets.get(src, src)
+
     # globals
     env.globals["asset_ver"] = asset_ver
+    env.globals["asset_path"] = asset_path
     env.globals["ASSET_VER"] = asset_ver("static/css/domovra.css")
-    env.globals["ASSET_CSS_PATH"] = ensure_hashed_asset("static/css/domovra.css")
+    env.globals["ASSET_CSS_PATH"] = assets["static/css/domovra.css"]
     env.globals["START_TS"] = START_TS
+    # Jeton de build (démarrage + assets hachés) : entre dans les clés / ETag
+    # du cache de rendu, un HTML d'une version précédente n'est jamais resservi
+    env.globals["BUILD_TOKEN"] = hashlib.sha1(
+        json.dumps([START_TS, sorted(assets.items())]).encode("utf-8")).hexdigest()[:12]
     env.globals["fmt_qty"] = fmt_qty
     env.globals["AC_LOCATIONS_JSON"] = _get_locations_json
     # filters
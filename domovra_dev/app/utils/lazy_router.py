@@ -0,0 +1,71 @@
+# domovra/app/utils/lazy_router.py
+# ============================================================
+# Routers chargés à la première requête
+#
+# Les modules peu utilisés (impression, admin DB, debug, export/import)
+# ne sont pas importés au démarrage : une route « sentinelle » couvre
+# leurs préfixes d'URL. À la première requête correspondante, le module
+# est importé, son router inclus dans l'app, la sentinelle retirée, puis
+# la requête est re-routée normalement.
+#
+# Les routes chargées paresseusement n'apparaissent dans /openapi.json
+# qu'après leur premier appel.
+# ============================================================
+from __future__ import annotations
+
+import importlib
+import logging
+from typing import Iterable
+
+from starlette.routing import BaseRoute, Match, NoMatchFound
+
+logger = logging.getLogger("domovra.lazy_router")
+
+
+def _route_path(scope) -> str:
+    path = scope.get("path", "")
+    root = scope.get("root_path", "")
+    if root and path.startswith(root):
+        return path[len(root):] or "/"
+    return path
+
+
+class LazyRouter(BaseRoute):
+    """Sentinelle : importe `module` (attribut `router`) à la première requête sur `prefixes`."""
+
+    def __init__(self, app, module: str, prefixes: Iterable[str], attr: str = "router"):
+        self.app = app
+        self.module = module
+        self.prefixes = tuple(prefixes)
+        self.attr = attr
+        self.loaded = False
+
+    def matches(self, scope):
+        if scope["type"] in ("http", "websocket") and _route_path(scope).startswith(self.prefixes):
+            return Match.FULL, {}
+        return Match.NONE, {}
+
+    def url_path_for(self, name: str, /, **path_params):
+        raise NoMatchFound(name, path_params)
+
+    def load(self) -> None:
+        if self.loaded:
+            return
+        router = getattr(importlib.import_module(self.module), self.attr)
+        self.app.include_router(router)
+        try:
+            self.app.router.routes.remove(self)
+        except ValueError:
+            pass
+        self.loaded = True
+        logger.info("Router %s chargé (%d routes)", self.module, len(router.routes))
+
+    async def handle(self, scope, receive, send):
+        self.load()
+        await self.app.router(scope, receive, send)
+
+
+def include_lazy_router(app, module: str, prefixes: Iterable[str]) -> LazyRouter:
+    route = LazyRouter(app, module, prefixes)
+    app.router.routes.append(route)
+    return route
@@ -0,0 +1,126 @@
+# domovra/app/utils/static_files.py
+# ============================================================
+# Fichiers statiques avec en-têtes de cache
+#
+# - Assets hachés (domovra-<hash>.css, autocomplete-<hash>.js…) :
+#   « immutable », un an — une nouvelle version a une nouvelle URL.
+# - Autres fichiers : revalidation systématique (ETag / Last-Modified
+#   fournis par StaticFiles, réponse 304 si inchangé).
+# - CSS/JS précompressés au démarrage (precompress_static) : fichier.br /
+#   fichier.gz servis tels quels selon Accept-Encoding, sans CPU par
+#   requête.
+# ============================================================
+from __future__ import annotations
+
+import logging
+import mimetypes
+import os
+
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+from starlette.types import Scope
+
+from utils.assets import is_hashed_asset
+from utils.compression import COMPRESS_MIN_SIZE, brotli, compress, pick_encoding
+
+logger = logging.getLogger("domovra.static")
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+
+PRECOMPRESS_EXTS = (".css", ".js")
+_ENCODED_EXTS = {"br": ".br", "gzip": ".gz"}
+
+
+def _encoders():
+    if brotli is not None:
+        yield "br", 11
+    yield "gzip", 9
+
+
+def precompress_static(directory: str, min_size: int = COMPRESS_MIN_SIZE) -> int:
+    """
+    Écrit fichier.br / fichier.gz à côté de chaque CSS/JS (si absent ou
+    plus ancien que la source) et supprime les variantes orphelines.
+    Retourne le nombre de fichiers écrits.
+    """
+    written = 0
+    for root, _, files in os.walk(directory):
+        for fname in files:
+            path = os.path.join(root, fname)
+            base, ext = os.path.splitext(path)
+            if ext in _ENCODED_EXTS.values():
+                if not os.path.isfile(base):
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+                continue
+            if not fname.endswith(PRECOMPRESS_EXTS):
+                continue
+            try:
+                st = os.stat(path)
+                if st.st_size < min_size:
+                    continue
+                data = None
+                for encoding, level in _encoders():
+                    dst = path + _ENCODED_EXTS[encoding]
+                    if os.path.isfile(dst) and os.path.getmtime(dst) >= st.st_mtime:
+                        continue
+                    if data is None:
+                        with open(path, "rb") as f:
+                            data = f.read()
+                    tmp = dst + ".tmp"
+                    with open(tmp, "wb") as f:
+                        f.write(compress(data, encoding, level))
+                    os.replace(tmp, dst)
+                    written += 1
+            except OSError as e:
+                logger.warning("Précompression impossible pour %s: %s", path, e)
+    return written
+
+
+class CachedStaticFiles(StaticFiles):
+
+    async def get_response(self, path: str, scope: Scope) -> Response:
+        response = await super().get_response(path, scope)
+        if response.status_code in (200, 304):
+            response.headers["Cache-Control"] = IMMUTABLE if is_hashed_asset(path) else REVALIDATE
+        return response
+
+    def file_response(self, full_path, stat_result: os.stat_result, scope: Scope,
+                      status_code: int = 200) -> Response:
+        full_path = str(full_path)
+        if full_path.endswith(PRECOMPRESS_EXTS):
+            request_headers = Headers(scope=scope)
+            encoding = pick_encoding(request_headers.get("accept-encoding", ""))
+            variant = self._variant(full_path, stat_result, encoding)
+            if variant is not None:
+                alt_path, alt_stat = variant
+                response = FileResponse(
+                    alt_path, status_code=status_code, stat_result=alt_stat,
+                    media_type=mimetypes.guess_type(full_path)[0],
+                    headers={"Content-Encoding": encoding, "Vary": "Accept-Encoding"},
+                )
+                if self.is_not_modified(response.headers, request_headers):
+                    return NotModifiedResponse(response.headers)
+                return response
+        response = super().file_response(full_path, stat_result, scope, status_code)
+        if full_path.endswith(PRECOMPRESS_EXTS):
+            response.headers["Vary"] = "Accept-Encoding"
+        return response
+
+    @staticmethod
+    def _variant(full_path: str, stat_result: os.stat_result, encoding: str | None):
+        """Variante précompressée à jour (chemin, stat) pour l'encodage, sinon None."""
+        if encoding is None:
+            return None
+        alt_path = full_path + _ENCODED_EXTS[encoding]
+        try:
+            alt_stat = os.stat(alt_path)
+        except OSError:
+            return None
+        if alt_stat.st_mtime < stat_result.st_mtime:
+            return None
+        return alt_path, alt_stat
@@ -0,0 +1,81 @@
+"""
+bench_printer.py — Micro-benchmark du rendu raster M110 (hors suite pytest).
+
+Compare la génération du payload d'impression :
+  - avant : PNG encode/décode + boucle getpixel + substitution 0x0A par octet
+  - après : render_label (polices + rendu en cache LRU) → tobytes() + bytes.translate
+et la taille du payload (blocs complétés à 240 lignes vs raster compact).
+
+Usage (depuis la racine du dépôt, par ex. sur le Raspberry Pi) :
+    PYTHONPATH=domovra_dev/app python tests/bench_printer.py [répétitions]
+"""
+import sys
+import timeit
+from io import BytesIO
+
+from services import printer
+
+LOT = {
+    "name": "Crème fraîche épaisse",
+    "qty": "2", "unit": "pot",
+    "best_before": "2026-11-02", "status": "yellow",
+    "location": "Frigo", "brand": "Elle & Vire", "store": "Lidl",
+}
+
+
+def legacy_payload(data: dict, ble: bool) -> bytes:
+    from PIL import Image
+
+    img = Image.open(BytesIO(printer.build_label_image(data))).convert("1")
+    w, h = img.size
+    rows = []
+    for y in range(h):
+        row = bytearray(printer.BYTES_PER_ROW)
+        for x in range(printer.PRINT_WIDTH):
+            if img.getpixel((x, y)) == 0:
+                row[x // 8] |= (0x80 >> (x % 8))
+        rows.append(bytes(row) if ble else bytes(0x14 if b == 0x0A else b for b in row))
+    buf = bytearray(printer._HEADER)
+    for start in range(0, max(h, 1), printer.BLOCK_LINES):
+        block = rows[start:start + printer.BLOCK_LINES]
+        block += [printer._WHITE_ROW] * (printer.BLOCK_LINES - len(block))
+        buf += printer._BLOCK_MARKER + b"".join(block)
+    buf += printer._FOOTER
+    return bytes(buf)
+
+
+def main(n: int) -> None:
+    img = printer.render_label(LOT)
+    print(f"Étiquette {img.size[0]}x{img.size[1]} px, {n} répétitions\n")
+    print(f"{'':28}{'avant':>12}{'après':>12}{'gain':>9}")
+    for ble in (True, False):
+        assert legacy_payload(LOT, ble) == printer._build_payload(LOT, ble, trim=False)
+        old = min(timeit.repeat(lambda: legacy_payload(LOT, ble), number=n, repeat=3)) / n
+        new = min(timeit.repeat(lambda: printer._build_payload(LOT, ble), number=n, repeat=3)) / n
+        label = "payload BLE" if ble else "payload RFCOMM (0x0A→0x14)"
+        print(f"{label:28}{old * 1e3:10.2f}ms{new * 1e3:10.2f}ms{old / new:8.1f}x")
+
+    # Octets à transmettre
+    full = len(printer._build_payload(LOT, trim=False))
+    compact = len(printer._build_payload(LOT))
+    bands = len(printer._build_payload(LOT, feed_bands=True))
+    print(f"{'payload (octets)':28}{full:12d}{compact:12d}{full / compact:8.1f}x"
+          f"   (avec ESC J : {bands})")
+
+    # Rendu Pillow : cache vide (polices déjà chargées) vs cache LRU
+    def cold():
+        printer._render_label_cached.cache_clear()
+        return printer.render_label(LOT)
+    old = min(timeit.repeat(cold, number=n, repeat=3)) / n
+    new = min(timeit.repeat(lambda: printer.render_label(LOT), number=n, repeat=3)) / n
+    print(f"{'rendu (cache vide / LRU)':28}{old * 1e3:10.2f}ms{new * 1e3:10.2f}ms{old / new:8.1f}x")
+
+    # Raster seul (rendu Pillow exclu)
+    old = min(timeit.repeat(lambda: [img.getpixel((x, y)) for y in range(img.size[1])
+                                     for x in range(printer.PRINT_WIDTH)], number=n, repeat=3)) / n
+    new = min(timeit.repeat(lambda: printer._raster_rows(img), number=n, repeat=3)) / n
+    print(f"{'raster seul':28}{old * 1e3:10.2f}ms{new * 1e3:10.2f}ms{old / new:8.1f}x")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20)
@@ -0,0 +1,82 @@
+"""
+bench_status.py — Micro-benchmark du classement DLC (hors suite pytest).
+
+Classe 50 000 lots (red / yellow / green / unknown) :
+  - avant : status_for() par lot (fromisoformat + date.today() à chaque appel)
+  - après : classify_statuses() — bornes calculées une fois, comparaison de
+    chaînes ISO, validation mémorisée par date distincte
+  - SQL   : CASE de status_case_sql() évalué par SQLite (base temporaire)
+
+Usage (depuis la racine du dépôt, par ex. sur le Raspberry Pi) :
+    PYTHONPATH=domovra_dev/app python tests/bench_status.py [nb_lots]
+"""
+import datetime
+import os
+import random
+import sys
+import tempfile
+import timeit
+
+import db
+
+WARN, CRIT = 30, 14
+
+
+def sample_dates(n: int) -> list:
+    rnd = random.Random(42)
+    today = datetime.date.today()
+    out = []
+    for _ in range(n):
+        r = rnd.random()
+        if r < 0.05:
+            out.append(None)
+        elif r < 0.07:
+            out.append("n/a")
+        else:
+            out.append((today + datetime.timedelta(days=rnd.randint(-60, 720))).isoformat())
+    return out
+
+
+def main(n: int) -> None:
+    dates = sample_dates(n)
+    assert db.classify_statuses(dates, WARN, CRIT) == [db.status_for(bb, WARN, CRIT) for bb in dates]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DB_PATH = os.path.join(tmp, "bench.db")
+        db.init_db()
+        with db._conn() as c:
+            c.execute("INSERT INTO locations(name) VALUES ('Frigo')")
+            c.execute("INSERT INTO products(name) VALUES ('Yaourt')")
+            c.executemany(
+                "INSERT INTO stock_lots(product_id, location_id, qty, best_before) VALUES (1, 1, 1, ?)",
+                [(bb,) for bb in dates])
+            c.commit()
+
+            case_sql, params = db.status_case_sql(WARN, CRIT)
+            sql = f"SELECT {case_sql} AS status FROM stock_lots l ORDER BY l.id"
+
+            def in_sql():
+                return [r["status"] for r in c.execute(sql, params)]
+
+            def fetch_only():
+                return [r["best_before"] for r in c.execute("SELECT l.best_before FROM stock_lots l ORDER BY l.id")]
+
+            assert in_sql() == db.classify_statuses(dates, WARN, CRIT)
+
+            print(f"{n} lots\n")
+            print(f"{'':34}{'temps':>10}{'gain':>9}")
+            old = min(timeit.repeat(lambda: [db.status_for(bb, WARN, CRIT) for bb in dates],
+                                    number=1, repeat=5))
+            rows = [
+                ("status_for par lot", old),
+                ("classify_statuses", min(timeit.repeat(
+                    lambda: db.classify_statuses(dates, WARN, CRIT), number=1, repeat=5))),
+                ("SELECT best_before seul", min(timeit.repeat(fetch_only, number=1, repeat=5))),
+                ("SELECT + CASE (status_case_sql)", min(timeit.repeat(in_sql, number=1, repeat=5))),
+            ]
+            for label, t in rows:
+                print(f"{label:34}{t * 1e3:8.1f}ms{old / t:8.1f}x")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 50_000)
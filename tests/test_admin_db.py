@@ -0,0 +1,128 @@
+"""
+test_admin_db.py — Navigation admin DB : pagination par curseur (keyset),
+comptages mis en cache sur la génération d'écriture, projection de colonnes.
+"""
+import json
+import sqlite3
+
+import pytest
+
+import db
+from routes import admin_db
+
+
+@pytest.fixture()
+def admin(tmp_db, monkeypatch):
+    monkeypatch.setattr(admin_db, "DB_PATH", tmp_db)
+    admin_db._count_cache.clear()
+    with db._conn() as c:
+        c.executemany("INSERT INTO locations(name) VALUES (?)", [(f"L{i:03d}",) for i in range(1, 121)])
+        c.commit()
+    return tmp_db
+
+
+def _ids(res):
+    return [r["id"] for r in res["rows"]]
+
+
+class TestWriteGeneration:
+
+    def test_bumped_by_raw_sql(self, tmp_db):
+        before = db.write_generation("locations")
+        with db._conn() as c:
+            c.execute("INSERT INTO locations(name) VALUES ('Cave')")
+            c.execute("UPDATE locations SET description='x' WHERE name='Cave'")
+            c.commit()
+        assert db.write_generation("locations") == before + 2
+        assert db.write_generation("products") == 0
+
+
+class TestKeysetPagination:
+
+    def test_rowid_pages_forward_and_back(self, admin):
+        p1 = admin_db._table_page("locations", 1, 50, None, True)
+        assert p1["keyset"] and p1["total"] == 120
+        assert _ids(p1) == list(range(120, 70, -1))
+        assert not p1["has_prev"] and p1["has_next"]
+
+        p2 = admin_db._table_page("locations", 2, 50, None, True, after=p1["last_cursor"])
+        assert _ids(p2) == list(range(70, 20, -1))
+
+        p3 = admin_db._table_page("locations", 3, 50, None, True, after=p2["last_cursor"])
+        assert _ids(p3) == list(range(20, 0, -1))
+        assert p3["has_prev"] and not p3["has_next"]
+
+        back = admin_db._table_page("locations", 2, 50, None, True, before=p3["first_cursor"])
+        assert _ids(back) == _ids(p2)
+        assert back["has_prev"] and back["has_next"]
+
+    def test_last_page(self, admin):
+        res = admin_db._table_page("locations", 1, 50, None, True, last=True)
+        assert _ids(res) == list(range(20, 0, -1))
+        assert res["page"] == 3
+        assert res["has_prev"] and not res["has_next"]
+
+    def test_indexed_column_cursor(self, admin):
+        # locations.name : UNIQUE NOT NULL → index utilisable comme curseur
+        p1 = admin_db._table_page("locations", 1, 50, "name", False)
+        assert p1["keyset"]
+        assert p1["rows"][0]["name"] == "L001"
+        p2 = admin_db._table_page("locations", 2, 50, "name", False, after=p1["last_cursor"])
+        assert p2["rows"][0]["name"] == "L051"
+
+    def test_unindexed_column_falls_back_to_offset(self, admin):
+        res = admin_db._table_page("locations", 2, 50, "description", True)
+        assert not res["keyset"]
+        assert len(res["rows"]) == 50 and res["has_prev"] and res["has_next"]
+
+    def test_deep_page_does_not_scan(self, admin):
+        # Le plan d'une page « profonde » passe par la clé primaire (SEARCH), sans OFFSET
+        with sqlite3.connect(admin) as c:
+            plan = " ".join(r[-1] for r in c.execute(
+                "EXPLAIN QUERY PLAN SELECT id, rowid FROM locations WHERE rowid < 10 "
+                "ORDER BY rowid DESC LIMIT 51"))
+        assert "SEARCH" in plan
+
+    def test_invalid_cursor(self, admin):
+        with pytest.raises(admin_db.HTTPException) as exc:
+            admin_db._table_page("locations", 2, 50, None, True, after="not-json")
+        assert exc.value.status_code == 400
+
+
+class TestCountCache:
+
+    def test_count_reused_until_write(self, admin):
+        statements = []
+        with db._conn() as c:
+            c.set_trace_callback(statements.append)
+            assert admin_db._count(c, "locations") == 120
+            assert admin_db._count(c, "locations") == 120
+            assert sum("COUNT(*)" in s for s in statements) == 1
+            c.execute("INSERT INTO locations(name) VALUES ('Garage')")
+            c.commit()
+            assert admin_db._count(c, "locations") == 121
+            assert sum("COUNT(*)" in s for s in statements) == 2
+
+
+class TestProjection:
+
+    def test_cols_param(self, admin):
+        res = admin_db._table_page("locations", 1, 10, None, True, cols="name, bogus")
+        assert res["columns"] == ["name"]
+        assert set(res["rows"][0]) == {"name"}
+        assert "id" in res["all_columns"]
+
+    def test_sort_column_not_projected(self, admin):
+        # Tri sur une colonne indexée absente de ?cols : le curseur reste calculable
+        p1 = admin_db._table_page("locations", 1, 50, "name", False, cols="description")
+        assert p1["keyset"] and p1["columns"] == ["description"]
+        p2 = admin_db._table_page("locations", 2, 50, "name", False, after=p1["last_cursor"],
+                                  cols="description")
+        assert len(p2["rows"]) == 50
+        assert json.loads(p2["first_cursor"])[0] == "L051"
+        assert admin_db._table_page("locations", 1, 10, "id", True, cols="name")["rows"][0]["name"] == "L120"
+
+    def test_csv_projection(self, admin):
+        out = admin_db._table_csv("locations", None, True, cols="name").decode()
+        assert out.splitlines()[0] == "name"
+        assert out.splitlines()[1] == "L120"
@@ -0,0 +1,109 @@
+"""
+test_compression.py — Compression des réponses (seuil, liste blanche de
+types, flux) et assets statiques précompressés au démarrage.
+
+Brotli est optionnel : les tests forcent gzip via Accept-Encoding.
+"""
+import gzip
+import os
+import time
+
+import pytest
+
+httpx = pytest.importorskip("httpx")
+
+from starlette.applications import Starlette
+from starlette.responses import HTMLResponse, Response, StreamingResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from utils import compression, static_files
+
+BIG = "<p>" + "Crème fraîche " * 400 + "</p>"
+GZ = {"accept-encoding": "gzip"}
+
+
+def _app():
+    async def page(request):
+        return HTMLResponse(BIG)
+
+    async def small(request):
+        return HTMLResponse("<p>ok</p>")
+
+    async def png(request):
+        return Response(b"\x89PNG" + b"\0" * 5000, media_type="image/png")
+
+    async def csv(request):
+        async def rows():
+            for i in range(500):
+                yield f"{i};Lait;2\n".encode()
+        return StreamingResponse(rows(), media_type="text/csv")
+
+    app = Starlette(routes=[Route("/page", page), Route("/small", small),
+                            Route("/png", png), Route("/csv", csv)])
+    app.add_middleware(compression.CompressionMiddleware, minimum_size=1024)
+    return TestClient(app)
+
+
+class TestCompressionMiddleware:
+
+    def test_large_html_is_gzipped(self):
+        r = _app().get("/page", headers=GZ)
+        assert r.headers["content-encoding"] == "gzip"
+        assert "accept-encoding" in r.headers["vary"].lower()
+        assert int(r.headers["content-length"]) < len(BIG.encode()) // 5
+        assert r.text == BIG                       # httpx décompresse
+
+    def test_below_threshold_or_not_allowed(self):
+        client = _app()
+        assert "content-encoding" not in client.get("/small", headers=GZ).headers
+        assert "content-encoding" not in client.get("/png", headers=GZ).headers
+        assert "content-encoding" not in client.get("/page", headers={"accept-encoding": "identity"}).headers
+
+    def test_streaming_response(self):
+        r = _app().get("/csv", headers=GZ)
+        assert r.headers["content-encoding"] == "gzip"
+        assert r.text.splitlines()[499] == "499;Lait;2"
+
+    def test_pick_encoding(self):
+        assert compression.pick_encoding("gzip, deflate") == "gzip"
+        assert compression.pick_encoding("gzip;q=0, deflate") is None
+        assert compression.pick_encoding("") is None
+
+
+class TestPrecompressedStatic:
+
+    @pytest.fixture()
+    def static(self, tmp_path):
+        (tmp_path / "app.css").write_text("body { color: red; }\n" * 200)
+        (tmp_path / "tiny.js").write_text("1")
+        (tmp_path / "gone.css.gz").write_bytes(b"")
+        return tmp_path
+
+    def test_variants_written_and_served(self, static, monkeypatch):
+        monkeypatch.setattr(static_files, "brotli", None)
+        assert static_files.precompress_static(str(static), min_size=100) == 1
+        assert (static / "app.css.gz").is_file()
+        assert not (static / "tiny.js.gz").exists()
+        assert not (static / "gone.css.gz").exists()            # orphelin supprimé
+        assert static_files.precompress_static(str(static), min_size=100) == 0
+
+        app = Starlette()
+        app.add_middleware(compression.CompressionMiddleware)
+        app.mount("/static", static_files.CachedStaticFiles(directory=str(static)))
+        r = TestClient(app).get("/static/app.css", headers=GZ)
+        assert r.headers["content-encoding"] == "gzip"
+        assert r.headers["content-type"].startswith("text/css")
+        assert int(r.headers["content-length"]) == os.path.getsize(static / "app.css.gz")
+        assert r.text == (static / "app.css").read_text()
+
+    def test_stale_variant_ignored(self, static, monkeypatch):
+        monkeypatch.setattr(static_files, "brotli", None)
+        (static / "app.css.gz").write_bytes(gzip.compress(b"old"))
+        past = time.time() - 60
+        os.utime(static / "app.css.gz", (past, past))
+        app = Starlette()
+        app.mount("/static", static_files.CachedStaticFiles(directory=str(static)))
+        r = TestClient(app).get("/static/app.css", headers=GZ)
+        assert "content-encoding" not in r.headers
+        assert r.text.startswith("body")
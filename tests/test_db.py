@@ -6,7 +6,10 @@ Couvre :
   - Products   : add, list, duplicate idempotent, update, delete cascade, low_stock
   - Lots       : add, list, consume_lot (partiel + total + lot inexistant), update_lot,
                  delete_lot, status DLC (red/yellow/green/unknown/no_expiry)
+  - query_lots : filtres SQL (texte, produit, emplacement, statut → bornes DLC), pagination
   - Insights   : get_product_info (total_qty, FIFO, lots_count)
+  - Recherche  : search_products (FTS5 : préfixes, accents, EAN, marque, triggers)
+  - EAN        : normalize_barcode, index mémoire find_product_by_barcode (sync + bulk)
 """
 import datetime
 import pytest
@@ -282,6 +285,91 @@ class TestStatusFor:
         assert db.status_for(far, 60, 45) == "yellow"
 
 
+class TestClassifyStatuses:
+
+    DATES = [None, "", "not-a-date", "2025-02-30", "2025-1-5", "20250105", "2025-01-05T00:00",
+             _past(1), _future(0), _future(14), _future(15), _future(30), _future(31), _future(400)]
+
+    @pytest.mark.parametrize("warn,crit", [(30, 14), (60, 45), (3, 10), (0, 0)])
+    def test_matches_status_for(self, warn, crit):
+        expected = [db.status_for(bb, warn, crit) for bb in self.DATES]
+        assert db.classify_statuses(self.DATES, warn, crit) == expected
+
+    def test_classify_lots_sets_status_in_place(self):
+        lots = [{"best_before": _future(60)}, {"best_before": None}, {}]
+        assert db.classify_lots(lots, 30, 14) is lots
+        assert [l["status"] for l in lots] == ["green", "unknown", "unknown"]
+
+
+# ─────────────────────────────────────────────
+# query_lots — filtres SQL de la page Stocks
+# ─────────────────────────────────────────────
+
+class TestQueryLots:
+
+    @pytest.fixture()
+    def stock(self, tmp_db):
+        frigo, cave = _loc("Frigo"), _loc("Cave")
+        creme, vin = _prod("Crème fraîche", unit="g"), _prod("Vin", unit="bouteille")
+        dates = [_past(3), _future(14), _future(15), _future(30), _future(31), None, "n/a"]
+        for i, bb in enumerate(dates):
+            _lot(creme if i % 2 else vin, frigo if i < 4 else cave, qty=float(i), best_before=bb)
+        return dates
+
+    def test_status_matches_status_for(self, stock):
+        items, total = db.query_lots(warn_days=30, crit_days=14)
+        assert total == len(stock)
+        for it in items:
+            assert it["status"] == db.status_for(it["best_before"], 30, 14)
+
+    @pytest.mark.parametrize("status,expected", [("red", 2), ("yellow", 2), ("green", 1), ("unknown", 2)])
+    def test_status_filter_uses_date_ranges(self, stock, status, expected):
+        items, total = db.query_lots(status=status, warn_days=30, crit_days=14)
+        assert total == expected
+        assert {it["status"] for it in items} == {status}
+
+    def test_text_location_product_filters(self, stock):
+        assert db.query_lots(q="creme")[1] == 3              # insensible aux accents
+        assert db.query_lots(location="cave")[1] == 3
+        assert db.query_lots(product="vin", location="Frigo")[1] == 2
+        assert db.query_lots(hide_zero=True)[1] == len(stock) - 1   # le lot qty=0
+
+    def test_pagination(self, stock):
+        first, total = db.query_lots(limit=3)
+        rest, _ = db.query_lots(limit=10, offset=3)
+        assert total == len(stock) and len(first) == 3 and len(rest) == 4
+        assert [i["id"] for i in first + rest] == [i["id"] for i in db.list_lots()]
+
+    def test_non_canonical_dates_unknown_everywhere(self, tmp_db):
+        frigo, lait = _loc("Frigo"), _prod("Lait")
+        for bb in ("20250105", "2025-01-05T00:00", "2025-01-05"):
+            _lot(lait, frigo, best_before=bb)
+        items, _ = db.query_lots(warn_days=30, crit_days=14)
+        got = {it["best_before"]: it["status"] for it in items}
+        assert got["20250105"] == got["2025-01-05T00:00"] == "unknown"
+        assert got["2025-01-05"] == "red"
+        for bb, st in got.items():
+            assert db.status_for(bb, 30, 14) == st
+            assert db.classify_statuses([bb], 30, 14) == [st]
+        assert db.query_lots(status="unknown", warn_days=30, crit_days=14)[1] == 2
+
+    def test_pagination_stable_on_ties(self, tmp_db):
+        frigo, lait = _loc("Frigo"), _prod("Lait")
+        ids = [_lot(lait, frigo, best_before="2030-01-01") for _ in range(5)]
+        pages = [db.query_lots(limit=2, offset=o)[0] for o in (0, 2, 4)]
+        assert [i["id"] for page in pages for i in page] == sorted(ids)
+
+    def test_location_status_counts(self, stock):
+        expected = {}
+        for l in db.classify_lots(db.list_lots(), 30, 14):
+            cnt = expected.setdefault(l["location_id"], {"total": 0, "soon": 0, "urgent": 0})
+            cnt["total"] += 1
+            cnt["soon"] += l["status"] == "yellow"
+            cnt["urgent"] += l["status"] == "red"
+        assert db.location_status_counts(30, 14) == expected
+        assert sum(c["total"] for c in expected.values()) == len(stock)
+
+
 # ─────────────────────────────────────────────
 # get_product_info
 # ─────────────────────────────────────────────
@@ -321,3 +409,118 @@ class TestGetProductInfo:
         assert info["total_qty"] == 0.0
         assert info["lots_count"] == 0
         assert info["fifo"] is None
+
+
+# ─────────────────────────────────────────────
+# search_products (FTS5)
+# ─────────────────────────────────────────────
+
+class TestSearchProducts:
+
+    def test_prefix_and_accent_insensitive(self, tmp_db):
+        pid = _prod("Crème fraîche épaisse")
+        _prod("Lait")
+        assert [p["id"] for p in db.search_products("creme fra")] == [pid]
+        assert [p["id"] for p in db.search_products("EPAIS")] == [pid]
+
+    def test_matches_all_barcodes(self, tmp_db):
+        pid = _prod("Pâtes")
+        db.add_product_barcode(pid, "8076800195057")
+        db.add_product_barcode(pid, "3038350013804")
+        assert [p["id"] for p in db.search_products("303835")] == [pid]
+        assert [p["id"] for p in db.search_products("8076800195057")] == [pid]
+
+    def test_triggers_follow_updates_and_deletes(self, tmp_db):
+        pid = _prod("Biscuits")
+        db.update_product(pid, "Sablés bretons", "pièce", 90, None, None)
+        assert db.search_products("biscuits") == []
+        assert [p["id"] for p in db.search_products("sable")] == [pid]
+        db.add_product_barcode(pid, "11111111")  # recopié dans products.barcode
+        bc_id = db.add_product_barcode(pid, "12345678")
+        assert [p["id"] for p in db.search_products("12345678")] == [pid]
+        db.delete_product_barcode(bc_id)
+        assert db.search_products("12345678") == []
+        db.delete_product(pid)
+        assert db.search_products("sable") == []
+
+    def test_brand_from_lots(self, tmp_db):
+        loc_id = _loc()
+        pid = _prod("Chocolat noir")
+        lot_id = _lot(pid, loc_id)
+        with db._conn() as c:
+            c.execute("UPDATE stock_lots SET brand=? WHERE id=?", ("Côte d'Or", lot_id))
+            c.commit()
+        assert [p["id"] for p in db.search_products("cote")] == [pid]
+
+    def test_brand_gone_with_deleted_lot(self, tmp_db):
+        loc_id = _loc()
+        pid = _prod("Chocolat noir")
+        lot_id = _lot(pid, loc_id)
+        with db._conn() as c:
+            c.execute("UPDATE stock_lots SET brand=? WHERE id=?", ("Côte d'Or", lot_id))
+            c.commit()
+        db.delete_lot(lot_id)
+        assert db.search_products("cote") == []
+        assert [p["id"] for p in db.search_products("chocolat")] == [pid]
+
+    def test_name_ranks_before_description(self, tmp_db):
+        in_desc = _prod("Sauce", description="à base de tomate")
+        in_name = _prod("Tomates cerises")
+        assert [p["id"] for p in db.search_products("tomate")] == [in_name, in_desc]
+
+    def test_special_characters_are_neutralised(self, tmp_db):
+        _prod("Lait")
+        assert db.search_products('lait" OR *') == []
+        assert db.search_products("  ") == []
+
+
+# ─────────────────────────────────────────────
+# Index mémoire EAN (find_product_by_barcode)
+# ─────────────────────────────────────────────
+
+class TestBarcodeIndex:
+
+    def test_normalize_barcode(self):
+        assert db.normalize_barcode(" 3017620 425035 ") == "3017620425035"
+        assert db.normalize_barcode("012345678905") == "0012345678905"     # UPC-A
+        assert db.normalize_barcode("00012345678905") == "0012345678905"   # GTIN-14
+        assert db.normalize_barcode("96385074") == "96385074"              # EAN-8
+        assert db.normalize_barcode("ABC-12") == "ABC-12"
+
+    def test_upc_matches_stored_ean13(self, tmp_db):
+        pid = _prod("Soda")
+        db.add_product_barcode(pid, "0012345678905")
+        assert db.find_product_by_barcode("012345678905")["id"] == pid
+
+    def test_index_follows_writes(self, tmp_db):
+        pid = _prod("Pâtes")
+        assert db.find_product_by_barcode("8076800195057") is None
+        bc_id = db.add_product_barcode(pid, "8076800195057")
+        db.add_product_barcode(pid, "8076809513753")
+        assert db.find_product_by_barcode("8076800195057")["id"] == pid
+
+        db.update_product(pid, "Spaghetti", "g", 365)
+        assert db.find_product_by_barcode("8076809513753")["name"] == "Spaghetti"
+
+        db.delete_product_barcode(bc_id)
+        # reste connu via products.barcode (backfill du premier EAN)
+        assert db.find_product_by_barcode("8076800195057")["id"] == pid
+
+        db.delete_product(pid)
+        assert db.find_product_by_barcode("8076809513753") is None
+        assert db.find_product_by_barcode("8076800195057") is None
+
+    def test_miss_falls_back_to_raw_sql_writes(self, tmp_db):
+        pid = _prod("Café")
+        db.find_product_by_barcode("1")  # charge l'index
+        with db._conn() as c:
+            c.execute("UPDATE products SET barcode='3045320001525' WHERE id=?", (pid,))
+            c.commit()
+        assert db.find_product_by_barcode("3045320001525")["id"] == pid
+
+    def test_bulk_lookup(self, tmp_db):
+        pid = _prod("Nutella")
+        db.add_product_barcode(pid, "3017620425035")
+        res = db.find_products_by_barcodes(["3017620425035", "999"])
+        assert res["3017620425035"]["id"] == pid
+        assert res["999"] is None
@@ -0,0 +1,111 @@
+"""
+test_db_pool.py — Les routes async lourdes (admin DB, import CSV) passent
+par le pool DB (utils.db_pool) et ne bloquent pas la boucle asyncio.
+
+L'export est artificiellement « long » : la sérialisation CSV attend un
+signal du test. Pendant ce temps, /ping doit répondre immédiatement.
+"""
+import asyncio
+import threading
+import time
+
+import pytest
+
+httpx = pytest.importorskip("httpx")
+
+from fastapi import FastAPI
+
+import db
+from routes import admin_db, export_import, home
+from utils import db_pool
+
+INGRESS = {"x-ingress-path": "/"}
+
+
+@pytest.fixture()
+def app(tmp_db, monkeypatch):
+    monkeypatch.setattr(admin_db, "DB_PATH", tmp_db)
+    application = FastAPI()
+    application.include_router(home.router)
+    application.include_router(admin_db.router)
+    application.include_router(export_import.router)
+    return application
+
+
+def _client(app):
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test")
+
+
+class TestDbPool:
+
+    def test_run_db_is_bounded(self, monkeypatch):
+        monkeypatch.setattr(db_pool, "_executor", None)
+        monkeypatch.setattr(db_pool, "DB_WORKERS", 2)
+        active = []
+        peak = []
+        lock = threading.Lock()
+
+        def work():
+            with lock:
+                active.append(1)
+                peak.append(len(active))
+            time.sleep(0.05)
+            with lock:
+                active.pop()
+            return threading.current_thread().name
+
+        async def main():
+            return await asyncio.gather(*(db_pool.run_db(work) for _ in range(6)))
+
+        names = asyncio.run(main())
+        assert max(peak) <= 2
+        assert all(n.startswith("domovra-db") for n in names)
+
+    def test_ping_responsive_during_export(self, app, monkeypatch):
+        db.add_location("Frigo")
+        started = threading.Event()
+        release = threading.Event()
+        real = admin_db._sanitize_csv_cell
+
+        def slow_cell(value):
+            started.set()
+            release.wait(timeout=5)
+            return real(value)
+
+        monkeypatch.setattr(admin_db, "_sanitize_csv_cell", slow_cell)
+
+        async def main():
+            async with _client(app) as client:
+                export = asyncio.create_task(
+                    client.get("/admin/db/table/locations/export.csv", headers=INGRESS))
+                while not started.is_set():
+                    await asyncio.sleep(0.01)
+                t0 = time.monotonic()
+                ping = await asyncio.wait_for(client.get("/ping"), timeout=2)
+                elapsed = time.monotonic() - t0
+                still_running = not export.done()
+                release.set()
+                return ping, elapsed, still_running, await export
+
+        ping, elapsed, still_running, export = asyncio.run(main())
+        assert ping.status_code == 200 and ping.text == "ok"
+        assert still_running
+        assert elapsed < 1.0
+        assert export.status_code == 200
+        assert "Frigo" in export.text
+
+    def test_import_products_runs_in_pool(self, app):
+        csv_data = "name;unit;barcode\nLait;L;3017620422003\nBeurre;g;\n".encode("utf-8")
+
+        async def main():
+            async with _client(app) as client:
+                return await client.post(
+                    "/data/import/products",
+                    files={"file": ("p.csv", csv_data, "text/csv")},
+                    data={"on_conflict": "skip"},
+                )
+
+        r = asyncio.run(main())
+        assert r.status_code == 200
+        assert r.json()["imported"] == 2
+        assert db.find_product_by_barcode("3017620422003")["name"] == "Lait"
@@ -0,0 +1,45 @@
+"""
+test_export_import.py — Import CSV des produits : les EAN importés
+rejoignent product_barcodes (recherche par code-barres, multi-EAN,
+enrichissement OFF), à la création comme à la mise à jour.
+"""
+import pytest
+
+httpx = pytest.importorskip("httpx")
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import db
+from routes import export_import
+
+EAN = "3017620425035"
+
+
+@pytest.fixture()
+def client(tmp_db):
+    app = FastAPI()
+    app.include_router(export_import.router)
+    return TestClient(app)
+
+
+def _import(client, csv_text, on_conflict="skip"):
+    r = client.post("/data/import/products",
+                    files={"file": ("p.csv", csv_text.encode("utf-8"), "text/csv")},
+                    data={"on_conflict": on_conflict})
+    assert r.status_code == 200 and not r.json()["errors"]
+    return r.json()
+
+
+class TestImportProducts:
+
+    def test_barcode_registered(self, client):
+        assert _import(client, f"name;unit;barcode\nNutella;g;{EAN}\nBeurre;g;\n")["imported"] == 2
+        pid = db.find_product_by_barcode(EAN)["id"]
+        assert [b["barcode"] for b in db.get_product_barcodes(pid)] == [EAN]
+        assert [p["id"] for p in db.search_products(EAN)] == [pid]
+
+    def test_barcode_added_on_update(self, client):
+        pid = db.add_product("Nutella", "g")
+        assert _import(client, f"name;barcode\nNutella;{EAN}\n", on_conflict="update")["updated"] == 1
+        assert [b["barcode"] for b in db.get_product_barcodes(pid)] == [EAN]
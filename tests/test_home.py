@@ -0,0 +1,63 @@
+"""
+test_home.py — Modèle du tableau de bord mis en cache (génération
+d'écriture + date du jour) ; détail debug seulement pour /api/home-debug.
+"""
+import datetime
+import types
+
+import pytest
+
+import db
+from routes import home
+
+
+@pytest.fixture()
+def dash(tmp_db, monkeypatch):
+    monkeypatch.setattr(home, "_dashboard_cache", {})
+    calls = []
+    real = home.list_lots
+
+    def counting_list_lots():
+        calls.append(1)
+        return real()
+
+    monkeypatch.setattr(home, "list_lots", counting_list_lots)
+    loc = db.add_location("Frigo")
+    pid = db.add_product("Yaourt", "pot", min_qty=4)
+    db.add_lot(pid, loc, 2, None, (datetime.date.today() + datetime.timedelta(days=3)).isoformat())
+    return calls
+
+
+class TestDashboardCache:
+
+    def test_reused_until_write(self, dash):
+        m1 = home._dashboard_model(30, 14)
+        m2 = home._dashboard_model(30, 14)
+        assert m1 is m2 and len(dash) == 1
+        assert m1["lots"][0]["status"] == "red"
+        assert [p["name"] for p in m1["low_products"]] == ["Yaourt"]
+
+        with db._conn() as c:
+            c.execute("UPDATE stock_lots SET qty = 5")
+            c.commit()
+        m3 = home._dashboard_model(30, 14)
+        assert len(dash) == 2
+        assert m3["low_products"] == []
+
+    def test_invalidated_by_date_and_thresholds(self, dash, monkeypatch):
+        home._dashboard_model(30, 14)
+        home._dashboard_model(30, 2)
+        assert len(dash) == 2
+
+        tomorrow = datetime.date.today() + datetime.timedelta(days=1)
+        monkeypatch.setattr(home, "datetime", types.SimpleNamespace(
+            date=types.SimpleNamespace(today=lambda: tomorrow)))
+        home._dashboard_model(30, 2)
+        assert len(dash) == 3
+
+    def test_debug_list_only_on_request(self, dash):
+        products = db.list_products()
+        lots = db.list_lots()
+        assert home._compute_low_products(products, lots)[2] == []
+        dbg = home._compute_low_products(products, lots, debug=True)[2]
+        assert dbg[0]["name"] == "Yaourt" and dbg[0]["lack"] == 2.0
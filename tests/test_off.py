@@ -0,0 +1,197 @@
+"""
+test_off.py — Tests du cache Open Food Facts (services/off.py).
+
+Un petit serveur HTTP local remplace openfoodfacts.org (OFF_BASE_URL).
+
+Couvre :
+  - Cache      : hit frais (pas d'appel réseau), TTL expiré → rafraîchi
+  - Négatif    : "notfound" mis en cache
+  - Hors ligne : entrée périmée servie (stale), sinon erreur offline
+  - Coalescing : scans concurrents du même EAN → un seul appel réseau
+  - Job        : enrichissement en masse (progression, débit, annulation, reprise)
+"""
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from services import off
+
+
+# ─────────────────────────────────────────────
+# Serveur OFF local
+# ─────────────────────────────────────────────
+
+class _StubOFF:
+    def __init__(self):
+        self.products = {}
+        self.hits = []
+        self.delay = 0.0
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                code = self.path.rsplit("/", 1)[-1].replace(".json", "")
+                stub.hits.append(code)
+                time.sleep(stub.delay)
+                product = stub.products.get(code)
+                body = {"status": 1, "product": product} if product else {"status": 0}
+                raw = json.dumps(body).encode()
+                self.send_response(200 if product else 404)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(raw)))
+                self.end_headers()
+                self.wfile.write(raw)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+        threading.Thread(target=self.server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture()
+def stub(tmp_db, monkeypatch):          # off_cache : migration 4 (schema.migrate via init_db)
+    s = _StubOFF()
+    s.products["3017620425035"] = {"product_name": "Nutella", "brands": "Ferrero", "quantity": "400 g"}
+    monkeypatch.setattr(off, "OFF_BASE_URL", s.url)
+    yield s
+    s.close()
+
+
+def _age(barcode, seconds):
+    with off._conn() as c:
+        c.execute("UPDATE off_cache SET fetched_at = fetched_at - ? WHERE barcode=?", (seconds, barcode))
+        c.commit()
+
+
+# ─────────────────────────────────────────────
+# Lookup
+# ─────────────────────────────────────────────
+
+class TestOffLookup:
+
+    def test_found_then_cached(self, stub):
+        r1 = asyncio.run(off.lookup("3017620425035"))
+        r2 = asyncio.run(off.lookup("3017620425035"))
+        assert r1["ok"] and r1["name"] == "Nutella" and r1["brand"] == "Ferrero"
+        assert r1["cached"] is False and r2["cached"] is True
+        assert stub.hits == ["3017620425035"]
+
+    def test_notfound_is_cached(self, stub):
+        r1 = asyncio.run(off.lookup("12345678"))
+        r2 = asyncio.run(off.lookup("12345678"))
+        assert r1 == {"ok": False, "error": "notfound", "cached": False, "stale": False}
+        assert r2["error"] == "notfound" and r2["cached"] is True
+        assert stub.hits == ["12345678"]
+
+    def test_expired_entry_is_refreshed(self, stub):
+        asyncio.run(off.lookup("3017620425035"))
+        _age("3017620425035", off.TTL_FOUND + 1)
+        stub.products["3017620425035"]["product_name"] = "Nutella B-ready"
+        r = asyncio.run(off.lookup("3017620425035"))
+        assert r["name"] == "Nutella B-ready" and r["cached"] is False
+        assert len(stub.hits) == 2
+
+    def test_offline_serves_stale(self, stub, monkeypatch):
+        asyncio.run(off.lookup("3017620425035"))
+        _age("3017620425035", off.TTL_FOUND + 1)
+        monkeypatch.setattr(off, "OFF_BASE_URL", "http://127.0.0.1:9")  # port fermé
+        r = asyncio.run(off.lookup("3017620425035"))
+        assert r["ok"] and r["stale"] is True and r["name"] == "Nutella"
+
+    def test_offline_without_cache(self, stub, monkeypatch):
+        monkeypatch.setattr(off, "OFF_BASE_URL", "http://127.0.0.1:9")
+        assert asyncio.run(off.lookup("3017620425035")) == {"ok": False, "error": "offline"}
+
+    def test_concurrent_lookups_are_coalesced(self, stub):
+        stub.delay = 0.2
+
+        async def burst():
+            return await asyncio.gather(*(off.lookup("3017620425035") for _ in range(5)))
+
+        results = asyncio.run(burst())
+        assert all(r["name"] == "Nutella" for r in results)
+        assert stub.hits == ["3017620425035"]
+
+
+# ─────────────────────────────────────────────
+# Enrichissement en masse
+# ─────────────────────────────────────────────
+
+def _seed_barcodes(*codes):
+    import db
+    pid = db.add_product("Produit scanné", unit="pièce")
+    for code in codes:
+        db.add_product_barcode(pid, code)
+
+
+class TestOffEnrichment:
+
+    def test_enriches_pending_barcodes(self, stub):
+        _seed_barcodes("3017620425035", "12345678")
+        assert off.pending_barcodes() == ["3017620425035", "12345678"]
+        state = asyncio.run(off.run_enrichment(concurrency=2, rate_per_sec=0))
+        assert state["state"] == "done"
+        assert (state["total"], state["done"], state["found"], state["notfound"]) == (2, 2, 1, 1)
+        assert off.pending_barcodes() == []
+        assert off.cache_get("3017620425035")["data"]["brand"] == "Ferrero"
+
+    def test_enriches_imported_products(self, stub):
+        import db
+        from routes.export_import import _import_products_rows
+        res = _import_products_rows([{"name": "Nutella", "barcode": "3017620425035"}], "skip")
+        assert res["imported"] == 1
+        with db._conn() as c:                    # EAN écrit seulement dans products.barcode
+            c.execute("INSERT INTO products(name, barcode) VALUES ('Biscuits', '12345678')")
+            c.commit()
+        assert off.pending_barcodes() == ["3017620425035", "12345678"]
+        state = asyncio.run(off.run_enrichment(concurrency=2, rate_per_sec=0))
+        assert (state["total"], state["found"], state["notfound"]) == (2, 1, 1)
+        assert off.pending_barcodes() == []
+
+    def test_rate_limit_spaces_requests(self, stub):
+        _seed_barcodes("11111111", "22222222", "33333333")
+        t0 = time.monotonic()
+        asyncio.run(off.run_enrichment(concurrency=3, rate_per_sec=10))
+        assert time.monotonic() - t0 >= 0.2   # 3 départs espacés de 0,1 s
+
+    def test_cancel_then_resume(self, stub):
+        codes = [f"{i:08d}" for i in range(10000001, 10000011)]
+        _seed_barcodes(*codes)
+        stub.delay = 0.05
+
+        async def cancel_midway():
+            state = {}
+            task = asyncio.create_task(off.run_enrichment(concurrency=1, rate_per_sec=0, state=state))
+            while state.get("done", 0) < 3:
+                await asyncio.sleep(0.01)
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+            return state
+
+        state = asyncio.run(cancel_midway())
+        assert state["state"] == "cancelled"
+        remaining = off.pending_barcodes()
+        assert 0 < len(remaining) < len(codes)
+
+        state = asyncio.run(off.run_enrichment(concurrency=4, rate_per_sec=0))
+        assert state["total"] == len(remaining) and state["state"] == "done"
+        assert off.pending_barcodes() == []
+
+    def test_stops_when_offline(self, stub, monkeypatch):
+        _seed_barcodes(*[f"{i:08d}" for i in range(20000001, 20000011)])
+        monkeypatch.setattr(off, "OFF_BASE_URL", "http://127.0.0.1:9")
+        state = asyncio.run(off.run_enrichment(concurrency=1, rate_per_sec=0))
+        assert state["state"] == "offline"
+        assert state["errors"] == off.ENRICH_MAX_OFFLINE_STREAK
+        assert len(off.pending_barcodes()) == 10
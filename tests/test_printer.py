@@ -0,0 +1,671 @@
+"""
+test_printer.py — Tests du rendu raster M110 (services/printer.py).
+
+Couvre :
+  - _raster_rows    : empaquetage identique à la boucle getpixel historique
+  - _build_payload  : framing header / blocs 240 lignes / footer, BLE et RFCOMM
+  - Raster compact  : lignes blanches finales supprimées, dernier bloc à la
+                      hauteur réelle, bandes blanches en ESC J (option)
+  - render_label    : polices chargées une fois, cache LRU des rendus
+  - Session BLE     : réutilisation de la connexion, cache handle/MTU (settings),
+                      reconnexion transparente, fermeture sur inactivité
+                      (pair ATT simulé par socketpair SEQPACKET)
+  - Rythme d'envoi  : délai adaptatif sur EAGAIN, débit rapporté
+  - Pilote asyncio  : impressions concurrentes sérialisées sans bloquer la
+                      boucle, délai global, annulation
+  - Cache GATT      : découverte mémorisée par MAC, re-scan forcé, expiration
+  - Cache disque    : pré-rendu à la création, invalidation, éviction LRU
+  - File d'impression : job groupé sur une session, progression, annulation,
+                      lots d'un commit de liste de courses
+"""
+import asyncio
+import socket
+import struct
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("PIL")
+
+from services import printer
+
+
+# ─────────────────────────────────────────────
+# Référence : ancienne implémentation pixel par pixel
+# ─────────────────────────────────────────────
+
+def _reference_payload(img, ble: bool) -> bytes:
+    w, h = img.size
+    rows = []
+    for y in range(h):
+        row = bytearray(printer.BYTES_PER_ROW)
+        for x in range(printer.PRINT_WIDTH):
+            if img.getpixel((x, y)) == 0:
+                row[x // 8] |= (0x80 >> (x % 8))
+        rows.append(bytes(row) if ble else bytes(0x14 if b == 0x0A else b for b in row))
+    buf = bytearray(printer._HEADER)
+    for start in range(0, max(h, 1), printer.BLOCK_LINES):
+        block = rows[start:start + printer.BLOCK_LINES]
+        block += [printer._WHITE_ROW] * (printer.BLOCK_LINES - len(block))
+        buf += printer._BLOCK_MARKER + b"".join(block)
+    buf += printer._FOOTER
+    return bytes(buf)
+
+
+_LOT = {
+    "name": "Crème fraîche épaisse",
+    "qty": "2", "unit": "pot",
+    "best_before": "2026-11-02", "status": "yellow",
+    "location": "Frigo", "brand": "Elle & Vire", "store": "Lidl",
+}
+
+
+# ─────────────────────────────────────────────
+# Raster
+# ─────────────────────────────────────────────
+
+class TestRaster:
+
+    @pytest.mark.parametrize("ble", [True, False])
+    def test_payload_matches_reference(self, ble):
+        img = printer.render_label(_LOT)
+        assert printer._build_payload(_LOT, ble=ble, trim=False) == _reference_payload(img, ble)
+
+    def test_rfcomm_has_no_linefeed_in_raster(self):
+        from PIL import Image
+        img = Image.new("1", (printer.PRINT_WIDTH, 2), color=1)
+        img.putpixel((4, 0), 0)          # 0b00001000 = 0x08
+        img.putpixel((6, 0), 0)          # + 0b00000010 → 0x0A
+        raster = printer._raster_rows(img)
+        assert raster[0] == 0x0A
+        assert raster.translate(printer._RFCOMM_TABLE)[0] == 0x14
+
+    def test_multi_block_padding(self):
+        from PIL import Image
+        img = Image.new("1", (printer.PRINT_WIDTH, printer.BLOCK_LINES + 10), color=0)
+        payload = printer._frame_raster(printer._raster_rows(img), trim=False)
+        block = printer.BYTES_PER_ROW * printer.BLOCK_LINES
+        expected = (len(printer._HEADER) + 2 * (len(printer._BLOCK_MARKER) + block)
+                    + len(printer._FOOTER))
+        assert len(payload) == expected
+        assert payload.count(printer._BLOCK_MARKER) == 2
+
+
+def _decode(payload: bytes) -> bytes:
+    """Rejoue le flux (GS v 0 + ESC J) en lignes raster, comme le ferait l'imprimante."""
+    assert payload.startswith(printer._HEADER) and payload.endswith(printer._FOOTER)
+    body, out, i = payload[len(printer._HEADER):-len(printer._FOOTER)], bytearray(), 0
+    while i < len(body):
+        if body[i:i + 4] == printer._BLOCK_MARKER[:4]:
+            width, lines = struct.unpack_from("<HH", body, i + 4)
+            assert width == printer.BYTES_PER_ROW and 0 < lines <= printer.BLOCK_LINES
+            out += body[i + 8:i + 8 + width * lines]
+            i += 8 + width * lines
+        else:
+            assert body[i:i + 2] == b"\x1b\x4a"
+            out += printer._WHITE_ROW * body[i + 2]
+            i += 3
+    return bytes(out)
+
+
+class TestCompactRaster:
+
+    def _img(self, height, black_rows):
+        from PIL import Image
+        img = Image.new("1", (printer.PRINT_WIDTH, height), color=1)
+        for y in black_rows:
+            img.putpixel((10, y), 0)
+        return img
+
+    def test_trailing_blank_rows_trimmed(self):
+        raster = printer._raster_rows(self._img(100, [0, 59]))
+        payload = printer._frame_raster(raster)
+        assert payload.count(printer._BLOCK_MARKER[:4]) == 1
+        assert _decode(payload) == raster[:60 * printer.BYTES_PER_ROW]
+        assert len(payload) == (len(printer._HEADER) + 8 + 60 * printer.BYTES_PER_ROW
+                                + len(printer._FOOTER))
+
+    def test_last_block_has_real_height(self):
+        raster = printer._raster_rows(self._img(300, [0, 299]))
+        payload = printer._frame_raster(raster)
+        i = payload.index(printer._BLOCK_MARKER[:4], len(printer._HEADER) + 1)
+        assert struct.unpack_from("<H", payload, i + 6)[0] == 60
+        assert _decode(payload) == raster
+
+    def test_blank_band_becomes_feed(self):
+        raster = printer._raster_rows(self._img(120, [0, 5, 100]))
+        payload = printer._frame_raster(raster, feed_bands=True)
+        assert b"\x1b\x4a" + bytes([94]) in payload            # lignes 6 à 99
+        assert _decode(payload) == raster[:101 * printer.BYTES_PER_ROW]
+        assert len(payload) < len(printer._frame_raster(raster))
+
+    def test_label_payload_is_smaller(self):
+        full = printer._build_payload(_LOT, trim=False)
+        compact = printer._build_payload(_LOT)
+        assert len(compact) < len(full) / 2
+        img = printer.render_label(_LOT)
+        assert _decode(compact) == printer._raster_rows(img)[:len(_decode(compact))]
+        assert _decode(full).startswith(_decode(compact))
+
+
+# ─────────────────────────────────────────────
+# Cache de rendu
+# ─────────────────────────────────────────────
+
+class TestRenderCache:
+
+    def test_same_fields_reuse_bitmap(self):
+        a = printer.render_label(dict(_LOT))
+        b = printer.render_label(dict(_LOT, lot_id=42))   # champ non imprimé
+        assert a is b
+
+    def test_changed_field_renders_again(self):
+        a = printer.render_label(_LOT)
+        b = printer.render_label(dict(_LOT, qty="3"))
+        assert a is not b
+        assert a.tobytes() != b.tobytes()
+
+    def test_fonts_loaded_once(self):
+        printer._render_label_cached.cache_clear()
+        for i in range(5):
+            printer.render_label(dict(_LOT, qty=str(i)))
+        assert printer._fonts.cache_info().misses == 1
+
+
+# ─────────────────────────────────────────────
+# Pair ATT simulé (imprimante)
+# ─────────────────────────────────────────────
+
+_PHOMEMO_UUID = "0000ff02-0000-1000-8000-00805f9b34fb"
+
+
+class FakeAttPeer:
+    """
+    Imprimante simulée à l'autre bout d'un socketpair AF_UNIX/SEQPACKET
+    (mêmes frontières de messages qu'un socket L2CAP) : répond à l'échange
+    MTU et à la découverte des caractéristiques, enregistre les écritures.
+    """
+
+    def __init__(self, mtu=185, write_handle=0x0006):
+        self.mtu = mtu
+        self.write_handle = write_handle
+        self.read_delay = 0.0       # lecteur lent → contre-pression (EAGAIN)
+        self.sndbuf = None          # SO_SNDBUF de notre côté (None = défaut)
+        self.connect_delay = 0.0    # imprimante lente à répondre
+        self.requests = []          # opcodes reçus
+        self.writes = bytearray()   # données reçues via Write Command
+        self.connections = 0
+        self._peers = []
+
+    async def connect_async(self, mac, timeout=35.0):
+        if self.connect_delay:
+            await asyncio.sleep(self.connect_delay)
+        return self.connect(mac, timeout)
+
+    def connect(self, mac, timeout=35.0):
+        ours, theirs = socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+        if self.sndbuf:
+            ours.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, self.sndbuf)
+        self.connections += 1
+        self._peers.append(theirs)
+        threading.Thread(target=self._serve, args=(theirs,), daemon=True).start()
+        return ours
+
+    def wait_bytes(self, n, timeout=2.0):
+        """Attend que n octets aient été reçus (le pair tourne dans son thread)."""
+        deadline = time.monotonic() + timeout
+        while len(self.writes) < n and time.monotonic() < deadline:
+            time.sleep(0.005)
+        return bytes(self.writes)
+
+    def drop(self):
+        """Coupe toutes les connexions (imprimante éteinte)."""
+        for p in self._peers:
+            try: p.shutdown(socket.SHUT_RDWR)
+            except OSError: pass
+            p.close()
+        self._peers.clear()
+
+    def _serve(self, sock):
+        uuid128 = bytes.fromhex(_PHOMEMO_UUID.replace("-", ""))[::-1]
+        while True:
+            try:
+                pkt = sock.recv(4096)
+            except OSError:
+                return
+            if not pkt:
+                return
+            op = pkt[0]
+            self.requests.append(op)
+            if op == 0x02:
+                wanted = struct.unpack_from("<H", pkt, 1)[0]
+                sock.send(struct.pack("<BH", 0x03, min(wanted, self.mtu)))
+            elif op == 0x10:
+                # Un seul service primaire (0xff00) couvrant toute la table
+                start = struct.unpack_from("<H", pkt, 1)[0]
+                if start <= 0x0001:
+                    entry = struct.pack("<HHH", 0x0001, 0xFFFF, 0xFF00)
+                    sock.send(bytes([0x11, len(entry)]) + entry)
+                else:
+                    sock.send(bytes([0x01, 0x10]) + struct.pack("<H", start) + bytes([0x0A]))
+            elif op == 0x08:
+                start = struct.unpack_from("<H", pkt, 1)[0]
+                if start <= self.write_handle - 1:
+                    entry = struct.pack("<HBH", self.write_handle - 1, 0x0C, self.write_handle) + uuid128
+                    sock.send(bytes([0x09, len(entry)]) + entry)
+                else:
+                    sock.send(bytes([0x01, 0x08]) + struct.pack("<H", start) + bytes([0x0A]))
+            elif op == 0x52:
+                assert struct.unpack_from("<H", pkt, 1)[0] == self.write_handle
+                assert len(pkt) - 3 <= self.mtu - 3
+                self.writes += pkt[3:]
+                if self.read_delay:
+                    time.sleep(self.read_delay)
+
+
+@pytest.fixture()
+def settings_tmp(tmp_path, monkeypatch):
+    import settings_store
+    monkeypatch.setattr(settings_store, "DATA_DIR", str(tmp_path))
+    monkeypatch.setattr(settings_store, "SETTINGS_PATH", str(tmp_path / "settings.json"))
+    settings_store._invalidate_cache()
+    yield settings_store
+    settings_store._invalidate_cache()
+
+
+@pytest.fixture()
+def peer(settings_tmp, tmp_path, monkeypatch):
+    from services import label_cache
+    fake = FakeAttPeer()
+    monkeypatch.setattr(label_cache, "CACHE_DIR", str(tmp_path / "labels"))
+    monkeypatch.setattr(printer, "_ble_connect", fake.connect)
+    monkeypatch.setattr(printer, "_ble_connect_async", fake.connect_async)
+    monkeypatch.setattr(printer, "_WRITE_PACING", 0)
+    monkeypatch.setattr(printer, "_sessions", {})
+    yield fake
+    for sess in printer._sessions.values():
+        sess.close()
+    fake.drop()
+
+
+_MAC = "7C:91:7B:E4:6B:49"
+
+
+# ─────────────────────────────────────────────
+# Session BLE persistante
+# ─────────────────────────────────────────────
+
+class TestBleSession:
+
+    def test_ten_labels_one_connection(self, peer):
+        payloads = [bytes([i]) * 1000 for i in range(10)]
+        for p in payloads:
+            res = printer.print_ble(_MAC, p)
+            assert res["ok"], res
+        assert peer.connections == 1
+        assert peer.requests.count(0x02) == 1              # un seul échange MTU
+        assert peer.wait_bytes(10000) == b"".join(payloads)
+
+    def test_handle_and_mtu_persisted_in_settings(self, peer, settings_tmp):
+        printer.print_ble(_MAC, b"x" * 10)
+        cache = settings_tmp.load_settings()["printer_ble_cache"]
+        assert {k: cache[_MAC][k] for k in ("handle", "uuid", "mtu")} == \
+            {"handle": 0x0006, "uuid": _PHOMEMO_UUID, "mtu": 185}
+
+        # Nouvelle session (redémarrage) : pas de découverte GATT
+        printer._sessions.clear()
+        peer.requests.clear()
+        assert printer.print_ble(_MAC, b"y" * 10)["ok"]
+        assert 0x08 not in peer.requests
+
+    def test_transparent_reconnect(self, peer):
+        assert printer.print_ble(_MAC, b"a" * 400)["ok"]
+        peer.drop()
+        res = printer.print_ble(_MAC, b"b" * 400)
+        assert res["ok"] and res["reused"] is False
+        assert peer.connections == 2
+        assert peer.wait_bytes(800).endswith(b"b" * 400)
+
+    def test_idle_session_is_closed(self, peer):
+        printer.print_ble(_MAC, b"z")
+        sess = printer.get_session(_MAC)
+        assert printer.reap_idle_sessions(now=sess.last_used + 1) == 0
+        assert printer.reap_idle_sessions(now=sess.last_used + printer.BLE_IDLE_TIMEOUT + 1) == 1
+        assert sess.sock is None
+
+
+# ─────────────────────────────────────────────
+# Cache de découverte GATT
+# ─────────────────────────────────────────────
+
+class TestGattCache:
+
+    def test_discover_is_cached_until_forced(self, peer):
+        first = printer.discover_ble(_MAC)
+        assert first["ok"] and first["cached"] is False
+        assert first["services"][0]["characteristics"][0]["known_phomemo"]
+        second = printer.discover_ble(_MAC)
+        assert second["cached"] is True and second["services"] == first["services"]
+        assert second["discovered_at"] == first["discovered_at"]
+        assert peer.connections == 1 and peer.requests.count(0x10) == 1
+
+        forced = printer.discover_ble(_MAC, force=True)
+        assert forced["cached"] is False and peer.connections == 2
+
+    def test_discover_async_waits_for_running_print(self, peer):
+        async def main():
+            assert (await printer.print_ble_async(_MAC, b"a"))["ok"]
+            sess = printer.get_session(_MAC)
+            lock = sess._get_lock()
+            await lock.acquire()                        # impression en cours
+            task = asyncio.create_task(printer.discover_ble_async(_MAC, force=True))
+            await asyncio.sleep(0.05)
+            untouched = sess.sock is not None and not task.done()
+            lock.release()
+            return untouched, await task, sess.sock
+
+        untouched, res, sock = asyncio.run(main())
+        assert untouched
+        assert res["ok"] and res["cached"] is False
+        assert sock is None and peer.connections == 2
+
+    def test_print_uses_discovered_handle(self, peer, settings_tmp):
+        printer.discover_ble(_MAC)
+        entry = settings_tmp.load_settings()["printer_ble_cache"][_MAC]
+        assert entry["handle"] == 0x0006 and entry["services"]
+        peer.requests.clear()
+        assert printer.print_ble(_MAC, b"x" * 10)["ok"]
+        assert 0x08 not in peer.requests                  # pas de parcours ATT à l'impression
+
+    def test_expired_cache_is_rescanned(self, peer, settings_tmp):
+        printer.discover_ble(_MAC)
+        s = settings_tmp.load_settings()
+        s["printer_ble_cache"][_MAC]["discovered_at"] -= printer.GATT_CACHE_MAX_AGE + 1
+        settings_tmp.save_settings(s)
+        assert printer.discover_ble(_MAC)["cached"] is False
+        peer.requests.clear()
+        s = settings_tmp.load_settings()
+        s["printer_ble_cache"][_MAC]["discovered_at"] -= printer.GATT_CACHE_MAX_AGE + 1
+        settings_tmp.save_settings(s)
+        assert printer.print_ble(_MAC, b"y")["ok"]
+        assert 0x08 in peer.requests
+
+    def test_print_rescan_flag(self, peer):
+        assert printer.print_ble(_MAC, b"a")["ok"]
+        peer.requests.clear()
+        res = asyncio.run(printer.print_ble_async(_MAC, b"b", rescan=True))
+        assert res["ok"] and res["reused"] is False
+        assert 0x08 in peer.requests and peer.connections == 2
+        assert printer.get_session(_MAC).rescan is False
+
+
+# ─────────────────────────────────────────────
+# Cache disque des étiquettes (pré-rendu)
+# ─────────────────────────────────────────────
+
+@pytest.fixture()
+def label_cache(tmp_db, settings_tmp, tmp_path, monkeypatch):
+    from services import label_cache as lc
+    monkeypatch.setattr(lc, "CACHE_DIR", str(tmp_path / "labels"))
+    settings_tmp.save_settings({"printer_enabled": True, "printer_prerender": True})
+    return lc
+
+
+def _new_lot(qty=2.0, best_before="2026-12-01"):
+    import db
+    loc = db.add_location("Frigo")
+    pid = db.add_product("Yaourt nature", unit="pot")
+    return db.add_lot(pid, loc, qty, None, best_before), loc
+
+
+class TestLabelCache:
+
+    def test_prerender_then_print_is_transmission_only(self, label_cache, monkeypatch):
+        import os
+        lot_id, _ = _new_lot()
+        label_cache.schedule_prerender([lot_id])
+        label_cache.drain()
+        files = os.listdir(label_cache.CACHE_DIR)
+        assert len(files) == 1 and files[0].startswith(f"{lot_id}-")
+
+        from services.print_queue import load_lots
+        lot = load_lots([lot_id])[lot_id]
+        expected = printer._build_payload(lot)
+        monkeypatch.setattr(printer, "_build_payload", lambda *a, **k: pytest.fail("rendu inattendu"))
+        assert label_cache.payload_for(lot) == expected
+
+    def test_prerender_many_single_query(self, label_cache, monkeypatch):
+        import db
+        ids = [_new_lot(qty=float(i))[0] for i in range(1, 4)]
+        calls = []
+        real = db.get_lots
+        monkeypatch.setattr(db, "get_lots", lambda lot_ids: calls.append(sorted(lot_ids)) or real(lot_ids))
+        monkeypatch.setattr(db, "list_lots", lambda: pytest.fail("scan complet inattendu"))
+        assert label_cache.prerender_many(ids + [999999]) == 3
+        assert calls == [sorted(ids + [999999])]
+        from services.print_queue import load_lots
+        lots = load_lots(ids)
+        assert all(label_cache.get(lots[i]) is not None for i in ids)
+
+    def test_option_off_does_nothing(self, label_cache, settings_tmp):
+        import os
+        settings_tmp.save_settings({"printer_enabled": True, "printer_prerender": False})
+        lot_id, _ = _new_lot()
+        label_cache.schedule_prerender([lot_id])
+        label_cache.drain()
+        assert not os.path.isdir(label_cache.CACHE_DIR) or not os.listdir(label_cache.CACHE_DIR)
+
+    def test_update_changes_hash_and_invalidates(self, label_cache):
+        import db
+        from services.print_queue import load_lots
+        lot_id, loc = _new_lot()
+        assert label_cache.prerender(lot_id)
+        before = label_cache.content_hash(load_lots([lot_id])[lot_id])
+
+        db.update_lot(lot_id, 5.0, loc, None, "2026-12-01")
+        lot = load_lots([lot_id])[lot_id]
+        assert label_cache.content_hash(lot) != before
+        assert label_cache.get(lot) is None                  # jamais de payload périmé
+        assert label_cache.invalidate(lot_id) == 1
+        label_cache.prerender(lot_id)
+        assert label_cache.get(lot) == printer._build_payload(lot)
+
+    def test_size_bounded_lru_eviction(self, label_cache, monkeypatch):
+        import os, time
+        from services.print_queue import load_lots
+        ids = [_new_lot(qty=float(i))[0] for i in range(1, 5)]
+        size = len(printer._build_payload(load_lots([ids[0]])[ids[0]]))
+        monkeypatch.setattr(label_cache, "MAX_BYTES", size * 3 + size // 2)
+
+        def _age(lot_id, seconds):
+            name = next(n for n in os.listdir(label_cache.CACHE_DIR) if n.startswith(f"{lot_id}-"))
+            t = time.time() - seconds
+            os.utime(os.path.join(label_cache.CACHE_DIR, name), (t, t))
+
+        for age, lot_id in zip((30, 20, 10), ids[:3]):
+            label_cache.prerender(lot_id)
+            _age(lot_id, age)
+        # Relire le 1er lot le rend récent : c'est le 2e qui sera évincé
+        assert label_cache.get(load_lots([ids[0]])[ids[0]]) is not None
+        label_cache.prerender(ids[3])
+        cached = {int(n.split("-")[0]) for n in os.listdir(label_cache.CACHE_DIR)}
+        assert cached == {ids[0], ids[2], ids[3]}
+
+
+# ─────────────────────────────────────────────
+# Pilote asyncio
+# ─────────────────────────────────────────────
+
+class TestAsyncDriver:
+
+    def test_concurrent_prints_keep_loop_responsive(self, peer):
+        peer.read_delay = 0.001
+        peer.sndbuf = 4096
+        payloads = [bytes([i]) * 8000 for i in range(3)]
+
+        async def go():
+            ticks = 0
+            prints = asyncio.gather(*(printer.print_ble_async(_MAC, p) for p in payloads))
+            while not prints.done():
+                ticks += 1
+                await asyncio.sleep(0.005)
+            return await prints, ticks
+
+        results, ticks = asyncio.run(go())
+        assert all(r["ok"] for r in results)
+        assert ticks > 5                                  # la boucle n'a pas été bloquée
+        assert peer.connections == 1
+        data = peer.wait_bytes(24000)
+        assert sorted(data[i:i + 8000] for i in range(0, 24000, 8000)) == payloads   # pas d'entrelacement
+
+    def test_connect_timeout(self, peer):
+        peer.connect_delay = 1.0
+        res = asyncio.run(printer.print_ble_async(_MAC, b"x", timeout=0.1))
+        assert res["ok"] is False and res["timeout"] is True
+        assert printer.get_session(_MAC).sock is None
+
+    def test_cancellation_closes_session(self, peer):
+        peer.read_delay = 0.002
+        peer.sndbuf = 4096
+
+        async def go():
+            task = asyncio.create_task(printer.print_ble_async(_MAC, b"z" * 50000))
+            await asyncio.sleep(0.05)
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+
+        asyncio.run(go())
+        sess = printer.get_session(_MAC)
+        assert sess.sock is None and sess.busy is False
+        assert printer.print_ble(_MAC, b"ok")["ok"]       # reconnexion propre ensuite
+        assert peer.connections == 2
+
+
+# ─────────────────────────────────────────────
+# Rythme d'envoi adaptatif
+# ─────────────────────────────────────────────
+
+class TestAdaptivePacing:
+
+    def test_backpressure_slows_down_without_loss(self, peer):
+        peer.read_delay = 0.001
+        peer.sndbuf = 4096
+        payload = bytes(range(256)) * 80                   # ~110 paquets de 182 octets
+        res = printer.print_ble(_MAC, payload)
+        assert res["ok"], res
+        stats = res["stats"]
+        assert stats["eagain"] > 0
+        assert stats["packets"] == -(-len(payload) // 182)
+        assert res["bytes_per_sec"] > 0
+        assert peer.wait_bytes(len(payload)) == payload
+
+    def test_fast_link_drops_delay(self, peer, monkeypatch):
+        monkeypatch.setattr(printer, "_WRITE_PACING", 0.004)
+        res = printer.print_ble(_MAC, b"x" * 182 * 200)
+        assert res["ok"] and res["stats"]["eagain"] == 0
+        assert res["stats"]["pacing_ms"] == 0
+        # Le délai appris est conservé pour l'étiquette suivante
+        assert printer.get_session(_MAC).pacing == 0
+
+    def test_largest_mtu_is_requested(self, peer):
+        peer.mtu = 247
+        res = printer.print_ble(_MAC, b"y" * 1000)
+        assert res["stats"]["packets"] == -(-1000 // 244)
+
+
+# ─────────────────────────────────────────────
+# File d'impression (jobs groupés)
+# ─────────────────────────────────────────────
+
+def _fake_loader(lot_ids):
+    return {i: dict(_LOT, id=i, qty=str(i)) for i in lot_ids if i != 404}
+
+
+class TestPrintQueue:
+
+    @staticmethod
+    def _run(lot_ids, loader=_fake_loader):
+        from services import print_queue
+
+        async def go():
+            job = print_queue.submit(_MAC, lot_ids, loader=loader)
+            assert job["state"] == "queued"
+            return await print_queue.wait(job["id"])
+        return asyncio.run(go())
+
+    def test_batch_streams_over_one_session(self, peer):
+        ids = [1, 2, 3, 4, 5]
+        job = self._run(ids)
+        assert job["state"] == "done"
+        assert (job["total"], job["done"], job["printed"], job["failed"]) == (5, 5, 5, 0)
+        assert peer.connections == 1
+        expected = b"".join(printer._build_payload(_fake_loader([i])[i]) for i in ids)
+        assert peer.wait_bytes(len(expected)) == expected
+
+    def test_missing_lot_is_reported(self, peer):
+        job = self._run([1, 404, 1])
+        assert job["total"] == 2                         # doublon ignoré
+        assert [r["state"] for r in job["results"]] == ["printed", "not_found"]
+
+    def test_printer_off_fails_job(self, peer, monkeypatch):
+        async def _refuse(mac, timeout=35.0):
+            raise OSError("Host is down")
+        monkeypatch.setattr(printer, "_ble_connect_async", _refuse)
+        job = self._run([1, 2, 3])
+        assert job["state"] == "failed"
+        assert [r["state"] for r in job["results"]] == ["error", "skipped", "skipped"]
+        assert (job["total"], job["done"], job["failed"], job["skipped"]) == (3, 3, 1, 2)
+
+    def test_cancel_queued_job(self, peer):
+        from services import print_queue
+        gate = threading.Event()
+
+        def _slow_loader(ids):
+            gate.wait(2)
+            return _fake_loader(ids)
+
+        async def go():
+            first = print_queue.submit(_MAC, [1], loader=_slow_loader)
+            second = print_queue.submit(_MAC, [2], loader=_fake_loader)
+            assert print_queue.cancel(second["id"])
+            gate.set()
+            assert (await print_queue.wait(first["id"]))["state"] == "done"
+            return print_queue.get_job(second["id"])
+
+        second = asyncio.run(go())
+        assert second["state"] == "cancelled" and second["done"] == 0
+
+    def test_lots_from_shopping_commit(self, tmp_db):
+        from services import print_queue
+        from services.events import log_event
+        commit_id = log_event("shopping_committed", {"list_id": 1, "committed": 2, "lot_ids": [7, 9]})
+        other = log_event("shopping", {"msg": "x"})
+        assert print_queue.lots_from_shopping_commit(commit_id) == [7, 9]
+        assert print_queue.lots_from_shopping_commit(other) is None
+        assert print_queue.lots_from_shopping_commit(99999) is None
+
+    def test_route_resolves_commit_off_the_loop(self, monkeypatch):
+        pytest.importorskip("httpx")
+        from fastapi import FastAPI
+        from fastapi.testclient import TestClient
+        from routes import print_route
+        from services import print_queue
+        on_loop = []
+
+        def _lookup(commit_id):
+            try:
+                asyncio.get_running_loop()
+                on_loop.append(True)
+            except RuntimeError:
+                on_loop.append(False)
+            return None
+
+        monkeypatch.setattr(print_queue, "lots_from_shopping_commit", _lookup)
+        monkeypatch.setattr(print_route, "_get_printer_mac", lambda: _MAC)
+        app = FastAPI()
+        app.include_router(print_route.router)
+        r = TestClient(app).post("/api/print/lots", json={"shopping_commit": 42})
+        assert r.status_code == 404 and r.json()["error"] == "not_found"
+        assert on_loop == [False]
@@ -0,0 +1,109 @@
+"""
+test_render_cache.py — Cache de rendu (utils.http.render avec jeton de
+version + ETag) et blocs par produit invalidés via product_generation.
+"""
+import types
+
+import jinja2
+import pytest
+
+import db
+from routes import products
+from utils import http
+
+
+@pytest.fixture()
+def env(monkeypatch):
+    monkeypatch.setattr(http, "_render_cache", http.OrderedDict())
+    return jinja2.Environment(loader=jinja2.DictLoader({
+        "page.html": "{{ SETTINGS.theme }}|{{ BASE }}|{{ items|join(',') }}",
+    }))
+
+
+def _request(etag=None, path="/products"):
+    headers = {"if-none-match": etag} if etag else {}
+    return types.SimpleNamespace(headers=headers, url=types.SimpleNamespace(path=path, query=""))
+
+
+class TestRenderCache:
+
+    def test_build_called_once_per_version(self, env):
+        calls = []
+
+        def build():
+            calls.append(1)
+            return {"items": ["a", "b"]}
+
+        settings = {"theme": "dark"}
+        r1 = http.render(env, "page.html", version="v1", build=build,
+                         SETTINGS=settings, BASE="/", request=_request())
+        r2 = http.render(env, "page.html", version="v1", build=build,
+                         SETTINGS=settings, BASE="/", request=_request())
+        assert r1.body == r2.body == b"dark|/|a,b"
+        assert len(calls) == 1
+        assert r1.headers["cache-control"] == "no-cache"
+
+        http.render(env, "page.html", version="v2", build=build,
+                    SETTINGS=settings, BASE="/", request=_request())
+        http.render(env, "page.html", version="v2", build=build,
+                    SETTINGS={"theme": "light"}, BASE="/", request=_request())
+        assert len(calls) == 3
+
+    def test_etag_revalidation(self, env):
+        kw = dict(version="v1", build=lambda: {"items": []}, SETTINGS={"theme": "auto"}, BASE="/")
+        etag = http.render(env, "page.html", request=_request(), **kw).headers["etag"]
+        assert http.render(env, "page.html", request=_request(etag), **kw).status_code == 304
+
+    def test_etag_changes_with_build(self, env):
+        kw = dict(version="v1", build=lambda: {"items": []}, SETTINGS={"theme": "auto"}, BASE="/")
+        env.globals["BUILD_TOKEN"] = "release-1"
+        etag = http.render(env, "page.html", request=_request(), **kw).headers["etag"]
+        env.globals["BUILD_TOKEN"] = "release-2"           # mise à jour de l'add-on
+        r = http.render(env, "page.html", request=_request(etag), **kw)
+        assert r.status_code == 200 and r.headers["etag"] != etag
+
+    def test_without_version_is_not_cached(self, env):
+        r = http.render(env, "page.html", SETTINGS={"theme": "auto"}, BASE="/", items=["x"])
+        assert "no-store" in r.headers["cache-control"]
+        assert not http._render_cache
+
+
+class TestProductBlocks:
+
+    @pytest.fixture()
+    def stock(self, tmp_db, monkeypatch):
+        monkeypatch.setattr(products, "_product_blocks", {})
+        loc = db.add_location("Frigo")
+        lait, beurre = db.add_product("Lait", "L"), db.add_product("Beurre", "g")
+        return loc, lait, beurre
+
+    def test_generation_bumped_per_product(self, stock):
+        loc, lait, beurre = stock
+        before = db.product_generations()
+        lot = db.add_lot(lait, loc, 2, None, "2030-01-01")
+        db.consume_lot(lot, 1)
+        after = db.product_generations()
+        assert after[lait] > before.get(lait, 0)
+        assert after.get(beurre) == before.get(beurre)
+
+    def test_only_written_product_recomputed(self, stock, monkeypatch):
+        loc, lait, beurre = stock
+        calls = []
+        real = products.list_price_history_for_product
+        monkeypatch.setattr(products, "list_price_history_for_product",
+                            lambda pid, limit=10: calls.append(pid) or real(pid, limit))
+
+        products._product_blocks_for([lait, beurre])
+        products._product_blocks_for([lait, beurre])
+        assert sorted(calls) == sorted([lait, beurre])
+
+        with db._conn() as c:
+            c.execute("INSERT INTO stock_lots(product_id, location_id, qty, price_total) VALUES (?, ?, 1, 2.5)",
+                      (beurre, loc))
+            c.commit()
+        blocks = products._product_blocks_for([lait, beurre])
+        assert calls[2:] == [beurre]
+        assert '"price": 2.5' in blocks[beurre]["price_history_json"]
+
+        products._product_blocks_for([lait])
+        assert (db.DB_PATH, beurre) not in products._product_blocks
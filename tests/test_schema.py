@@ -0,0 +1,143 @@
+"""
+test_schema.py — Migrations versionnées (PRAGMA user_version).
+
+Couvre :
+  - base neuve : toutes les migrations, user_version = SCHEMA_VERSION
+  - base à jour : une seule lecture de PRAGMA user_version au démarrage
+  - base d'avant user_version : rattrapage des colonnes + backfills
+  - index FTS : trigger de suppression de lot ajouté aux bases existantes
+  - EAN de products.barcode recopiés dans product_barcodes (import CSV)
+  - migration en échec : rollback complet, version inchangée
+"""
+import sqlite3
+
+import pytest
+
+import db
+import schema
+
+
+@pytest.fixture()
+def db_file(tmp_path, monkeypatch):
+    path = str(tmp_path / "schema.sqlite3")
+    monkeypatch.setattr(db, "DB_PATH", path)
+    return path
+
+
+def _columns(path, table):
+    with sqlite3.connect(path) as c:
+        return {r[1] for r in c.execute(f"PRAGMA table_info({table})")}
+
+
+def _version(path):
+    with sqlite3.connect(path) as c:
+        return c.execute("PRAGMA user_version").fetchone()[0]
+
+
+class TestMigrations:
+
+    def test_fresh_database(self, db_file):
+        assert schema.migrate() == len(schema.MIGRATIONS)
+        assert _version(db_file) == schema.SCHEMA_VERSION
+        with sqlite3.connect(db_file) as c:
+            tables = {r[0] for r in c.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+            mode = c.execute("PRAGMA journal_mode").fetchone()[0]
+        assert {"products", "stock_lots", "movements", "product_barcodes", "shopping_items",
+                "events", "off_cache"} <= tables
+        assert "committed" in _columns(db_file, "shopping_items")
+        assert mode == "wal"
+
+    def test_up_to_date_costs_single_pragma(self, db_file, monkeypatch):
+        schema.migrate()
+        statements = []
+        real_conn = db._conn
+
+        def traced():
+            c = real_conn()
+            c.set_trace_callback(statements.append)
+            return c
+
+        monkeypatch.setattr(db, "_conn", traced)
+        assert schema.migrate() == 0
+        assert statements == ["PRAGMA user_version"]
+
+    def test_legacy_database_is_caught_up(self, db_file):
+        with sqlite3.connect(db_file) as c:
+            c.executescript("""
+                CREATE TABLE locations(id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT UNIQUE NOT NULL);
+                CREATE TABLE products(id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT UNIQUE NOT NULL,
+                                      unit TEXT DEFAULT 'pièce', default_shelf_life_days INTEGER DEFAULT 90,
+                                      barcode TEXT);
+                CREATE TABLE stock_lots(id INTEGER PRIMARY KEY AUTOINCREMENT, product_id INTEGER NOT NULL,
+                                        location_id INTEGER NOT NULL, qty REAL NOT NULL,
+                                        frozen_on TEXT, best_before TEXT);
+                CREATE TABLE movements(id INTEGER PRIMARY KEY AUTOINCREMENT, lot_id INTEGER NOT NULL,
+                                       type TEXT NOT NULL, qty REAL NOT NULL, ts TEXT NOT NULL, note TEXT);
+                INSERT INTO locations(name) VALUES ('Frigo');
+                INSERT INTO products(name, unit, barcode) VALUES ('Lait', 'L', '3017620422003');
+                INSERT INTO stock_lots(product_id, location_id, qty) VALUES (1, 1, 2.5);
+            """)
+        schema.migrate()
+        assert {"initial_qty", "status", "created_on", "brand"} <= _columns(db_file, "stock_lots")
+        assert {"unit_pivot", "min_qty", "no_expiry"} <= _columns(db_file, "products")
+        with sqlite3.connect(db_file) as c:
+            assert c.execute("SELECT initial_qty, status FROM stock_lots").fetchone() == (2.5, "open")
+            assert c.execute("SELECT unit_pivot FROM products").fetchone() == ("L",)
+            assert c.execute("SELECT product_id, barcode FROM product_barcodes").fetchall() == [
+                (1, "3017620422003")]
+        assert db.find_product_by_barcode("3017620422003")["id"] == 1
+
+    def test_insert_defaults_trigger(self, db_file):
+        schema.migrate()
+        pid = db.add_product("Beurre", unit="g")
+        loc = db.add_location("Frigo")
+        with db._conn() as c:
+            c.execute("INSERT INTO stock_lots(product_id, location_id, qty) VALUES (?,?,?)", (pid, loc, 250))
+            assert c.execute("SELECT unit_pivot FROM products WHERE id=?", (pid,)).fetchone()[0] == "g"
+            assert c.execute("SELECT initial_qty FROM stock_lots").fetchone()[0] == 250
+
+    def test_fts_lot_delete_upgrade(self, db_file, monkeypatch):
+        with monkeypatch.context() as m:                       # base en version 9
+            m.setattr(schema, "MIGRATIONS", schema.MIGRATIONS[:9])
+            m.setattr(schema, "SCHEMA_VERSION", 9)
+            schema.migrate()
+        pid = db.add_product("Chocolat noir")
+        loc = db.add_location("Placard")
+        with db._conn() as c:
+            c.execute("INSERT INTO stock_lots(product_id, location_id, qty, brand) VALUES (?,?,1,?)",
+                      (pid, loc, "Côte d'Or"))
+            c.execute("DELETE FROM stock_lots")
+            c.commit()
+        assert [p["id"] for p in db.search_products("cote")] == [pid]    # marque périmée
+        schema.migrate()
+        assert db.search_products("cote") == []
+        with db._conn() as c:
+            assert c.execute("SELECT 1 FROM sqlite_master WHERE name='products_fts_lot_ad'").fetchone()
+
+    def test_product_barcodes_backfill(self, db_file, monkeypatch):
+        with monkeypatch.context() as m:                       # base en version 10
+            m.setattr(schema, "MIGRATIONS", schema.MIGRATIONS[:10])
+            m.setattr(schema, "SCHEMA_VERSION", 10)
+            schema.migrate()
+        with db._conn() as c:                                  # EAN importé par CSV
+            c.execute("INSERT INTO products(name, barcode) VALUES ('Nutella', '3017620425035')")
+            c.commit()
+        assert db.get_product_barcodes(1) == []
+        schema.migrate()
+        assert [b["barcode"] for b in db.get_product_barcodes(1)] == ["3017620425035"]
+
+    def test_failed_migration_rolls_back(self, db_file, monkeypatch):
+        schema.migrate()
+
+        def boom(c):
+            c.execute("CREATE TABLE half_done(x)")
+            raise RuntimeError("boom")
+
+        nxt = schema.SCHEMA_VERSION + 1
+        monkeypatch.setattr(schema, "MIGRATIONS", schema.MIGRATIONS + [(nxt, "boom", boom)])
+        monkeypatch.setattr(schema, "SCHEMA_VERSION", nxt)
+        with pytest.raises(RuntimeError):
+            schema.migrate()
+        assert _version(db_file) == nxt - 1
+        with sqlite3.connect(db_file) as c:
+            assert c.execute("SELECT name FROM sqlite_master WHERE name='half_done'").fetchone() is None
@@ -0,0 +1,128 @@
+"""
+test_shopping.py — Actions article de la liste de courses : réponse
+partielle JSON (article + compteurs) si le client l'accepte, sinon
+redirect 303 vers /shopping ; après « En stock », proposition d'imprimer
+les étiquettes du commit si l'imprimante est configurée.
+"""
+import datetime
+
+import pytest
+
+httpx = pytest.importorskip("httpx")
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import db
+from routes import shopping
+from utils import assets, http, jinja
+
+JSON = {"accept": "application/json"}
+
+
+@pytest.fixture()
+def client(tmp_db, monkeypatch):
+    monkeypatch.setattr(shopping, "DB_PATH", tmp_db)
+    monkeypatch.chdir(assets.BASE_DIR)     # FileSystemLoader("templates")
+    app = FastAPI()
+    app.include_router(shopping.router)
+    app.state.templates = jinja.build_jinja_env(None)
+    return TestClient(app)
+
+
+@pytest.fixture()
+def items(client):
+    """Liste par défaut avec deux articles (Lait, Beurre) ; retourne (list_id, [item_id…])."""
+    lait, beurre = db.add_product("Lait", "L"), db.add_product("Beurre", "g")
+    conn = shopping.get_db()
+    try:
+        list_id = shopping.ensure_default_list(conn)
+    finally:
+        conn.close()
+    for pid in (lait, beurre):
+        r = client.post("/shopping/item/add", data={"list_id": list_id, "product_id": pid, "qty": 2},
+                        follow_redirects=False)
+        assert r.status_code == 303
+    conn = shopping.get_db()
+    try:
+        ids = [it["id"] for it in shopping.fetch_items(conn, list_id)]
+    finally:
+        conn.close()
+    return list_id, ids
+
+
+class TestPartialResponses:
+
+    def test_toggle_json_payload(self, client, items):
+        list_id, (lait, beurre) = items
+        r = client.post("/shopping/item/toggle", data={"item_id": lait, "list_id": list_id}, headers=JSON)
+        assert r.status_code == 200
+        assert r.headers["cache-control"] == "no-store"
+        body = r.json()
+        assert body["ok"] and body["toast"] == "toggled" and body["item_id"] == lait
+        assert body["item"]["is_checked"] == 1 and body["item"]["product_name"] == "Lait"
+        assert f'id="sh-item-{lait}"' in body["html"]
+        assert "ticket_html" in body                    # acheté aujourd'hui
+        assert body["counters"] == {"total": 2, "done": 1, "to_buy": 1, "to_commit": 1,
+                                    "anomalies": 0, "total_delta": 0.0}
+
+    def test_redirect_without_json_accept(self, client, items):
+        list_id, (lait, _) = items
+        r = client.post("/shopping/item/toggle", data={"item_id": lait, "list_id": list_id},
+                        follow_redirects=False)
+        assert r.status_code == 303
+        assert r.headers["location"] == f"/shopping?list={list_id}&toast=toggled"
+
+    def test_mark_bought_and_ticket_counters(self, client, items):
+        list_id, (lait, _) = items
+        client.post("/shopping/item/mark_bought", headers=JSON, data={
+            "item_id": lait, "list_id": list_id, "store": "Marché",
+            "qty_bought": 2, "shelf_unit_price": 1.2, "best_before": "",
+        })
+        body = client.post("/shopping/item/ticket_price", headers=JSON, data={
+            "item_id": lait, "list_id": list_id, "ticket_unit_price": 1.5,
+        }).json()
+        assert body["toast"] == "ticket_ok"
+        assert body["item"]["store"] == "Marché"
+        assert body["counters"]["anomalies"] == 1
+        assert body["counters"]["total_delta"] == pytest.approx(0.3)
+
+    def test_delete_json_payload(self, client, items):
+        list_id, (lait, _) = items
+        body = client.post("/shopping/item/delete", data={"item_id": lait, "list_id": list_id},
+                           headers=JSON).json()
+        assert body["deleted"] is True and "html" not in body
+        assert body["counters"]["total"] == 1
+
+    def test_unknown_item(self, client, items):
+        list_id, _ = items
+        data = {"item_id": 999999, "list_id": list_id}
+        r = client.post("/shopping/item/toggle", data=data, headers=JSON)
+        assert r.status_code == 404 and r.json() == {"ok": False, "toast": "error", "item_id": 999999}
+        r = client.post("/shopping/item/toggle", data=data, follow_redirects=False)
+        assert r.status_code == 303 and r.headers["location"].endswith("toast=error")
+
+    def test_counters_match_page_logic(self, client, items):
+        list_id, (lait, beurre) = items
+        today = datetime.datetime.utcnow().isoformat()
+        conn = shopping.get_db()
+        try:
+            conn.execute("UPDATE shopping_items SET is_checked=1, committed=1, purchased_at=? WHERE id=?",
+                         (today, beurre))
+            conn.commit()
+            counters = shopping.fetch_counters(conn, list_id)
+        finally:
+            conn.close()
+        assert counters["done"] == 1 and counters["to_commit"] == 0 and counters["to_buy"] == 1
+
+
+class TestCommitPrintOffer:
+
+    @pytest.mark.parametrize("printer,shown", [({"printer_enabled": True, "printer_mac": "AA:BB"}, True),
+                                               ({"printer_enabled": False}, False)])
+    def test_print_offer_only_with_printer(self, client, items, monkeypatch, printer, shown):
+        monkeypatch.setattr(http, "load_settings", lambda: dict(printer))
+        list_id, _ = items
+        r = client.get(f"/shopping?list={list_id}&toast=committed&committed=2&commit=7")
+        assert r.status_code == 200
+        assert ('id="sh-print-commit"' in r.text) is shown
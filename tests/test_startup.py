@@ -0,0 +1,99 @@
+"""
+test_startup.py — Coût du démarrage de l'application.
+
+- `import main` ne doit pas dépasser IMPORT_BUDGET_MS (mesuré avec
+  `python -X importtime`, dans un interpréteur neuf).
+- Les modules rarement utilisés (imprimante, admin DB, debug,
+  export/import) ne sont importés qu'à la première requête.
+- Le schéma est créé par le hook de démarrage (init_schema), pas à l'import.
+
+Chaque test lance un sous-processus : sys.modules du processus pytest
+contient déjà la plupart des modules de l'app.
+"""
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+APP_DIR = os.path.join(os.path.dirname(__file__), "..", "domovra_dev", "app")
+
+# Mesuré ~550 ms (dont ~300 ms pour fastapi) : marge pour les machines lentes / CI
+IMPORT_BUDGET_MS = 1500
+
+LAZY_MODULES = [
+    "routes.admin_db",
+    "routes.debug",
+    "routes.export_import",
+    "routes.print_route",
+    "services.printer",
+    "ctypes",
+    "PIL",
+]
+
+
+def _run(code, tmp_path, *args):
+    env = dict(os.environ, DB_PATH=str(tmp_path / "startup.sqlite3"))
+    return subprocess.run(
+        [sys.executable, *args, "-c", code],
+        cwd=APP_DIR, env=env, capture_output=True, text=True, timeout=60,
+    )
+
+
+def _cumulative_us(stderr, module):
+    """Temps cumulé (µs) d'un module dans la sortie de -X importtime."""
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        parts = [p.strip() for p in line[len("import time:"):].split("|")]
+        if len(parts) == 3 and parts[2] == module:
+            return int(parts[1])
+    return None
+
+
+class TestStartup:
+
+    def test_import_time_budget(self, tmp_path):
+        proc = _run("import main", tmp_path, "-X", "importtime")
+        assert proc.returncode == 0, proc.stderr[-2000:]
+        us = _cumulative_us(proc.stderr, "main")
+        assert us is not None
+        assert us / 1000 < IMPORT_BUDGET_MS, f"import main : {us / 1000:.0f} ms"
+
+    def test_rarely_used_modules_not_imported(self, tmp_path):
+        code = (
+            "import json, sys, main\n"
+            f"print(json.dumps([m for m in {LAZY_MODULES!r} if m in sys.modules]))"
+        )
+        proc = _run(code, tmp_path)
+        assert proc.returncode == 0, proc.stderr[-2000:]
+        assert json.loads(proc.stdout.strip().splitlines()[-1]) == []
+
+    def test_import_does_not_touch_db(self, tmp_path):
+        proc = _run("import main", tmp_path)
+        assert proc.returncode == 0, proc.stderr[-2000:]
+        assert not (tmp_path / "startup.sqlite3").exists()
+
+    def test_lazy_router_loads_on_first_request(self, tmp_path):
+        pytest.importorskip("httpx")
+        code = (
+            "import json, sys\n"
+            "from fastapi.testclient import TestClient\n"
+            "import main\n"
+            "with TestClient(main.app) as c:\n"
+            "    before = 'routes.print_route' in sys.modules\n"
+            "    r1 = c.get('/api/print/jobs')\n"
+            "    r2 = c.get('/api/print/jobs')\n"
+            "    loaded = 'routes.print_route' in sys.modules\n"
+            "    debug = 'routes.debug' in sys.modules\n"
+            "print(json.dumps([before, r1.status_code, r2.status_code, loaded, debug]))"
+        )
+        proc = _run(code, tmp_path)
+        assert proc.returncode == 0, proc.stderr[-2000:]
+        assert json.loads(proc.stdout.strip().splitlines()[-1]) == [False, 200, 200, True, False]
+        # Le hook de démarrage a créé le schéma (y compris listes de courses)
+        import sqlite3
+        with sqlite3.connect(tmp_path / "startup.sqlite3") as c:
+            tables = {r[0] for r in c.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+        assert {"products", "stock_lots", "shopping_lists", "shopping_items", "events"} <= tables
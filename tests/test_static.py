@@ -0,0 +1,58 @@
+"""
+test_static.py — Assets hachés servis en cache « immutable », autres
+fichiers statiques revalidés ; cache bytecode Jinja persistant.
+"""
+import os
+
+import pytest
+
+httpx = pytest.importorskip("httpx")
+
+from starlette.applications import Starlette
+from starlette.testclient import TestClient
+
+from utils import assets, jinja
+from utils.static_files import IMMUTABLE, CachedStaticFiles
+
+
+@pytest.fixture()
+def client(tmp_path):
+    (tmp_path / "app-0123456789.js").write_text("console.log(1)")
+    (tmp_path / "plain.js").write_text("console.log(2)")
+    app = Starlette()
+    app.mount("/static", CachedStaticFiles(directory=str(tmp_path)), name="static")
+    return TestClient(app)
+
+
+class TestStaticCache:
+
+    def test_hashed_asset_is_immutable(self, client):
+        r = client.get("/static/app-0123456789.js")
+        assert r.status_code == 200
+        assert r.headers["cache-control"] == IMMUTABLE
+
+    def test_plain_asset_revalidates(self, client):
+        r = client.get("/static/plain.js")
+        assert r.headers["cache-control"] == "no-cache"
+        r2 = client.get("/static/plain.js", headers={"if-none-match": r.headers["etag"]})
+        assert r2.status_code == 304
+
+    def test_js_assets_are_hashed(self):
+        paths = assets.hashed_assets()
+        for src in ("static/js/autocomplete.js", "static/js/locations.js"):
+            assert assets.is_hashed_asset(paths[src])
+            assert os.path.isfile(assets._abs_path(paths[src]))
+
+
+class TestBytecodeCache:
+
+    def test_compiled_templates_persisted(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(assets.BASE_DIR)     # FileSystemLoader("templates")
+        env = jinja.build_jinja_env(str(tmp_path / "bc"))
+        env.get_template("base.html")
+        assert os.listdir(tmp_path / "bc")
+
+    def test_unwritable_dir_disables_cache(self, tmp_path):
+        blocker = tmp_path / "file"
+        blocker.write_text("")
+        assert jinja._bytecode_cache(str(blocker / "bc")) is None